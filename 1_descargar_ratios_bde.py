@@ -4,18 +4,70 @@ Script para descargar automáticamente todos los archivos Excel de ratios sector
 del Banco de España (https://app.bde.es/rss_www/Ratios)
 """
 
+import argparse
+import asyncio
+import ctypes
+import ctypes.util
+import json
 import time
 import os
+import select
+import shutil
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from functools import partial
+from html.parser import HTMLParser
+from urllib.parse import urljoin
+import requests
+from requests.adapters import HTTPAdapter
 from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import Select, WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import (TimeoutException, NoSuchElementException,
+                                        StaleElementReferenceException, WebDriverException)
 
-def configurar_navegador(directorio_descarga):
-    """Configura el navegador Chrome con opciones de descarga"""
+from almacen_descargas import NOMBRE_INDICE, AlmacenDescargas, calcular_sha256, nombre_publicado
+from barrido_descargas import PETICIONES_POR_MINUTO, Barrido, LimitadorPeticiones, clave_trabajo
+from catalogo_sectores import EJES_FORMULARIO, TTL_HORAS, CatalogoSectores, cargar_mapa_cnae
+from run_metrics import PROFILE_MODES, metrics, metrics_report
+from sufijos_ejes import DIMENSION_POR_DEFECTO, PAIS_POR_DEFECTO, etiquetar_archivo
+
+try:
+    from playwright.async_api import async_playwright
+except ImportError:  # Solo hace falta con --motor playwright
+    async_playwright = None
+
+URL_RATIOS = "https://app.bde.es/rss_www/Ratios"
+
+# Límite de sesiones simultáneas para no sobrecargar el servidor del BdE
+MAX_WORKERS_CORTESIA = 4
+
+# Pausa (segundos) entre descargas consecutivas de una misma sesión
+PAUSA_ENTRE_DESCARGAS = 2
+
+# Recursos que no hacen falta para rellenar el formulario. Las hojas de estilo
+# sí se cargan: el aviso "Datos no disponibles" se detecta por su visibilidad
+RECURSOS_BLOQUEADOS = ["*.png", "*.jpg", "*.jpeg", "*.gif", "*.svg", "*.ico", "*.webp",
+                       "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot", "*.mp4"]
+TIPOS_RECURSO_BLOQUEADOS = {"image", "font", "media"}
+
+# Cookies de la sesión registrada que se reutilizan entre ejecuciones
+NOMBRE_SESION = ".sesion_navegador.json"
+
+def configurar_navegador(directorio_descarga, headless=True, bloquear_recursos=True):
+    """
+    Configura el navegador Chrome con opciones de descarga.
+    
+    Por defecto sin ventana (headless), sin imágenes ni fuentes y con la
+    estrategia de carga "eager" (driver.get vuelve con el DOM listo, sin
+    esperar a los subrecursos).
+    """
     chrome_options = Options()
+    chrome_options.page_load_strategy = "eager"
     
     # Configurar directorio de descarga
     prefs = {
@@ -24,14 +76,70 @@ def configurar_navegador(directorio_descarga):
         "download.directory_upgrade": True,
         "safebrowsing.enabled": True
     }
+    if bloquear_recursos:
+        prefs["profile.managed_default_content_settings.images"] = 2
     chrome_options.add_experimental_option("prefs", prefs)
     
-    # Opcional: ejecutar en modo headless (sin ventana visible)
-    # chrome_options.add_argument("--headless")
+    if headless:
+        for argumento in ("--headless=new", "--disable-gpu", "--window-size=1280,1024",
+                          "--disable-dev-shm-usage", "--disable-extensions"):
+            chrome_options.add_argument(argumento)
     
     driver = webdriver.Chrome(options=chrome_options)
+    if headless:
+        # Sin ventana, Chrome solo descarga si se le permite explícitamente
+        driver.execute_cdp_cmd("Page.setDownloadBehavior",
+                               {"behavior": "allow", "downloadPath": directorio_descarga})
+    if bloquear_recursos:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": RECURSOS_BLOQUEADOS})
     return driver
 
+def sesion_registrada(driver):
+    """True si la página muestra el formulario de consulta sin pedir antes el registro"""
+    for id_campo in ("entidad", "objetivo"):
+        campos = driver.find_elements(By.ID, id_campo)
+        if (campos and campos[0].is_displayed()
+                and not Select(campos[0]).first_selected_option.get_attribute("value")):
+            return False
+    return bool(select_listo("sector")(driver))
+
+def guardar_sesion(driver, ruta, url):
+    """Guarda las cookies de la sesión registrada para la siguiente ejecución"""
+    datos = {'url': url, 'guardada': datetime.now().isoformat(timespec='seconds'),
+             'cookies': driver.get_cookies()}
+    temporal = ruta + ".tmp"
+    with open(temporal, "w", encoding="utf-8") as f:
+        json.dump(datos, f, ensure_ascii=False, indent=2)
+    os.replace(temporal, ruta)
+
+def restaurar_sesion(driver, url, ruta):
+    """
+    Carga las cookies guardadas en `ruta` y comprueba que la sesión sigue registrada.
+    
+    Returns:
+        True si la página ya muestra el formulario de consulta; False si no
+        hay sesión guardada o el servidor la ha descartado
+    """
+    if not os.path.exists(ruta):
+        return False
+    try:
+        with open(ruta, encoding="utf-8") as f:
+            datos = json.load(f)
+    except (OSError, ValueError):
+        return False
+    if datos.get('url') != url:
+        return False
+    
+    driver.get(url)  # Las cookies solo se pueden fijar estando en su dominio
+    for cookie in datos.get('cookies', []):
+        try:
+            driver.add_cookie(cookie)
+        except WebDriverException:
+            pass
+    driver.get(url)
+    return sesion_registrada(driver)
+
 def rellenar_formulario_registro(driver):
     """Rellena el formulario inicial de registro"""
     try:
@@ -50,7 +158,9 @@ def rellenar_formulario_registro(driver):
         pais.select_by_visible_text("España")
         
         print("✓ Formulario de registro rellenado")
-        time.sleep(1)
+        
+        # Esperar a que el formulario de consulta esté disponible
+        wait.until(select_listo("sector"))
         
     except Exception as e:
         print(f"⚠ Error al rellenar formulario de registro: {e}")
@@ -76,30 +186,228 @@ def obtener_sectores(driver):
         print(f"✗ Error al obtener sectores: {e}")
         return []
 
-def descargar_excel_sector(driver, sector_value, sector_text, directorio_base):
-    """Descarga el archivo Excel para un sector específico"""
+def opciones_formulario(driver):
+    """Opciones de los desplegables de ejercicio, tamaño y país ({id: [{'value', 'text'}]})"""
+    opciones = {}
+    for id_select in EJES_FORMULARIO:
+        elementos = driver.find_elements(By.ID, id_select)
+        if elementos:
+            opciones[id_select] = [{'value': o.get_attribute("value"), 'text': o.text.strip()}
+                                   for o in Select(elementos[0]).options if o.get_attribute("value")]
+    return opciones
+
+def seleccionar_si_cambia(desplegable, valor, por_texto=False):
+    """
+    Elige una opción solo si no es ya la seleccionada: en un barrido ordenado
+    la mayoría de desplegables no cambian entre un trabajo y el siguiente.
+    """
+    actual = desplegable.first_selected_option
+    if (actual.text.strip() if por_texto else actual.get_attribute("value")) == valor:
+        return False
+    if por_texto:
+        desplegable.select_by_visible_text(valor)
+    else:
+        desplegable.select_by_value(valor)
+    metrics.count("formulario.cambios")
+    return True
+
+# ---------------------------------------------------------------------------
+# Detección de descargas terminadas
+# ---------------------------------------------------------------------------
+
+EXTENSIONES_TEMPORALES = ('.crdownload', '.tmp', '.part')
+
+# Eventos de inotify (ver <sys/inotify.h>)
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+
+def _cargar_inotify():
+    """Devuelve la libc con inotify si el sistema lo soporta, o None"""
+    if not sys.platform.startswith("linux"):
+        return None
     try:
-        wait = WebDriverWait(driver, 10)
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+        return libc
+    except (OSError, AttributeError):
+        return None
+
+_LIBC_INOTIFY = _cargar_inotify()
+
+class VigilanteDescargas:
+    """
+    Detecta el primer fichero completo que aparece en un directorio.
+    
+    En Linux se bloquea sobre inotify y despierta en cuanto Chrome renombra el
+    .crdownload; en el resto de sistemas sondea el directorio cada `intervalo`
+    segundos. La instantánea de ficheros se toma al crear el vigilante, así
+    que debe crearse antes de pulsar el botón de descarga.
+    
+    Chrome crea el fichero con su nombre final (vacío) junto al .crdownload,
+    así que un fichero solo se da por completo cuando no queda ningún temporal
+    nuevo en el directorio y su tamaño es mayor que cero y no ha cambiado en
+    dos comprobaciones separadas al menos `intervalo` segundos.
+    """
+    
+    def __init__(self, directorio, intervalo=0.2):
+        self.directorio = directorio
+        self.intervalo = intervalo
+        self.archivos_antes = set(os.listdir(directorio))
+        self._tamanos = {}
+        self._fd = None
         
-        # Seleccionar sector
-        select_sector = Select(wait.until(EC.presence_of_element_located((By.ID, "sector"))))
-        select_sector.select_by_value(sector_value)
-        time.sleep(0.5)
+        if _LIBC_INOTIFY is not None:
+            fd = _LIBC_INOTIFY.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                mascara = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+                if _LIBC_INOTIFY.inotify_add_watch(fd, os.fsencode(directorio), mascara) >= 0:
+                    self._fd = fd
+                else:
+                    os.close(fd)
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.cerrar()
+    
+    def cerrar(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+    
+    def nuevos(self):
+        """Ficheros nuevos desde la creación del vigilante (incluidos temporales)"""
+        return set(os.listdir(self.directorio)) - self.archivos_antes
+    
+    def completado(self):
+        """Nombre del primer fichero nuevo ya completo, o None"""
+        nuevos = self.nuevos()
+        if any(f.endswith(EXTENSIONES_TEMPORALES) for f in nuevos):
+            self._tamanos.clear()
+            return None
+        ahora = time.monotonic()
+        tamanos = {}
+        for nombre in sorted(nuevos):
+            try:
+                tamano = os.path.getsize(os.path.join(self.directorio, nombre))
+            except OSError:
+                continue
+            # (tamaño, desde cuándo se observa ese tamaño)
+            anterior = self._tamanos.get(nombre)
+            tamanos[nombre] = anterior if anterior is not None and anterior[0] == tamano else (tamano, ahora)
+        self._tamanos = tamanos
+        estables = [f for f, (tamano, desde) in tamanos.items()
+                    if tamano > 0 and ahora - desde >= self.intervalo]
+        return estables[0] if estables else None
+    
+    def esperar(self, timeout):
+        """Espera hasta `timeout` segundos a que haya un fichero completo; devuelve su nombre o None"""
+        limite = time.monotonic() + timeout
+        while True:
+            nombre = self.completado()
+            if nombre:
+                return nombre
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                return None
+            # Con un fichero candidato hay que volver a mirar su tamaño aunque no lleguen eventos
+            espera = min(self.intervalo, restante) if self._tamanos else restante
+            if self._fd is not None:
+                listos, _, _ = select.select([self._fd], [], [], espera)
+                if listos:
+                    try:
+                        os.read(self._fd, 64 * 1024)  # Vaciar la cola de eventos
+                    except BlockingIOError:
+                        pass
+            else:
+                time.sleep(min(self.intervalo, restante))
+
+def select_listo(id_elemento):
+    """Condición de espera: desplegable presente, habilitado y con opciones cargadas"""
+    def condicion(driver):
+        elementos = driver.find_elements(By.ID, id_elemento)
+        if not elementos or not elementos[0].is_enabled():
+            return False
+        desplegable = Select(elementos[0])
+        return desplegable if desplegable.options else False
+    return condicion
+
+def popup_sin_datos(driver):
+    """Botón 'Aceptar' del aviso de datos no disponibles si está visible, o None"""
+    for boton in driver.find_elements(By.XPATH, "//input[@value='Aceptar']"):
+        if boton.is_displayed() and boton.is_enabled():
+            return boton
+    return None
+
+def esperar_resultado_descarga(driver, vigilante, max_espera, intervalo_popup=0.25):
+    """
+    Espera a que termine la descarga o aparezca el aviso de datos no disponibles.
+    
+    Mientras la descarga no ha empezado se comprueba el popup cada
+    `intervalo_popup` segundos; en cuanto aparece el .crdownload solo se espera
+    al evento de fichero completo.
+    
+    Returns:
+        ('descargado', nombre), ('sin_datos', boton_aceptar) o ('timeout', None)
+    """
+    limite = time.monotonic() + max_espera
+    while True:
+        restante = limite - time.monotonic()
+        if restante <= 0:
+            return 'timeout', None
         
-        # El ejercicio ya viene seleccionado por defecto con el más reciente
-        # Esperamos a que el elemento esté presente para asegurar que la página cargó
-        wait.until(EC.presence_of_element_located((By.ID, "ejercicio")))
-        time.sleep(0.5)
+        if not vigilante.nuevos():
+            with metrics.timer("navegador.comprobacion_popup"):
+                boton = popup_sin_datos(driver)
+            if boton is not None:
+                return 'sin_datos', boton
+            nombre = vigilante.esperar(min(intervalo_popup, restante))
+        else:
+            nombre = vigilante.esperar(restante)
         
-        # Seleccionar tamaño (Menos de 50 millones)
-        select_dimension = Select(wait.until(EC.presence_of_element_located((By.ID, "dimension"))))
-        select_dimension.select_by_value("1")  # Value "1" is "Menos de 50 millones"
-        time.sleep(0.5)
+        if nombre:
+            return 'descargado', nombre
+
+def descargar_excel_sector(driver, sector_value, sector_text, directorio_base, max_espera=30,
+                           ejercicio=None, dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+    """
+    Descarga el archivo Excel para un sector específico.
+    
+    Solo se tocan los desplegables cuyo valor cambia respecto a la consulta
+    anterior. Con un tamaño o país distintos de los de por defecto el archivo
+    se renombra al terminar con su sufijo (ver sufijos_ejes.etiquetar_archivo).
+    
+    Args:
+        ejercicio: Ejercicio a consultar (None = el seleccionado por defecto, el más reciente)
+        dimension: Valor del desplegable de tamaño
+        pais: Texto del desplegable de país
+    
+    Returns:
+        Nombre del archivo descargado, None si no hay datos para el sector
+        o False si la descarga falló
+    """
+    try:
+        # Los desplegables pueden recargarse al cambiar el sector
+        wait = WebDriverWait(driver, 10, ignored_exceptions=[StaleElementReferenceException])
         
-        # Seleccionar país España
-        select_pais = Select(wait.until(EC.presence_of_element_located((By.ID, "pais"))))
-        select_pais.select_by_visible_text("España")
-        time.sleep(0.5)
+        with metrics.timer("navegador.formulario"):
+            # Seleccionar sector
+            seleccionar_si_cambia(wait.until(select_listo("sector")), sector_value)
+            
+            # Sin ejercicio se deja el seleccionado por defecto (el más reciente);
+            # esperamos a que tenga opciones para asegurar que la página cargó
+            select_ejercicio = wait.until(select_listo("ejercicio"))
+            if ejercicio:
+                seleccionar_si_cambia(select_ejercicio, ejercicio)
+            
+            # Tamaño (por defecto "1", Menos de 50 millones) y país (España)
+            seleccionar_si_cambia(wait.until(select_listo("dimension")), dimension)
+            seleccionar_si_cambia(wait.until(select_listo("pais")), pais, por_texto=True)
         
         # Buscar y hacer clic en el botón de descarga Excel
         # El botón es un input type="button" con value="Consultar en EXCEL"
@@ -108,44 +416,27 @@ def descargar_excel_sector(driver, sector_value, sector_text, directorio_base):
                 (By.XPATH, "//input[@value='Consultar en EXCEL']")
             ))
             
-            # Contar archivos antes de la descarga
-            archivos_antes = set(os.listdir(directorio_base))
-            
-            boton_excel.click()
-            print(f"  → Descargando: {sector_text}")
+            # Tomar la instantánea del directorio antes de la descarga
+            with VigilanteDescargas(directorio_base) as vigilante:
+                boton_excel.click()
+                print(f"  → Descargando: {sector_text}")
+                
+                # Esperar al fichero completo o al popup de "Datos no disponibles"
+                with metrics.timer("navegador.espera_descarga"):
+                    estado, detalle = esperar_resultado_descarga(driver, vigilante, max_espera)
+            metrics.count(f"navegador.resultado.{estado}")
             
-            # Verificar si aparece el popup de "Datos no disponibles"
-            try:
-                # Esperar brevemente a que aparezca el botón Aceptar
-                boton_aceptar = WebDriverWait(driver, 3).until(
-                    EC.element_to_be_clickable((By.XPATH, "//input[@value='Aceptar']"))
-                )
-                boton_aceptar.click()
+            if estado == 'sin_datos':
+                detalle.click()
                 print(f"  ⚠ Datos no disponibles para {sector_text} (Popup aceptado)")
-                return False
-            except TimeoutException:
-                # No apareció el popup, continuar esperando la descarga
-                pass
-            
-            # Esperar a que el archivo se descargue
-            tiempo_espera = 0
-            max_espera = 30  # 30 segundos máximo
-            
-            while tiempo_espera < max_espera:
-                time.sleep(1)
-                archivos_despues = set(os.listdir(directorio_base))
-                nuevos_archivos = archivos_despues - archivos_antes
-                
-                # Verificar si hay un archivo nuevo que no sea temporal (.crdownload, .tmp)
-                archivos_completos = [f for f in nuevos_archivos 
-                                     if not f.endswith(('.crdownload', '.tmp', '.part'))]
-                
-                if archivos_completos:
-                    archivo_descargado = archivos_completos[0]
-                    print(f"  ✓ Descargado: {archivo_descargado}")
-                    return True
-                
-                tiempo_espera += 1
+                return None
+            
+            if estado == 'descargado':
+                nombre = etiquetar_archivo(detalle, dimension, pais)
+                if nombre != detalle:
+                    os.replace(os.path.join(directorio_base, detalle), os.path.join(directorio_base, nombre))
+                print(f"  ✓ Descargado: {nombre}")
+                return nombre
             
             print(f"  ⚠ Timeout esperando descarga para {sector_text}")
             driver.save_screenshot(f"debug_timeout_{sector_value}.png")
@@ -161,67 +452,1175 @@ def descargar_excel_sector(driver, sector_value, sector_text, directorio_base):
         driver.save_screenshot(f"debug_error_{sector_value}.png")
         return False
 
-def main():
-    """Función principal"""
+# ---------------------------------------------------------------------------
+# Motor HTTP sin navegador
+# ---------------------------------------------------------------------------
+
+# Opciones que se eligen en cada desplegable, igual que en el camino Selenium.
+# Cada entrada es (criterio, valor): 'index', 'value' o 'text'.
+SELECCION_FORMULARIO = {
+    "entidad": ("index", 1),
+    "objetivo": ("index", 1),
+    "paisRegistro": ("text", "España"),
+    "dimension": ("value", DIMENSION_POR_DEFECTO),
+    "pais": ("text", PAIS_POR_DEFECTO),
+}
+
+# Desplegables del registro inicial (tipo de entidad, objetivo y país)
+CAMPOS_REGISTRO = ("entidad", "objetivo", "paisRegistro")
+
+TEXTO_BOTON_EXCEL = "Consultar en EXCEL"
+TEXTO_SIN_DATOS = "Datos no disponibles"
+
+class RespuestaInesperadaError(Exception):
+    """La respuesta del servidor no es ni un Excel ni el aviso de datos no disponibles"""
+
+class _ParserFormulario(HTMLParser):
+    """Extrae de la página los formularios con sus desplegables y campos ocultos"""
+    
+    def __init__(self):
+        super().__init__()
+        self.formularios = []
+        self._formulario = None
+        self._select = None
+        self._opcion = None
+    
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == "form":
+            self._formulario = {
+                "action": attrs.get("action", ""),
+                "method": (attrs.get("method") or "get").lower(),
+                "campos": {},
+                "selects": {},
+            }
+            self.formularios.append(self._formulario)
+        elif self._formulario is None:
+            return
+        elif tag == "select":
+            id_select = attrs.get("id") or attrs.get("name")
+            self._select = {"name": attrs.get("name") or id_select, "opciones": []}
+            self._formulario["selects"][id_select] = self._select
+        elif tag == "option" and self._select is not None:
+            self._opcion = {
+                "value": attrs.get("value", ""),
+                "text": "",
+                "selected": "selected" in attrs,
+            }
+            self._select["opciones"].append(self._opcion)
+        elif tag == "input" and attrs.get("name"):
+            tipo = (attrs.get("type") or "text").lower()
+            if tipo == "hidden" or attrs.get("value") == TEXTO_BOTON_EXCEL:
+                self._formulario["campos"][attrs["name"]] = attrs.get("value", "")
+    
+    def handle_endtag(self, tag):
+        if tag == "form":
+            self._formulario = None
+        elif tag == "select":
+            self._select = None
+            self._opcion = None
+        elif tag == "option":
+            self._opcion = None
+    
+    def handle_data(self, data):
+        if self._opcion is not None:
+            self._opcion["text"] += data
+    
+    def formulario_con(self, id_select):
+        """Devuelve el primer formulario que contiene el desplegable indicado, o None"""
+        for formulario in self.formularios:
+            if id_select in formulario["selects"]:
+                return formulario
+        return None
+    
+    def formulario_sectores(self):
+        """Devuelve el formulario que contiene el desplegable #sector"""
+        return self.formulario_con("sector")
+
+class MotorHTTP:
+    """
+    Descarga los Excel repitiendo el envío del formulario sobre una sesión HTTP
+    persistente (keep-alive), sin abrir un navegador.
+    
+    Al iniciar se carga la página, se envía el formulario de registro (tipo de
+    entidad, objetivo y país) y se comprueba que la sesión tiene su cookie; la
+    plantilla del formulario de consulta se prepara una sola vez y cada
+    descarga solo cambia el campo `sector` (y el ejercicio, tamaño y país si el
+    barrido los recorre).
+    """
+    
+    def __init__(self, url=URL_RATIOS, tam_pool=MAX_WORKERS_CORTESIA, timeout=30):
+        self.url = url
+        self.timeout = timeout
+        self.sesion = requests.Session()
+        adaptador = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, tam_pool))
+        self.sesion.mount("http://", adaptador)
+        self.sesion.mount("https://", adaptador)
+        self.action = None
+        self.method = "post"
+        self.campos = {}
+        self.nombre_campo_sector = "sector"
+        self.opciones_sector = []
+        self.selects = {}
+        self.ejercicio = None
+    
+    def iniciar(self):
+        """
+        Carga la página, registra la sesión y prepara la plantilla del formulario.
+        
+        Lanza RespuestaInesperadaError o requests.RequestException si no hay
+        formulario de registro, el registro falla o la sesión no tiene cookie.
+        """
+        respuesta = self.sesion.get(self.url, timeout=self.timeout)
+        respuesta.raise_for_status()
+        
+        parser = _ParserFormulario()
+        parser.feed(respuesta.text)
+        registro = parser.formulario_con(CAMPOS_REGISTRO[0])
+        if registro is None:
+            raise RespuestaInesperadaError("No se encontró el formulario de registro")
+        respuesta_registro = self._registrar(registro, respuesta.url)
+        
+        # Tras el registro el servidor puede devolver ya la página de consulta
+        parser_registro = _ParserFormulario()
+        parser_registro.feed(respuesta_registro.text)
+        if parser_registro.formulario_sectores() is not None:
+            parser, respuesta = parser_registro, respuesta_registro
+        formulario = parser.formulario_sectores()
+        if formulario is None:
+            raise RespuestaInesperadaError("No se encontró el formulario con el desplegable 'sector'")
+        
+        self.action = urljoin(respuesta.url, formulario["action"] or respuesta.url)
+        self.method = formulario["method"]
+        self.campos = dict(formulario["campos"])
+        
+        for id_select, select in formulario["selects"].items():
+            opcion = self._elegir_opcion(id_select, select["opciones"])
+            if opcion is not None:
+                self.campos[select["name"]] = opcion["value"]
+        
+        self.selects = formulario["selects"]
+        self.nombre_campo_sector = formulario["selects"]["sector"]["name"]
+        if "ejercicio" in formulario["selects"]:
+            self.ejercicio = self.campos.get(formulario["selects"]["ejercicio"]["name"])
+        self.opciones_sector = [
+            {"value": o["value"], "text": o["text"].strip()}
+            for o in formulario["selects"]["sector"]["opciones"] if o["value"]
+        ]
+        return self
+    
+    def _registrar(self, formulario, url_pagina):
+        """Envía el formulario de registro y comprueba que la sesión queda con su cookie"""
+        campos = {nombre: valor for nombre, valor in formulario["campos"].items() if valor != TEXTO_BOTON_EXCEL}
+        for id_select in CAMPOS_REGISTRO:
+            select = formulario["selects"].get(id_select)
+            opcion = self._elegir_opcion(id_select, select["opciones"]) if select else None
+            if opcion is None or not opcion["value"]:
+                raise RespuestaInesperadaError(f"El formulario de registro no tiene opciones para '{id_select}'")
+            campos[select["name"]] = opcion["value"]
+        
+        action = urljoin(url_pagina, formulario["action"] or url_pagina)
+        if formulario["method"] == "post":
+            respuesta = self.sesion.post(action, data=campos, timeout=self.timeout)
+        else:
+            respuesta = self.sesion.get(action, params=campos, timeout=self.timeout)
+        respuesta.raise_for_status()
+        if not self.sesion.cookies:
+            raise RespuestaInesperadaError("El servidor no devolvió la cookie de sesión tras el registro")
+        print("✓ Sesión HTTP registrada")
+        return respuesta
+    
+    @staticmethod
+    def _elegir_opcion(id_select, opciones):
+        """Elige la opción de un desplegable con los mismos criterios que el camino Selenium"""
+        if not opciones:
+            return None
+        criterio, valor = SELECCION_FORMULARIO.get(id_select, (None, None))
+        if criterio == "index" and len(opciones) > valor:
+            return opciones[valor]
+        if criterio == "value":
+            for opcion in opciones:
+                if opcion["value"] == valor:
+                    return opcion
+        if criterio == "text":
+            for opcion in opciones:
+                if opcion["text"].strip() == valor:
+                    return opcion
+        # Por defecto, la opción preseleccionada (p. ej. el ejercicio más reciente)
+        for opcion in opciones:
+            if opcion["selected"]:
+                return opcion
+        return opciones[0]
+    
+    def obtener_sectores(self):
+        """Sectores disponibles en el formulario, con el mismo formato que obtener_sectores"""
+        print(f"✓ Encontrados {len(self.opciones_sector)} sectores de actividad")
+        return list(self.opciones_sector)
+    
+    def opciones_formulario(self):
+        """Opciones de los desplegables de ejercicio, tamaño y país (como opciones_formulario)"""
+        return {id_select: [{'value': o["value"], 'text': o["text"].strip()}
+                            for o in self.selects[id_select]["opciones"] if o["value"]]
+                for id_select in EJES_FORMULARIO if id_select in self.selects}
+    
+    def _fijar_campo(self, campos, id_select, valor, por_texto=False):
+        """Pone en campos el valor de una opción de un desplegable (elegida por valor o por texto)"""
+        if id_select not in self.selects:
+            return
+        for opcion in self.selects[id_select]["opciones"]:
+            if (opcion["text"].strip() if por_texto else opcion["value"]) == valor:
+                campos[self.selects[id_select]["name"]] = opcion["value"]
+                return
+        raise RespuestaInesperadaError(f"El desplegable '{id_select}' no tiene la opción {valor}")
+    
+    def descargar(self, sector_value, sector_text, directorio_base, ejercicio=None,
+                  dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+        """
+        Descarga el Excel de un sector. Misma interfaz (y mismos ejes) que
+        descargar_excel_sector: nombre del archivo guardado, o None si no hay datos.
+        
+        Lanza RespuestaInesperadaError o requests.RequestException si el servidor
+        responde algo que no sabemos interpretar, para que el llamante use Selenium.
+        """
+        if self.action is None:
+            self.iniciar()
+        
+        campos = dict(self.campos)
+        campos[self.nombre_campo_sector] = sector_value
+        if ejercicio:
+            self._fijar_campo(campos, "ejercicio", ejercicio)
+        self._fijar_campo(campos, "dimension", dimension)
+        self._fijar_campo(campos, "pais", pais, por_texto=True)
+        print(f"  → Descargando: {sector_text}")
+        
+        inicio = time.perf_counter()
+        if self.method == "post":
+            peticion = self.sesion.post(self.action, data=campos, stream=True, timeout=self.timeout)
+        else:
+            peticion = self.sesion.get(self.action, params=campos, stream=True, timeout=self.timeout)
+        metrics.observe("http.respuesta", time.perf_counter() - inicio)
+        
+        with peticion as respuesta:
+            respuesta.raise_for_status()
+            nombre = self._nombre_adjunto(respuesta)
+            
+            if nombre is None:
+                if TEXTO_SIN_DATOS in respuesta.text:
+                    print(f"  ⚠ Datos no disponibles para {sector_text}")
+                    return None
+                raise RespuestaInesperadaError(
+                    f"Respuesta sin Excel ({respuesta.headers.get('Content-Type')})"
+                )
+            
+            # Escribir en un temporal y renombrar al terminar, como hace Chrome
+            nombre = etiquetar_archivo(nombre, dimension, pais)
+            ruta_final = os.path.join(directorio_base, nombre)
+            ruta_temporal = ruta_final + ".part"
+            with metrics.timer("http.escritura"):
+                with open(ruta_temporal, "wb") as f:
+                    for bloque in respuesta.iter_content(chunk_size=64 * 1024):
+                        f.write(bloque)
+                os.replace(ruta_temporal, ruta_final)
+        
+        print(f"  ✓ Descargado: {nombre}")
+        return nombre
+    
+    @staticmethod
+    def _nombre_adjunto(respuesta):
+        """Nombre del fichero si la respuesta es un Excel, o None en caso contrario"""
+        disposicion = respuesta.headers.get("Content-Disposition", "")
+        tipo = respuesta.headers.get("Content-Type", "").lower()
+        
+        nombre = None
+        for parte in disposicion.split(";"):
+            clave, _, valor = parte.strip().partition("=")
+            if clave.lower() == "filename" and valor:
+                nombre = os.path.basename(valor.strip().strip('"'))
+        
+        if nombre is None and ("excel" in tipo or "spreadsheet" in tipo):
+            nombre = f"ratios_{int(time.time() * 1000)}.xls"
+        return nombre
+
+def crear_descarga_http(motor, directorio_base, opciones_navegador=None):
+    """
+    Devuelve una función de descarga con la firma de procesar_sectores que usa
+    el motor HTTP y recurre a Selenium cuando la respuesta no es la esperada.
+    El navegador de respaldo solo se arranca si hace falta.
+    """
+    respaldo = {"driver": None}
+    lock = threading.Lock()
+    # Directorio propio para que las descargas HTTP simultáneas no confundan
+    # la detección de ficheros nuevos del camino Selenium
+    directorio_respaldo = os.path.join(directorio_base, ".respaldo_selenium")
+    
+    def descargar(sector_value, sector_text, directorio, **ejes):
+        try:
+            return motor.descargar(sector_value, sector_text, directorio, **ejes)
+        except (requests.RequestException, RespuestaInesperadaError) as e:
+            print(f"  ⚠ Motor HTTP falló para {sector_text} ({e}); usando Selenium")
+            with lock:
+                if respaldo["driver"] is None:
+                    os.makedirs(directorio_respaldo, exist_ok=True)
+                    try:
+                        respaldo["driver"] = iniciar_sesion(directorio_respaldo, motor.url,
+                                                            **(opciones_navegador or {}))
+                    except Exception as e:
+                        # Sin navegador de respaldo solo falla este sector, no toda la ejecución
+                        print(f"  ✗ No se pudo iniciar el navegador de respaldo para {sector_text}: {e}")
+                        return False
+                resultado = descargar_excel_sector(respaldo["driver"], sector_value, sector_text,
+                                                   directorio_respaldo, **ejes)
+                mover_descargas_completas(directorio_respaldo, directorio)
+                return resultado
+    
+    def cerrar():
+        if respaldo["driver"] is not None:
+            respaldo["driver"].quit()
+    
+    descargar.cerrar = cerrar
+    return descargar
+
+def descargar_con_motor_http(url, directorio_base, n_workers, manifiesto=None,
+                             solo_fallidos=False, forzar=False, catalogo=None,
+                             opciones_navegador=None, barrido=None, **opciones):
+    """
+    Descarga todos los trabajos del barrido con el motor HTTP compartiendo una sola sesión.
+    
+    Returns:
+        Lista de resultados por sector, o None si no se pudo registrar la sesión
+        HTTP (el llamante descarga entonces con Selenium)
+    """
+    print("🌐 Iniciando sesión HTTP...")
+    try:
+        motor = MotorHTTP(url, tam_pool=n_workers).iniciar()
+    except (requests.RequestException, RespuestaInesperadaError) as e:
+        print(f"✗ No se pudo registrar la sesión HTTP ({e}); se descargará con Selenium")
+        return None
+    
+    # La plantilla del formulario ya trae los sectores: el catálogo solo se actualiza
+    print("\n🔍 Buscando sectores de actividad...")
+    sectores = motor.obtener_sectores()
+    if not sectores:
+        print("✗ No se encontraron sectores disponibles")
+        return []
+    if catalogo is not None:
+        catalogo.actualizar(sectores, motor.ejercicio, motor.opciones_formulario())
+    
+    sectores = preparar_trabajos(barrido, sectores, motor.ejercicio, motor.opciones_formulario(),
+                                 manifiesto, solo_fallidos, forzar)
+    if not sectores:
+        return []
+    
+    print(f"\n📥 Iniciando descarga de {len(sectores)} sectores...\n")
+    descargar = crear_descarga_http(motor, directorio_base, opciones_navegador)
+    try:
+        lotes = repartir_sectores(sectores, n_workers)
+        with ThreadPoolExecutor(max_workers=len(lotes)) as executor:
+            futuros = [executor.submit(procesar_sectores, descargar, lote, directorio_base,
+                                       directorio_base, f"[h{i}]" if len(lotes) > 1 else "",
+                                       manifiesto=manifiesto, ejercicio=motor.ejercicio, **opciones)
+                       for i, lote in enumerate(lotes)]
+            resultados = [r for futuro in futuros for r in futuro.result()]
+    finally:
+        descargar.cerrar()
+    
+    orden = {clave_trabajo(s): i for i, s in enumerate(sectores)}
+    resultados.sort(key=lambda r: orden[clave_trabajo(r)])
+    return resultados
+
+# ---------------------------------------------------------------------------
+# Manifiesto de descargas
+# ---------------------------------------------------------------------------
+
+ESTADO_COMPLETADO = "completado"
+ESTADO_SIN_DATOS = "sin_datos"
+ESTADO_FALLIDO = "fallido"
+
+NOMBRE_MANIFIESTO = "manifiesto_descargas.json"
+
+def estado_descarga(resultado):
+    """Estado del manifiesto para el resultado de una descarga (nombre, None o False)"""
+    if resultado:
+        return ESTADO_COMPLETADO
+    if resultado is None:
+        return ESTADO_SIN_DATOS
+    return ESTADO_FALLIDO
+
+# Espera base (segundos) del backoff exponencial entre reintentos
+ESPERA_BASE_REINTENTO = 5
+
+class ManifiestoDescargas:
+    """
+    Registro persistente (JSON) del estado de cada descarga, con clave
+    (ejercicio, sector, dimension, pais).
+    
+    Se reescribe de forma atómica tras cada sector, de modo que una ejecución
+    interrumpida puede reanudarse donde se quedó.
+    """
+    
+    def __init__(self, ruta):
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self.entradas = {}
+        if os.path.exists(ruta):
+            with open(ruta, encoding="utf-8") as f:
+                self.entradas = json.load(f).get("descargas", {})
+    
+    @staticmethod
+    def clave(ejercicio, sector, dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+        return "|".join(str(parte) for parte in (ejercicio, sector, dimension, pais))
+    
+    def consultar(self, ejercicio, sector, dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+        """Entrada registrada para la combinación, o None si nunca se intentó"""
+        return self.entradas.get(self.clave(ejercicio, sector, dimension, pais))
+    
+    def registrar(self, ejercicio, sector, estado, archivo=None, directorio=None,
+                  dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO, intentos=1):
+        """Guarda el resultado de una descarga (con tamaño y checksum si hay archivo)"""
+        entrada = {
+            "ejercicio": ejercicio,
+            "sector": sector,
+            "dimension": dimension,
+            "pais": pais,
+            "estado": estado,
+            "archivo": archivo,
+            "tamano": None,
+            "sha256": None,
+            "actualizado": datetime.now().isoformat(timespec="seconds"),
+        }
+        if archivo and directorio:
+            ruta = os.path.join(directorio, archivo)
+            if os.path.isfile(ruta):
+                entrada["tamano"] = os.path.getsize(ruta)
+                entrada["sha256"] = calcular_sha256(ruta)
+        
+        clave = self.clave(ejercicio, sector, dimension, pais)
+        with self._lock:
+            entrada["intentos"] = self.entradas.get(clave, {}).get("intentos", 0) + intentos
+            self.entradas[clave] = entrada
+            self._guardar()
+    
+    def _guardar(self):
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "descargas": self.entradas}, f, indent=2, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+    
+    def pendiente(self, ejercicio, sector, solo_fallidos=False,
+                  dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+        """
+        Indica si hay que descargar la combinación: nunca intentada, fallida o
+        completada pero cuyo archivo ya no está en downloads/ (borrado o
+        apartado en cuarentena por la carga) o ha cambiado.
+        Con solo_fallidos, únicamente las que fallaron o cuyo archivo falta.
+        """
+        entrada = self.consultar(ejercicio, sector, dimension, pais)
+        if entrada is None:
+            return not solo_fallidos
+        if entrada["estado"] == ESTADO_COMPLETADO:
+            return not self.archivo_vigente(entrada)
+        return entrada["estado"] == ESTADO_FALLIDO
+    
+    def archivo_vigente(self, entrada):
+        """
+        Si el archivo de una descarga completada sigue en el directorio del
+        manifiesto, con su nombre del BdE o ya renombrado a AÑO_CNAE.xls, y con
+        el mismo contenido (tamaño y checksum registrados).
+        """
+        if not entrada.get("archivo"):
+            return False
+        directorio = os.path.dirname(self.ruta)
+        for nombre in dict.fromkeys((entrada["archivo"], nombre_publicado(entrada["archivo"]))):
+            ruta = os.path.join(directorio, nombre)
+            if not os.path.isfile(ruta):
+                continue
+            if entrada.get("tamano") is not None and os.path.getsize(ruta) != entrada["tamano"]:
+                continue
+            if entrada.get("sha256") is None or calcular_sha256(ruta) == entrada["sha256"]:
+                return True
+        return False
+
+def seleccionar_pendientes(trabajos, manifiesto, solo_fallidos=False, forzar=False):
+    """Filtra los trabajos (sector, ejercicio, dimension, pais) que hay que descargar según el manifiesto"""
+    if manifiesto is None or forzar:
+        return trabajos
+    
+    pendientes = [t for t in trabajos if manifiesto.pendiente(t['ejercicio'], t['value'], solo_fallidos,
+                                                              t['dimension'], t['pais'])]
+    omitidos = len(trabajos) - len(pendientes)
+    ejercicios = ", ".join(sorted({str(t['ejercicio']) for t in trabajos}, reverse=True))
+    if solo_fallidos:
+        print(f"↻ Reintentando {len(pendientes)} sectores fallidos del ejercicio {ejercicios}")
+    elif omitidos:
+        print(f"⏭ Omitidos {omitidos} sectores ya descargados del ejercicio {ejercicios}")
+    if not pendientes:
+        print("✓ No hay sectores pendientes")
+    return pendientes
+
+def preparar_trabajos(barrido, sectores, ejercicio, opciones_form, manifiesto,
+                      solo_fallidos=False, forzar=False):
+    """
+    Expande el barrido en trabajos ordenados, quita los ya descargados según
+    el manifiesto y aplica el máximo de trabajos por ejecución.
+    
+    Sin barrido (o con los ejes por defecto) hay un trabajo por sector, con el
+    ejercicio por defecto, igual que una descarga normal.
+    """
+    barrido = barrido or Barrido()
+    trabajos = barrido.trabajos(sectores, ejercicio, opciones_form)
+    return barrido.limitar(seleccionar_pendientes(trabajos, manifiesto, solo_fallidos, forzar))
+
+def obtener_ejercicio(driver):
+    """Ejercicio seleccionado por defecto en el formulario (el más reciente)"""
+    select_ejercicio = WebDriverWait(driver, 10).until(select_listo("ejercicio"))
+    return select_ejercicio.first_selected_option.get_attribute("value")
+
+# ---------------------------------------------------------------------------
+# Motor Playwright asíncrono
+# ---------------------------------------------------------------------------
+
+# Selectores de la página (los mismos elementos que usa el camino Selenium)
+SELECTOR_BOTON_EXCEL = f"input[value='{TEXTO_BOTON_EXCEL}']"
+SELECTOR_ACEPTAR = "input[value='Aceptar']"
+SELECTOR_SECTOR_LISTO = "#sector option:not([value=''])"
+
+# Valor y texto seleccionados en cada desplegable de la consulta, en una sola llamada
+JS_ESTADO_FORMULARIO = """ids => Object.fromEntries(ids.map(id => {
+    const s = document.getElementById(id), o = s && s.selectedOptions[0];
+    return [id, o ? [o.value, o.textContent.trim()] : [null, null]];
+}))"""
+
+async def rellenar_registro_playwright(pagina):
+    """Rellena el formulario inicial de registro (equivalente a rellenar_formulario_registro)"""
+    await pagina.select_option("#entidad", index=1)
+    await pagina.select_option("#objetivo", index=1)
+    await pagina.select_option("#paisRegistro", label="España")
+    await pagina.wait_for_selector(SELECTOR_SECTOR_LISTO, state="attached")
+
+async def _bloquear_recurso(ruta):
+    if ruta.request.resource_type in TIPOS_RECURSO_BLOQUEADOS:
+        await ruta.abort()
+    else:
+        await ruta.continue_()
+
+async def abrir_contexto_playwright(navegador, url, bloquear_recursos=True, ruta_sesion=None):
+    """
+    Abre un contexto aislado (cookies y sesión propias) con su página ya registrada.
+    
+    Con ruta_sesion se parte del estado guardado (cookies) y solo se rellena el
+    registro si la página lo vuelve a pedir; el estado nuevo se guarda ahí.
+    """
+    estado = ruta_sesion if ruta_sesion and os.path.exists(ruta_sesion) else None
+    contexto = await navegador.new_context(accept_downloads=True, storage_state=estado)
+    if bloquear_recursos:
+        await contexto.route("**/*", _bloquear_recurso)
+    pagina = await contexto.new_page()
+    await pagina.goto(url, wait_until="domcontentloaded")
+    registrada = await pagina.evaluate("""() => {
+        const pendiente = id => { const e = document.getElementById(id);
+                                  return e && e.offsetParent !== null && !e.value; };
+        return !pendiente('entidad') && !pendiente('objetivo')
+            && !!document.querySelector("#sector option:not([value=''])");
+    }""")
+    if registrada:
+        metrics.count("navegador.sesion_reutilizada")
+    else:
+        await rellenar_registro_playwright(pagina)
+        if ruta_sesion:
+            temporal = ruta_sesion + ".tmp"
+            with open(temporal, "w", encoding="utf-8") as f:
+                json.dump(await contexto.storage_state(), f)
+            os.replace(temporal, ruta_sesion)
+    return pagina
+
+async def seleccionar_formulario_playwright(pagina, sector_value, ejercicio, dimension, pais):
+    """Cambia solo los desplegables cuyo valor es distinto del de la consulta anterior"""
+    ids = ["sector", *EJES_FORMULARIO]
+    estado = await pagina.evaluate(JS_ESTADO_FORMULARIO, ids)
+    if estado["sector"][0] != sector_value:
+        await pagina.select_option("#sector", sector_value)
+        metrics.count("formulario.cambios")
+        # Los demás desplegables pueden recargarse al cambiar el sector
+        estado = await pagina.evaluate(JS_ESTADO_FORMULARIO, ids)
+    if ejercicio and estado["ejercicio"][0] != ejercicio:
+        await pagina.select_option("#ejercicio", ejercicio)
+        metrics.count("formulario.cambios")
+    if estado["dimension"][0] != dimension:
+        await pagina.select_option("#dimension", dimension)
+        metrics.count("formulario.cambios")
+    if estado["pais"][1] != pais:
+        await pagina.select_option("#pais", label=pais)
+        metrics.count("formulario.cambios")
+
+async def descargar_sector_playwright(pagina, sector_value, sector_text, directorio_base, max_espera=30,
+                                      ejercicio=None, dimension=DIMENSION_POR_DEFECTO,
+                                      pais=PAIS_POR_DEFECTO):
+    """
+    Descarga el Excel de un sector con el evento de descarga de Playwright.
+    
+    Misma interfaz de resultado (y mismos ejes) que descargar_excel_sector:
+    nombre del archivo guardado, None si no hay datos o False si la descarga falló.
+    """
+    try:
+        await pagina.wait_for_selector(SELECTOR_SECTOR_LISTO, state="attached")
+        await seleccionar_formulario_playwright(pagina, sector_value, ejercicio, dimension, pais)
+        
+        # Se espera a la vez la descarga y el aviso de "Datos no disponibles"
+        descarga = asyncio.ensure_future(pagina.wait_for_event("download", timeout=max_espera * 1000))
+        aviso = asyncio.ensure_future(
+            pagina.locator(SELECTOR_ACEPTAR).first.wait_for(state="visible", timeout=max_espera * 1000))
+        try:
+            with metrics.timer("playwright.espera_descarga"):
+                await pagina.click(SELECTOR_BOTON_EXCEL)
+                print(f"  → Descargando: {sector_text}")
+                hechas, _ = await asyncio.wait({descarga, aviso}, timeout=max_espera,
+                                              return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for tarea in (descarga, aviso):
+                if not tarea.done():
+                    tarea.cancel()
+            await asyncio.gather(descarga, aviso, return_exceptions=True)
+        
+        if descarga in hechas and descarga.exception() is None:
+            objeto = descarga.result()
+            nombre = etiquetar_archivo(os.path.basename(objeto.suggested_filename), dimension, pais)
+            ruta_final = os.path.join(directorio_base, nombre)
+            # Escribir en un temporal y renombrar al terminar, como hace Chrome
+            await objeto.save_as(ruta_final + ".part")
+            os.replace(ruta_final + ".part", ruta_final)
+            print(f"  ✓ Descargado: {nombre}")
+            return nombre
+        
+        if aviso in hechas and aviso.exception() is None:
+            await pagina.click(SELECTOR_ACEPTAR)
+            print(f"  ⚠ Datos no disponibles para {sector_text} (Popup aceptado)")
+            return None
+        
+        print(f"  ⚠ Timeout esperando descarga para {sector_text}")
+        return False
+    
+    except Exception as e:
+        print(f"  ✗ Error descargando {sector_text}: {e}")
+        return False
+
+async def descargar_con_playwright(url, directorio_base, n_contextos, manifiesto=None,
+                                   solo_fallidos=False, forzar=False, pausa=PAUSA_ENTRE_DESCARGAS,
+                                   reintentos=0, al_completar=None, catalogo=None,
+                                   opciones_navegador=None, barrido=None, limitador=None,
+                                   almacen=None):
+    """
+    Descarga los trabajos del barrido con un único navegador Playwright y varios contextos aislados.
+    
+    Cada contexto tiene su propia sesión registrada y recorre en orden un bloque
+    contiguo de trabajos (así entre dos consultas seguidas solo cambia un
+    desplegable), respetando `pausa` entre descargas y el límite global de
+    `limitador`. Los resultados se registran en el manifiesto y se pasan a
+    `al_completar` igual que en procesar_sectores. Con un catálogo de sectores
+    fresco no se vuelve a leer el desplegable. `opciones_navegador` son las de
+    iniciar_sesion (headless, bloquear_recursos, ruta_sesion); cada contexto
+    guarda su sesión en su propia copia de ruta_sesion.
+    """
+    if async_playwright is None:
+        raise RuntimeError("Playwright no está instalado (pip install playwright && playwright install chromium)")
+    
+    async with async_playwright() as playwright:
+        print("🌐 Iniciando navegador Playwright...")
+        opciones_navegador = dict(opciones_navegador or {})
+        ruta_sesion = opciones_navegador.pop('ruta_sesion', None)
+        bloquear_recursos = opciones_navegador.get('bloquear_recursos', True)
+        navegador = await playwright.chromium.launch(headless=opciones_navegador.get('headless', True))
+        
+        def abrir(i):
+            return abrir_contexto_playwright(navegador, url, bloquear_recursos,
+                                             ruta_sesion_worker(ruta_sesion, f"c{i}"))
+        
+        try:
+            primera = await abrir(0)
+            
+            if catalogo_utilizable(catalogo, barrido):
+                sectores, ejercicio = catalogo.sectores(), catalogo.ejercicio
+                opciones_form = catalogo.opciones
+                print(f"\n📚 Usando el catálogo de sectores ({len(sectores)} sectores, ejercicio {ejercicio})")
+            else:
+                print("\n🔍 Buscando sectores de actividad...")
+                sectores = [s for s in await primera.eval_on_selector_all(
+                    "#sector option", "ops => ops.map(o => ({value: o.value, text: o.textContent.trim()}))")
+                    if s['value']]
+                print(f"✓ Encontrados {len(sectores)} sectores de actividad")
+                ejercicio = await primera.eval_on_selector("#ejercicio", "s => s.value")
+                opciones_form = {id_select: [o for o in await primera.eval_on_selector_all(
+                    f"#{id_select} option",
+                    "ops => ops.map(o => ({value: o.value, text: o.textContent.trim()}))") if o['value']]
+                    for id_select in EJES_FORMULARIO}
+                if catalogo is not None:
+                    catalogo.actualizar(sectores, ejercicio, opciones_form)
+            
+            sectores = preparar_trabajos(barrido, sectores, ejercicio, opciones_form, manifiesto,
+                                         solo_fallidos, forzar)
+            if not sectores:
+                return []
+            
+            lotes = repartir_sectores(sectores, n_contextos)
+            paginas = [primera] + list(await asyncio.gather(
+                *(abrir(i) for i in range(1, len(lotes)))))
+            
+            async def procesar_lote(pagina, inicio, lote):
+                return [await _procesar_sector_playwright(
+                            pagina, sector, i, len(sectores), directorio_base, manifiesto,
+                            ejercicio, reintentos, al_completar, pausa, limitador, almacen)
+                        for i, sector in enumerate(lote, inicio)]
+            
+            print(f"\n📥 Iniciando descarga de {len(sectores)} sectores con {len(lotes)} contextos...\n")
+            inicios = [1 + sum(len(lote) for lote in lotes[:i]) for i in range(len(lotes))]
+            por_lote = await asyncio.gather(*(procesar_lote(pagina, inicio, lote)
+                                              for pagina, inicio, lote in zip(paginas, inicios, lotes)))
+            return [r for resultados in por_lote for r in resultados]
+        finally:
+            await navegador.close()
+
+async def _procesar_sector_playwright(pagina, sector, i, total, directorio_base, manifiesto,
+                                      ejercicio, reintentos, al_completar, pausa, limitador=None,
+                                      almacen=None):
+    """Descarga un trabajo con reintentos y registra el resultado (ver procesar_sectores)"""
+    descripcion = sector.get('descripcion', sector['text'])
+    ejes = ejes_trabajo(sector, ejercicio)
+    print(f"[{i}/{total}] Procesando: {descripcion}")
+    
+    with metrics.timer("descarga.sector", sector=sector['value']) as etiquetas:
+        for intento in range(reintentos + 1):
+            if intento:
+                espera = ESPERA_BASE_REINTENTO * 2 ** (intento - 1)
+                print(f"  ↻ Reintento {intento}/{reintentos} de {descripcion} en {espera} s")
+                metrics.count("descarga.reintentos")
+                await asyncio.sleep(espera)
+            if limitador is not None:
+                await asyncio.sleep(limitador.reservar())
+            resultado = await descargar_sector_playwright(pagina, sector['value'], descripcion,
+                                                          directorio_base, **ejes)
+            if resultado is not False:
+                break
+        resultado, sin_cambios = guardar_en_almacen(almacen, resultado, directorio_base)
+        estado = estado_descarga(resultado)
+        etiquetas.update(estado=estado, intentos=intento + 1)
+    archivo = resultado or None
+    metrics.count(f"descarga.{estado}")
+    
+    if manifiesto is not None:
+        manifiesto.registrar(ejes['ejercicio'], sector['value'], estado, archivo, directorio_base,
+                             ejes['dimension'], ejes['pais'], intentos=intento + 1)
+    
+    resultado_sector = dict(sector, **ejes, ok=estado == ESTADO_COMPLETADO, estado=estado,
+                            archivo=archivo, directorio=directorio_base, sin_cambios=sin_cambios)
+    if al_completar is not None:
+        al_completar(resultado_sector)
+    
+    await asyncio.sleep(pausa)  # Pausa entre descargas de este contexto
+    return resultado_sector
+
+# ---------------------------------------------------------------------------
+# Orquestación
+# ---------------------------------------------------------------------------
+
+def ruta_sesion_worker(ruta_sesion, sufijo):
+    """Copia de la sesión guardada propia de un worker o contexto (cada uno se registra por separado)"""
+    if not ruta_sesion or not sufijo or sufijo in ("w0", "c0"):
+        return ruta_sesion
+    base, extension = os.path.splitext(ruta_sesion)
+    return f"{base}_{sufijo}{extension}"
+
+def iniciar_sesion(directorio_descarga, url=URL_RATIOS, ruta_sesion=None, **opciones_navegador):
+    """
+    Abre un navegador independiente, accede a la página y rellena el registro.
+    
+    Con ruta_sesion se reutiliza la sesión guardada si el servidor la sigue
+    dando por registrada; si no, se registra de nuevo y se guarda.
+    """
+    driver = configurar_navegador(directorio_descarga, **opciones_navegador)
+    with metrics.timer("navegador.sesion") as etiquetas:
+        if ruta_sesion and restaurar_sesion(driver, url, ruta_sesion):
+            print("♻ Sesión registrada reutilizada")
+            etiquetas['reutilizada'] = True
+            metrics.count("navegador.sesion_reutilizada")
+        else:
+            if driver.current_url != url:
+                driver.get(url)
+            rellenar_formulario_registro(driver)
+            etiquetas['reutilizada'] = False
+            if ruta_sesion:
+                guardar_sesion(driver, ruta_sesion, url)
+    return driver
+
+def repartir_sectores(sectores, n_workers):
+    """
+    Reparte los trabajos en n_workers bloques contiguos de tamaño parecido, para
+    que cada sesión conserve el orden del barrido (un desplegable por consulta)
+    """
+    n_workers = max(1, min(n_workers, len(sectores)))
+    tamano, resto = divmod(len(sectores), n_workers)
+    lotes, inicio = [], 0
+    for i in range(n_workers):
+        fin = inicio + tamano + (1 if i < resto else 0)
+        lotes.append(sectores[inicio:fin])
+        inicio = fin
+    return [lote for lote in lotes if lote]
+
+def ejes_trabajo(trabajo, ejercicio=None):
+    """Ejercicio, dimension y pais de un trabajo (con los valores por defecto si no los trae)"""
+    return {'ejercicio': trabajo.get('ejercicio', ejercicio),
+            'dimension': trabajo.get('dimension', DIMENSION_POR_DEFECTO),
+            'pais': trabajo.get('pais', PAIS_POR_DEFECTO)}
+
+def catalogo_utilizable(catalogo, barrido=None):
+    """True si el catálogo está fresco y tiene lo que necesita el barrido (las opciones con 'todos')"""
+    if catalogo is None or not catalogo.fresco():
+        return False
+    return bool(catalogo.opciones) or barrido is None or not barrido.necesita_opciones()
+
+def mover_descargas_completas(directorio_origen, directorio_destino):
+    """Mueve al directorio final los ficheros ya completos de un directorio de trabajo"""
+    movidos = []
+    for nombre in os.listdir(directorio_origen):
+        ruta = os.path.join(directorio_origen, nombre)
+        if not os.path.isfile(ruta) or nombre.endswith(EXTENSIONES_TEMPORALES):
+            continue
+        shutil.move(ruta, os.path.join(directorio_destino, nombre))
+        movidos.append(nombre)
+    return movidos
+
+def guardar_en_almacen(almacen, resultado, directorio):
+    """
+    Pasa un archivo descargado al almacén de descargas (si lo hay).
+
+    Returns:
+        (nombre publicado o el resultado sin cambios, True si es idéntico al vigente)
+    """
+    if almacen is None or not resultado:
+        return resultado, False
+    nombre, nuevo = almacen.guardar(os.path.join(directorio, resultado))
+    if not nuevo:
+        print(f"  = Sin cambios: {nombre} (idéntico al ya descargado)")
+        metrics.count("descarga.sin_cambios")
+    elif nombre != resultado:
+        print(f"  ✓ Publicado como {nombre}")
+    return nombre, not nuevo
+
+def procesar_sectores(descargar, sectores, directorio_descarga, directorio_destino,
+                      etiqueta="", pausa=PAUSA_ENTRE_DESCARGAS, manifiesto=None,
+                      ejercicio=None, reintentos=0, al_completar=None, limitador=None,
+                      almacen=None):
+    """
+    Descarga una lista de sectores (o trabajos del barrido) y devuelve los resultados.
+    
+    `descargar` tiene la misma firma que descargar_excel_sector sin el driver:
+    descargar(sector_value, sector_text, directorio, ejercicio=, dimension=, pais=)
+    -> nombre | None | False. Cada trabajo trae sus ejes; si no, se usan
+    `ejercicio` y el tamaño y país por defecto.
+    
+    Antes de cada envío del formulario se espera al turno de `limitador`
+    (límite global de peticiones compartido por todas las sesiones).
+    Los fallos se reintentan hasta `reintentos` veces con espera exponencial.
+    Con `almacen` (AlmacenDescargas) cada archivo pasa al almacén en cuanto
+    termina y el resultado lleva su nombre de carga (YYYY_CCCC.xls).
+    Si se pasa un manifiesto, cada resultado se registra en cuanto se conoce,
+    y `al_completar(resultado)` se llama cuando el archivo ya está en
+    directorio_destino (permite procesarlo mientras siguen las descargas).
+    """
+    resultados = []
+    for i, sector in enumerate(sectores, 1):
+        descripcion = sector.get('descripcion', sector['text'])
+        ejes = ejes_trabajo(sector, ejercicio)
+        print(f"{etiqueta}[{i}/{len(sectores)}] Procesando: {descripcion}")
+        
+        with metrics.timer("descarga.sector", sector=sector['value']) as etiquetas:
+            for intento in range(reintentos + 1):
+                if intento:
+                    espera = ESPERA_BASE_REINTENTO * 2 ** (intento - 1)
+                    print(f"  ↻ Reintento {intento}/{reintentos} de {descripcion} en {espera} s")
+                    metrics.count("descarga.reintentos")
+                    time.sleep(espera)
+                if limitador is not None:
+                    limitador.esperar()
+                resultado = descargar(sector['value'], descripcion, directorio_descarga, **ejes)
+                if resultado is not False:
+                    break
+            
+            if directorio_descarga != directorio_destino:
+                mover_descargas_completas(directorio_descarga, directorio_destino)
+            resultado, sin_cambios = guardar_en_almacen(almacen, resultado, directorio_destino)
+            
+            estado = estado_descarga(resultado)
+            etiquetas.update(estado=estado, intentos=intento + 1)
+        archivo = resultado or None
+        metrics.count(f"descarga.{estado}")
+        
+        if manifiesto is not None:
+            manifiesto.registrar(ejes['ejercicio'], sector['value'], estado, archivo, directorio_destino,
+                                 ejes['dimension'], ejes['pais'], intentos=intento + 1)
+        
+        resultado_sector = dict(sector, **ejes, ok=estado == ESTADO_COMPLETADO, estado=estado,
+                                archivo=archivo, directorio=directorio_destino, sin_cambios=sin_cambios)
+        resultados.append(resultado_sector)
+        if al_completar is not None:
+            al_completar(resultado_sector)
+        
+        time.sleep(pausa)  # Pausa entre descargas
+    
+    return resultados
+
+def ejecutar_worker(id_worker, sectores, directorio_base, url=URL_RATIOS, opciones_navegador=None,
+                    **opciones):
+    """Worker con sesión de navegador y directorio de descarga propios"""
+    etiqueta = f"[w{id_worker}]"
+    directorio_worker = os.path.join(directorio_base, f".worker_{id_worker}")
+    os.makedirs(directorio_worker, exist_ok=True)
+    
+    # Escalonar el arranque para no registrar todas las sesiones a la vez
+    time.sleep(id_worker)
+    
+    driver = None
+    resultados = []
+    try:
+        print(f"{etiqueta} 🌐 Iniciando navegador...")
+        opciones_navegador = dict(opciones_navegador or {})
+        opciones_navegador['ruta_sesion'] = ruta_sesion_worker(opciones_navegador.get('ruta_sesion'),
+                                                               f"w{id_worker}")
+        driver = iniciar_sesion(directorio_worker, url, **opciones_navegador)
+        resultados = procesar_sectores(partial(descargar_excel_sector, driver), sectores,
+                                       directorio_worker, directorio_base, etiqueta, **opciones)
+    except Exception as e:
+        print(f"{etiqueta} ✗ Error crítico en worker: {e}")
+    finally:
+        if driver:
+            driver.quit()
+        mover_descargas_completas(directorio_worker, directorio_base)
+        if not os.listdir(directorio_worker):
+            os.rmdir(directorio_worker)
+    
+    # Los trabajos que no llegaron a procesarse cuentan como fallidos
+    procesados = {clave_trabajo(r) for r in resultados}
+    for sector in sectores:
+        if clave_trabajo(sector) not in procesados:
+            resultados.append(dict(sector, ok=False, estado=ESTADO_FALLIDO, archivo=None))
+    
+    return resultados
+
+def descargar_en_paralelo(sectores, directorio_base, n_workers, url=URL_RATIOS,
+                          opciones_navegador=None, **opciones):
+    """Reparte los sectores entre n_workers sesiones independientes y une los resultados"""
+    lotes = repartir_sectores(sectores, n_workers)
+    print(f"⚙ Repartiendo {len(sectores)} sectores entre {len(lotes)} sesiones")
+    
+    with ThreadPoolExecutor(max_workers=len(lotes)) as executor:
+        futuros = [executor.submit(ejecutar_worker, i, lote, directorio_base, url,
+                                   opciones_navegador, **opciones)
+                   for i, lote in enumerate(lotes)]
+        resultados = [r for futuro in futuros for r in futuro.result()]
+    
+    # Mantener el orden original de los trabajos en el resumen
+    orden = {clave_trabajo(s): i for i, s in enumerate(sectores)}
+    resultados.sort(key=lambda r: orden[clave_trabajo(r)])
+    return resultados
+
+def imprimir_resumen(resultados, directorio_base):
+    """Imprime el resumen unificado de las descargas"""
+    exitosos = sum(1 for r in resultados if r['ok'])
+    sin_datos = sum(1 for r in resultados if r.get('estado') == ESTADO_SIN_DATOS)
+    fallidos = len(resultados) - exitosos
+    
+    print("\n" + "="*70)
+    print("RESUMEN DE DESCARGAS")
     print("="*70)
-    print("DESCARGADOR DE RATIOS SECTORIALES - BANCO DE ESPAÑA")
+    print(f"✓ Exitosas: {exitosos}")
+    print(f"✗ Fallidas: {fallidos} (sin datos: {sin_datos})")
+    for r in resultados:
+        if not r['ok']:
+            print(f"   - {r['value']}: {r.get('descripcion', r['text'])}")
+    print(f"📁 Archivos guardados en: {directorio_base}")
     print("="*70)
+
+def parsear_argumentos(argv=None):
+    """Lee las opciones de línea de comandos"""
+    parser = argparse.ArgumentParser(description="Descarga los ratios sectoriales del Banco de España")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Número de sesiones de navegador simultáneas (por defecto 1)")
+    parser.add_argument("--max-workers", type=int, default=MAX_WORKERS_CORTESIA,
+                        help=f"Límite de cortesía de sesiones simultáneas (por defecto {MAX_WORKERS_CORTESIA})")
+    parser.add_argument("--pausa", type=float, default=PAUSA_ENTRE_DESCARGAS,
+                        help=f"Segundos de pausa entre descargas de una sesión (por defecto {PAUSA_ENTRE_DESCARGAS})")
+    parser.add_argument("--motor", choices=["selenium", "http", "playwright"], default="selenium",
+                        help="Motor de descarga: navegador Selenium, envío HTTP directo del formulario "
+                             "(con Selenium como respaldo) o Playwright asíncrono con --workers "
+                             "contextos en un solo navegador")
+    parser.add_argument("--url", default=URL_RATIOS,
+                        help="URL de la página de ratios (p. ej. un servidor simulado local)")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="Reintentar solo los sectores que fallaron según el manifiesto")
+    parser.add_argument("--reintentos", type=int, default=None,
+                        help="Reintentos por sector con espera exponencial "
+                             "(por defecto 0, o 3 con --retry-failed)")
+    parser.add_argument("--forzar", action="store_true",
+                        help="Descargar todos los sectores aunque el manifiesto los dé por completados")
+    parser.add_argument("--visible", action="store_true",
+                        help="Mostrar la ventana del navegador (por defecto se ejecuta sin ventana)")
+    parser.add_argument("--cargar-recursos", action="store_true",
+                        help="Cargar imágenes, fuentes y vídeos de la página (por defecto se bloquean)")
+    parser.add_argument("--sin-sesion-guardada", action="store_true",
+                        help=f"No reutilizar ni guardar la sesión registrada ({NOMBRE_SESION})")
+    parser.add_argument("--ttl-catalogo", type=float, default=TTL_HORAS,
+                        help=f"Horas que se reutiliza el catálogo de sectores sin leer la web (por defecto {TTL_HORAS})")
+    parser.add_argument("--refrescar-catalogo", action="store_true",
+                        help="Leer de nuevo el desplegable de sectores aunque el catálogo esté fresco")
+    parser.add_argument("--ejercicios", default=None,
+                        help="Ejercicios a descargar, separados por comas (p. ej. 2023,2022,2021) o "
+                             "'todos'; por defecto el más reciente")
+    parser.add_argument("--dimensiones", default=None,
+                        help="Tamaños (valores del desplegable, p. ej. 0,1,2) o 'todas'; "
+                             f"por defecto {DIMENSION_POR_DEFECTO} (Menos de 50 millones)")
+    parser.add_argument("--paises", default=None,
+                        help=f"Países (texto del desplegable) separados por comas o 'todos'; "
+                             f"por defecto {PAIS_POR_DEFECTO}")
+    parser.add_argument("--max-trabajos", type=int, default=None,
+                        help="Máximo de descargas pendientes en esta ejecución (el resto queda en el "
+                             "manifiesto para la siguiente)")
+    parser.add_argument("--peticiones-por-minuto", type=float, default=PETICIONES_POR_MINUTO,
+                        help="Límite global de consultas por minuto entre todas las sesiones "
+                             f"(por defecto {PETICIONES_POR_MINUTO}; 0 = sin límite)")
+    parser.add_argument("--sin-almacen", action="store_true",
+                        help="Dejar las descargas con el nombre del BdE en downloads/ en lugar de "
+                             f"pasarlas al almacén por contenido ({NOMBRE_INDICE})")
+    parser.add_argument("--metricas", default=None,
+                        help="Guardar un informe JSON con tiempos por etapa y por sector en esta ruta")
+    parser.add_argument("--perfil", choices=PROFILE_MODES, default=None,
+                        help="Con --metricas: perfilar con cProfile, tracemalloc o ambos (all)")
+    return parser.parse_args(argv)
+
+def ejecutar_descarga(args, al_completar=None):
+    """
+    Ejecuta la descarga completa según las opciones de línea de comandos.
+    
+    `al_completar`, si se indica, se llama con el resultado de cada sector en
+    cuanto su archivo está en el directorio de descargas (ver procesar_sectores).
+    
+    Returns:
+        Lista de resultados por sector (vacía si no había nada que descargar)
+    """
+    n_workers = max(1, min(args.workers, args.max_workers))
     
-    # Configurar directorio de descargas
     # Configurar directorio de descargas
     # Usar el directorio 'downloads' dentro del directorio actual del script
     directorio_base = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads")
     os.makedirs(directorio_base, exist_ok=True)
     print(f"\n📁 Directorio de descargas: {directorio_base}\n")
     
+    manifiesto = ManifiestoDescargas(os.path.join(directorio_base, NOMBRE_MANIFIESTO))
+    catalogo = CatalogoSectores(os.path.join(directorio_base, "catalogo_sectores.json"), args.ttl_catalogo)
+    if args.refrescar_catalogo:
+        catalogo.invalidar()
+    reintentos = args.reintentos if args.reintentos is not None else (3 if args.retry_failed else 0)
+    opciones_navegador = {'headless': not args.visible, 'bloquear_recursos': not args.cargar_recursos}
+    ruta_sesion = None if args.sin_sesion_guardada else os.path.join(directorio_base, NOMBRE_SESION)
+    barrido = Barrido(args.ejercicios, args.dimensiones, args.paises, args.max_trabajos)
+    almacen = None
+    if not args.sin_almacen:
+        # Los archivos sueltos de ejecuciones anteriores pasan también al almacén
+        almacen = AlmacenDescargas(directorio_base, cargar_mapa_cnae(catalogo.ruta))
+        almacen.importar_sueltos()
+    opciones = {'pausa': args.pausa, 'manifiesto': manifiesto, 'reintentos': reintentos,
+                'al_completar': al_completar, 'almacen': almacen,
+                'limitador': LimitadorPeticiones(args.peticiones_por_minuto)}
+    resultados = []
+    
+    if args.motor == "http":
+        try:
+            resultados = descargar_con_motor_http(args.url, directorio_base, n_workers,
+                                                  solo_fallidos=args.retry_failed,
+                                                  forzar=args.forzar, catalogo=catalogo,
+                                                  opciones_navegador=opciones_navegador,
+                                                  barrido=barrido, **opciones)
+            if resultados:
+                imprimir_resumen(resultados, directorio_base)
+        except Exception as e:
+            print(f"\n✗ Error crítico: {e}")
+            import traceback
+            traceback.print_exc()
+        if resultados is not None:
+            print("✓ Proceso finalizado")
+            return resultados
+        resultados = []
+    
+    if args.motor == "playwright":
+        try:
+            resultados = asyncio.run(descargar_con_playwright(
+                args.url, directorio_base, n_workers, solo_fallidos=args.retry_failed,
+                forzar=args.forzar, catalogo=catalogo, barrido=barrido,
+                opciones_navegador={**opciones_navegador, 'ruta_sesion': ruta_sesion}, **opciones))
+            if resultados:
+                imprimir_resumen(resultados, directorio_base)
+        except Exception as e:
+            print(f"\n✗ Error crítico: {e}")
+            import traceback
+            traceback.print_exc()
+        print("✓ Proceso finalizado")
+        return resultados
+    
     driver = None
+    usar_catalogo = catalogo_utilizable(catalogo, barrido)
+    # Chrome descarga en un directorio propio: en downloads/ otros procesos
+    # (p. ej. el pipeline al renombrar) crean archivos que el vigilante
+    # tomaría por la descarga en curso
+    directorio_navegador = os.path.join(directorio_base, ".descarga_selenium")
+    os.makedirs(directorio_navegador, exist_ok=True)
     
     try:
-        # Configurar navegador
-        print("🌐 Iniciando navegador...")
-        driver = configurar_navegador(directorio_base)
+        if usar_catalogo:
+            sectores, ejercicio = catalogo.sectores(), catalogo.ejercicio
+            opciones_form = catalogo.opciones
+            print(f"📚 Usando el catálogo de sectores ({len(sectores)} sectores, ejercicio {ejercicio})")
         
-        # Acceder a la página
-        url = "https://app.bde.es/rss_www/Ratios"
-        print(f"🔗 Accediendo a: {url}")
-        driver.get(url)
-        time.sleep(2)
+        # En paralelo, con el catálogo fresco no hace falta la sesión de arranque
+        if not usar_catalogo or n_workers == 1:
+            # Configurar navegador, acceder a la página y registrarse (o reutilizar la sesión)
+            print("🌐 Iniciando navegador...")
+            print(f"🔗 Accediendo a: {args.url}")
+            driver = iniciar_sesion(directorio_navegador, args.url, ruta_sesion, **opciones_navegador)
         
-        # Rellenar formulario de registro
-        print("\n📝 Rellenando formulario de registro...")
-        rellenar_formulario_registro(driver)
-        
-        # Obtener todos los sectores
-        print("\n🔍 Buscando sectores de actividad...")
-        sectores = obtener_sectores(driver)
+        if not usar_catalogo:
+            # Obtener todos los sectores
+            print("\n🔍 Buscando sectores de actividad...")
+            sectores = obtener_sectores(driver)
+            
+            if not sectores:
+                print("✗ No se encontraron sectores disponibles")
+                return resultados
+            
+            ejercicio = obtener_ejercicio(driver)
+            opciones_form = opciones_formulario(driver)
+            catalogo.actualizar(sectores, ejercicio, opciones_form)
         
+        # Expandir el barrido y saltar lo ya descargado según el manifiesto
+        sectores = preparar_trabajos(barrido, sectores, ejercicio, opciones_form, manifiesto,
+                                     args.retry_failed, args.forzar)
         if not sectores:
-            print("✗ No se encontraron sectores disponibles")
-            return
+            return resultados
+        opciones['ejercicio'] = ejercicio
         
         # Descargar Excel para cada sector
         print(f"\n📥 Iniciando descarga de {len(sectores)} sectores...\n")
-        exitosos = 0
-        fallidos = 0
         
-        for i, sector in enumerate(sectores, 1):
-            print(f"[{i}/{len(sectores)}] Procesando: {sector['text']}")
-            
-            if descargar_excel_sector(driver, sector['value'], sector['text'], directorio_base):
-                exitosos += 1
-            else:
-                fallidos += 1
-            
-            time.sleep(2)  # Pausa entre descargas
+        if n_workers == 1:
+            resultados = procesar_sectores(partial(descargar_excel_sector, driver), sectores,
+                                           directorio_navegador, directorio_base, **opciones)
+        else:
+            # Cada worker abre su propia sesión; la de arranque ya no hace falta
+            if driver:
+                driver.quit()
+                driver = None
+            resultados = descargar_en_paralelo(sectores, directorio_base, n_workers, args.url,
+                                              {**opciones_navegador, 'ruta_sesion': ruta_sesion},
+                                              **opciones)
         
         # Resumen final
-        print("\n" + "="*70)
-        print("RESUMEN DE DESCARGAS")
-        print("="*70)
-        print(f"✓ Exitosas: {exitosos}")
-        print(f"✗ Fallidas: {fallidos}")
-        print(f"📁 Archivos guardados en: {directorio_base}")
-        print("="*70)
+        imprimir_resumen(resultados, directorio_base)
         
     except Exception as e:
         print(f"\n✗ Error crítico: {e}")
@@ -233,8 +1632,28 @@ def main():
             print("\n🔒 Cerrando navegador...")
             time.sleep(2)
             driver.quit()
+        mover_descargas_completas(directorio_navegador, directorio_base)
+        if not os.listdir(directorio_navegador):
+            os.rmdir(directorio_navegador)
         
         print("✓ Proceso finalizado")
+    
+    return resultados
+
+def main(argv=None):
+    """Función principal"""
+    args = parsear_argumentos(argv)
+    
+    print("="*70)
+    print("DESCARGADOR DE RATIOS SECTORIALES - BANCO DE ESPAÑA")
+    print("="*70)
+    
+    with metrics_report(args.metricas, args.perfil, script="1_descargar_ratios_bde.py",
+                        opciones=vars(args)):
+        with metrics.timer("descarga.total"):
+            ejecutar_descarga(args)
+    if args.metricas:
+        print(f"📊 Métricas guardadas en {args.metricas}")
 
 if __name__ == "__main__":
     main()
@@ -1,8 +1,25 @@
+import argparse
 import asyncio
 from playwright.async_api import Playwright, async_playwright
 from bs4 import BeautifulSoup
 
-async def extract_and_save_cnaes(playwright: Playwright) -> None:
+from catalogo_sectores import EJES_FORMULARIO, TTL_HORAS, CatalogoSectores
+
+RUTA_LISTA = "downloads/lista CNAEs.txt"
+
+# Opciones (con valor) de un desplegable, con el formato del catálogo
+JS_OPCIONES = """s => Array.from(s.options).filter(o => o.value)
+    .map(o => ({value: o.value, text: o.textContent.trim()}))"""
+
+def guardar_lista(cnaes):
+    # Guardar los CNAEs en un archivo
+    with open(RUTA_LISTA, "w", encoding="utf-8") as f:  # encoding para caracteres especiales
+        for cnae in cnaes:
+            f.write(cnae + "\n")
+
+    print("Archivo 'lista CNAEs.txt' creado con éxito.")
+
+async def extract_and_save_cnaes(playwright: Playwright, catalogo: CatalogoSectores) -> None:
     browser = await playwright.chromium.launch(headless=False)
     context = await browser.new_context()
     page = await context.new_page()
@@ -16,17 +33,24 @@ async def extract_and_save_cnaes(playwright: Playwright) -> None:
         soup = BeautifulSoup(sector_html, "html.parser")
 
         cnaes = []
+        sectores = []
         for option in soup.find_all("option"):
             value = option["value"]
             text = option.text
             cnaes.append(f"{value} - {text}")  # Formato "valor - texto"
+            sectores.append({"value": value, "text": text})
 
-        # Guardar los CNAEs en un archivo
-        with open("downloads/lista CNAEs.txt", "w", encoding="utf-8") as f:  # encoding para caracteres especiales
-            for cnae in cnaes:
-                f.write(cnae + "\n")
+        guardar_lista(cnaes)
 
-        print("Archivo 'lista CNAEs.txt' creado con éxito.")
+        # Catálogo estructurado que reutiliza el descargador, con las opciones
+        # de los desplegables que recorre el barrido
+        ejercicio = await page.eval_on_selector("#ejercicio", "s => s.value")
+        opciones = {}
+        for id_select in EJES_FORMULARIO:
+            if await page.query_selector(f"#{id_select}"):
+                opciones[id_select] = await page.eval_on_selector(f"#{id_select}", JS_OPCIONES)
+        catalogo.actualizar(sectores, ejercicio, opciones)
+        print(f"Catálogo de sectores actualizado en {catalogo.ruta}")
 
     except Exception as e:
         print(f"Error: {e}")
@@ -36,7 +60,23 @@ async def extract_and_save_cnaes(playwright: Playwright) -> None:
 
 
 async def main():
+    parser = argparse.ArgumentParser(description="Extrae la lista de CNAEs del desplegable de sectores del BdE")
+    parser.add_argument("--ttl-catalogo", type=float, default=TTL_HORAS,
+                        help=f"Horas que se reutiliza el catálogo de sectores sin leer la web (por defecto {TTL_HORAS})")
+    parser.add_argument("--refrescar-catalogo", action="store_true",
+                        help="Leer de nuevo el desplegable de sectores aunque el catálogo esté fresco")
+    args = parser.parse_args()
+
+    catalogo = CatalogoSectores(ttl_horas=args.ttl_catalogo)
+    if args.refrescar_catalogo:
+        catalogo.invalidar()
+    if catalogo.fresco():
+        # El catálogo guarda los sectores con el mismo texto que el desplegable
+        print(f"Catálogo de sectores fresco ({catalogo.actualizado:%Y-%m-%d %H:%M}); no se lee la web")
+        guardar_lista(f"{s['value']} - {s['text']}" for s in catalogo.sectores())
+        return
+
     async with async_playwright() as playwright:
-        await extract_and_save_cnaes(playwright)
+        await extract_and_save_cnaes(playwright, catalogo)
 
-asyncio.run(main())
\ No newline at end of file
+asyncio.run(main())
@@ -1,7 +1,25 @@
+import argparse
 import os
 import re
 
-def transformar_nombre_archivo(nombre_archivo):
+from almacen_descargas import AlmacenDescargas
+from sufijos_ejes import separar_sufijo
+from catalogo_sectores import cargar_mapa_cnae
+
+def transformar_nombre_archivo(nombre_archivo, mapa_cnae=None):
+    # Las descargas de otro tamaño o país conservan su sufijo (ej: _d2_Portugal)
+    nombre_original = nombre_archivo
+    nombre_archivo, sufijo = separar_sufijo(nombre_archivo)
+    
+    # Con el mapa del catálogo de sectores (valor -> CNAE) basta con partir el nombre
+    if mapa_cnae:
+        partes = nombre_archivo.split("_")
+        if (len(partes) == 4 and partes[2] == "b" and partes[3].endswith(".xls")
+                and partes[1] in mapa_cnae):
+            nuevo_nombre = f"{partes[0]}_{mapa_cnae[partes[1]]}{sufijo}.xls"
+            print(f"Transformando: {nombre_original} -> {nuevo_nombre}")
+            return nuevo_nombre
+    
     # Patrón para identificar archivos con el formato "YYYY_XXXX_b_YYYYMMDD.xls"
     # Ejemplo: 2023_A011_b_20251119.xls, 2023_A01_b_..., 2023_A_b_...
     patron = r'(\d{4})_([A-Z](\d*))_b_\d+\.xls'
@@ -23,15 +41,15 @@ def transformar_nombre_archivo(nombre_archivo):
         
         # Formatear el nuevo nombre de archivo
         # Se mantiene la lógica de usar los números y añadir un 0 al final
-        nuevo_nombre = f"{anio}_{numeros}0.xls"
+        nuevo_nombre = f"{anio}_{numeros}0{sufijo}.xls"
         
-        print(f"Transformando: {nombre_archivo} -> {nuevo_nombre}")
+        print(f"Transformando: {nombre_original} -> {nuevo_nombre}")
         return nuevo_nombre
     else:
         # print(f"No se pudo transformar: {nombre_archivo}")
         return None
 
-def renombrar_archivos_en_directorio(directorio):
+def renombrar_archivos_en_directorio(directorio, mapa_cnae=None):
     # Obtener la lista de archivos en el directorio
     archivos = os.listdir(directorio)
     
@@ -41,7 +59,7 @@ def renombrar_archivos_en_directorio(directorio):
         
         # Verificar si es un archivo y si cumple con el formato especificado
         if os.path.isfile(ruta_archivo):
-            nuevo_nombre = transformar_nombre_archivo(archivo)
+            nuevo_nombre = transformar_nombre_archivo(archivo, mapa_cnae)
             
             if nuevo_nombre:
                 # Obtener la ruta completa del nuevo nombre de archivo
@@ -51,16 +69,28 @@ def renombrar_archivos_en_directorio(directorio):
                 os.rename(ruta_archivo, nueva_ruta_archivo)
                 print(f"Renombrado: {archivo} -> {nuevo_nombre}")
 
-# Obtener el directorio donde se encuentra este script
-directorio_script = os.path.dirname(os.path.abspath(__file__))
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Renombra las descargas del BdE a AÑO_CNAE.xls")
+    parser.add_argument("--sin-almacen", action="store_true",
+                        help="Renombrar los archivos en el sitio, sin el almacén de descargas "
+                             "(para descargas hechas con --sin-almacen)")
+    args = parser.parse_args()
 
-# Carpeta "downloads" dentro del directorio del script
-directorio_downloads = os.path.join(directorio_script, "downloads")
+    # Obtener el directorio donde se encuentra este script
+    directorio_script = os.path.dirname(os.path.abspath(__file__))
 
-# Verificar si la ruta del directorio es correcta
-if not os.path.exists(directorio_downloads):
-    print(f"El directorio {directorio_downloads} no existe.")
-else:
-    print(f"Buscando archivos en: {directorio_downloads}")
-    # Renombrar archivos en la carpeta "downloads"
-    renombrar_archivos_en_directorio(directorio_downloads)
\ No newline at end of file
+    # Carpeta "downloads" dentro del directorio del script
+    directorio_downloads = os.path.join(directorio_script, "downloads")
+
+    # Verificar si la ruta del directorio es correcta
+    if not os.path.exists(directorio_downloads):
+        print(f"El directorio {directorio_downloads} no existe.")
+    else:
+        print(f"Buscando archivos en: {directorio_downloads}")
+        if args.sin_almacen:
+            renombrar_archivos_en_directorio(directorio_downloads, cargar_mapa_cnae())
+        else:
+            # El descargador ya publica cada archivo con su nombre definitivo en el
+            # almacén de descargas; aquí solo se incorporan los que quedaron sueltos
+            # (con un único archivo vigente por año y CNAE, sin copias duplicadas)
+            AlmacenDescargas(directorio_downloads, cargar_mapa_cnae()).importar_sueltos()
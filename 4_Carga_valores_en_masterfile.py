@@ -15,14 +15,34 @@ Formato de archivos de entrada: YYYY_CCCC.xls (ej: 2023_0100.xls)
 - CCCC: Código CNAE (determina la fila del masterfile)
 """
 
+import argparse
+import hashlib
 import os
+import time
+import numpy as np
 import pandas as pd
 import openpyxl
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import ExitStack
+from functools import partial
 from pathlib import Path
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, List, NamedTuple, Optional, Tuple
 import logging
 
+from sufijos_ejes import hoja_anterior, separar_sufijo
+from catalogo_sectores import cargar_mapa_cnae
+from compact_masterfile import SheetLayout, YearBlock
+from ratio_store import RatioStore
+from ratio_validation import RatioValidator, ValidationReport, YearReference, reference_from_frame
+from run_metrics import PROFILE_MODES, metrics, metrics_report
+
+try:
+    import xlrd
+except ImportError:  # pragma: no cover - xlrd es opcional para el lector ligero
+    xlrd = None
+
 # Configurar logging
 logging.basicConfig(
     level=logging.INFO,
@@ -31,122 +51,509 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+QUARTILES = ('Q1', 'Q2', 'Q3')
+
+# Caché de parseo dentro del directorio de descargas (no coincide con *.xls)
+PARSE_CACHE_FILENAME = ".parse_cache.npz"
+
+# Archivos apartados por la validación e informe de la última validación
+QUARANTINE_DIRNAME = "quarantine"
+VALIDATION_REPORT_FILENAME = "validation_report.json"
+
+
+class RatiosArray(NamedTuple):
+    """
+    Ratios de un archivo del BdE en forma de arrays.
+    
+    codes: códigos de ratio en el orden del archivo, shape (n,)
+    values: cuartiles Q1, Q2, Q3 por fila, shape (n, 3), NaN si falta el valor
+    """
+    codes: np.ndarray
+    values: np.ndarray
+    
+    @classmethod
+    def empty(cls) -> 'RatiosArray':
+        return cls(codes=np.empty(0, dtype=str), values=np.empty((0, 3)))
+    
+    def __len__(self) -> int:
+        return len(self.codes)
+    
+    @classmethod
+    def from_dict(cls, ratios_data: Dict[str, Dict[str, float]]) -> 'RatiosArray':
+        """Construye el array a partir del formato de diccionario (None -> NaN)."""
+        if not ratios_data:
+            return cls.empty()
+        values = [[np.nan if values.get(q) is None else values.get(q) for q in QUARTILES]
+                  for values in ratios_data.values()]
+        return cls(codes=np.array(list(ratios_data.keys())), values=np.array(values, dtype=float))
+    
+    def to_dict(self) -> Dict[str, Dict[str, float]]:
+        """Convierte al formato {ratio_name: {Q1: val, Q2: val, Q3: val}} (None si falta)."""
+        ratios_data = {}
+        for code, row in zip(self.codes.tolist(), self.values.tolist()):
+            ratios_data[code] = {q: (v if v == v else None) for q, v in zip(QUARTILES, row)}
+        return ratios_data
+
+
+class ParseCache:
+    """
+    Caché en disco de los ratios extraídos de cada archivo.
+    
+    Cada entrada se identifica por la ruta del archivo y se valida con su tamaño,
+    su fecha de modificación y el SHA-256 de su contenido: si el tamaño y la fecha
+    coinciden se reutiliza sin leer el archivo; si no, se compara el hash.
+    Se guarda como un único .npz comprimido (sin pickle) mediante un fichero
+    temporal y un rename.
+    """
+    
+    VERSION = 1
+    
+    def __init__(self, path: str, max_entries: Optional[int] = None):
+        """
+        Args:
+            path: Ruta del fichero de caché
+            max_entries: Máximo de archivos en caché; se descartan los usados
+                hace más tiempo (None = sin límite)
+        """
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.entries: Dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+        self._dirty = False
+        self._load()
+    
+    @staticmethod
+    def _key(filepath: Path) -> str:
+        return str(Path(filepath).resolve())
+    
+    @staticmethod
+    def _sha256(filepath: Path) -> str:
+        with open(filepath, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    
+    def _load(self):
+        if not self.path.exists():
+            return
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                if int(data['version']) != self.VERSION:
+                    logger.info("Caché de parseo de otra versión; se descarta")
+                    return
+                offsets = data['offsets']
+                codes = data['codes']
+                values = data['values']
+                for i, key in enumerate(data['keys'].tolist()):
+                    start, end = offsets[i], offsets[i + 1]
+                    self.entries[key] = {
+                        'size': int(data['sizes'][i]),
+                        'mtime_ns': int(data['mtimes'][i]),
+                        'sha256': str(data['hashes'][i]),
+                        'used': float(data['used'][i]),
+                        'ratios': RatiosArray(codes=codes[start:end], values=values[start:end]),
+                    }
+        except Exception as e:
+            logger.warning(f"No se pudo leer la caché de parseo {self.path}: {e}")
+            self.entries = {}
+    
+    def get(self, filepath: Path) -> Optional[RatiosArray]:
+        """Ratios en caché para el archivo, o None si es nuevo o ha cambiado."""
+        entry = self.entries.get(self._key(filepath))
+        if entry is None:
+            self.misses += 1
+            return None
+        
+        stat = os.stat(filepath)
+        if stat.st_size != entry['size']:
+            self.misses += 1
+            return None
+        if stat.st_mtime_ns != entry['mtime_ns']:
+            # Fecha distinta pero quizá el mismo contenido (p. ej. copiado de nuevo)
+            if self._sha256(filepath) != entry['sha256']:
+                self.misses += 1
+                return None
+            entry['mtime_ns'] = stat.st_mtime_ns
+        
+        entry['used'] = time.time()
+        self._dirty = True
+        self.hits += 1
+        return entry['ratios']
+    
+    def put(self, filepath: Path, ratios: RatiosArray):
+        """Guarda en caché los ratios extraídos de un archivo."""
+        stat = os.stat(filepath)
+        self.entries[self._key(filepath)] = {
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+            'sha256': self._sha256(filepath),
+            'used': time.time(),
+            'ratios': ratios,
+        }
+        self._dirty = True
+    
+    def clear(self):
+        """Invalida toda la caché."""
+        self.entries = {}
+        self._dirty = True
+        if self.path.exists():
+            self.path.unlink()
+    
+    def save(self):
+        """Escribe la caché en disco (aplicando el límite de tamaño)."""
+        if not self._dirty:
+            return
+        
+        if self.max_entries is not None and len(self.entries) > self.max_entries:
+            keep = sorted(self.entries, key=lambda k: self.entries[k]['used'], reverse=True)
+            self.entries = {k: self.entries[k] for k in keep[:self.max_entries]}
+        
+        keys = list(self.entries)
+        entries = [self.entries[k] for k in keys]
+        lengths = [len(e['ratios']) for e in entries]
+        codes = [e['ratios'].codes.astype(str) for e in entries]
+        values = [e['ratios'].values for e in entries]
+        
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            np.savez_compressed(
+                f,
+                version=np.array(self.VERSION),
+                keys=np.array(keys, dtype=str),
+                sizes=np.array([e['size'] for e in entries], dtype=np.int64),
+                mtimes=np.array([e['mtime_ns'] for e in entries], dtype=np.int64),
+                hashes=np.array([e['sha256'] for e in entries], dtype=str),
+                used=np.array([e['used'] for e in entries], dtype=float),
+                offsets=np.concatenate([[0], np.cumsum(lengths, dtype=np.int64)]).astype(np.int64),
+                codes=np.concatenate(codes) if codes else np.empty(0, dtype=str),
+                values=np.concatenate(values) if values else np.empty((0, 3)),
+            )
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+        logger.info(f"Caché de parseo guardada: {len(keys)} archivos "
+                    f"({self.hits} aciertos, {self.misses} fallos)")
+
+
+def _to_cell_value(value):
+    """Convierte un valor de pandas/numpy a un valor de celda de openpyxl (NaN -> vacía)."""
+    if value is None or (isinstance(value, float) and value != value):
+        return None
+    if isinstance(value, np.generic):
+        value = value.item()
+        if isinstance(value, float) and value != value:
+            return None
+    return value
+
+
+def _is_int_like(value) -> bool:
+    """Indica si el valor de una celda representa un código CNAE entero."""
+    try:
+        return float(value) == int(float(value))
+    except (TypeError, ValueError):
+        return False
+
+
+def _cell_value(cell):
+    """Valor de una celda de xlrd tal como lo entrega pandas (texto, número o NaN)."""
+    if cell.ctype in (xlrd.XL_CELL_NUMBER, xlrd.XL_CELL_BOOLEAN):
+        return float(cell.value)
+    if cell.ctype == xlrd.XL_CELL_TEXT:
+        return cell.value
+    # Vacías, errores y fechas (pandas las lee como NaN o datetime, que no son numéricos)
+    return np.nan
+
+
+def _quartile_values(block) -> np.ndarray:
+    """Q1-Q3 de las filas de ratios (filas, 3), con la misma conversión en ambos lectores."""
+    block = np.asarray(block, dtype=object).reshape(-1, 3)
+    return pd.to_numeric(block.ravel(), errors='coerce').astype(float).reshape(-1, 3)
+
+
 class MasterfileLoader:
     """Clase para cargar valores de ratios en el masterfile."""
     
-    def __init__(self, downloads_dir: str = "downloads", masterfile_path: str = "CNAE masterfile.xlsx"):
+    def __init__(self, downloads_dir: str = "downloads", masterfile_path: str = "CNAE masterfile.xlsx",
+                 reader: str = "xlrd", cache: Optional['ParseCache'] = None,
+                 write_mode: str = "rewrite", store: Optional[RatioStore] = None,
+                 sector_map: Optional[Dict[str, str]] = None,
+                 validator: Optional[RatioValidator] = None, quarantine: bool = False,
+                 validation_report: Optional[str] = None):
         """
         Inicializa el cargador de masterfile.
         
         Args:
             downloads_dir: Directorio con los archivos descargados
             masterfile_path: Ruta al archivo masterfile
+            reader: Lector de los archivos del BdE: "xlrd" (lector ligero, con
+                pandas como respaldo si el formato no coincide) o "pandas"
+            cache: Caché de parseo en disco (None para parsear siempre)
+            write_mode: "rewrite" reescribe todas las hojas al guardar;
+                "incremental" solo modifica las celdas cambiadas en el libro existente
+            store: Almacén de ratios (ratio_store.RatioStore). Si se indica, los
+                ratios se guardan en él y el masterfile .xlsx solo se genera bajo
+                demanda con export_masterfile
+            sector_map: Mapa valor del desplegable -> CNAE del catálogo de
+                sectores (catalogo_sectores.py); permite leer archivos con el
+                nombre original del BdE sin renombrarlos antes
+            validator: Validación de los ratios parseados antes de cargarlos
+                (ratio_validation.RatioValidator); None para no validar
+            quarantine: Mover los archivos que no pasan la validación a
+                downloads/quarantine/. Por defecto solo se excluyen de la carga y
+                se quedan en downloads/, porque los umbrales aún no están calibrados
+            validation_report: Ruta del informe JSON de la validación (None para no guardarlo)
         """
+        if reader not in ("xlrd", "pandas"):
+            raise ValueError(f"Lector no soportado: {reader}")
+        if write_mode not in ("rewrite", "incremental"):
+            raise ValueError(f"Modo de escritura no soportado: {write_mode}")
         self.downloads_dir = Path(downloads_dir)
         self.masterfile_path = Path(masterfile_path)
-        self.masterfile_data = {}  # Diccionario para almacenar datos por año
+        self.reader = reader
+        self.cache = cache
+        self.write_mode = write_mode
+        self.store = store
+        self.sector_map = sector_map or {}
+        self.validator = validator
+        self.quarantine = quarantine
+        self.validation_report = validation_report
+        # Celdas modificadas desde el último guardado: {hoja: {cnae: {columnas}}}
+        self.changed_cells: Dict[str, Dict[int, set]] = {}
+        # Hojas del libro en disco (cargadas o no) y plantilla para hojas nuevas
+        self.sheet_names: List[str] = []
+        self._template: Optional[YearBlock] = None
+        # Hojas cargadas en formato compacto (CNAE int16 + bloque float64 por año)
+        # con las columnas R##_Qn compartidas en un único layout
+        self.layout = SheetLayout()
+        self.masterfile_data: Dict[str, YearBlock] = {}
+        # Hojas leídas solo como referencia de la validación (no se guardan)
+        self.reference_data: Dict[str, YearBlock] = {}
         
     def parse_filename(self, filename: str) -> Tuple[str, str]:
         """
         Extrae el año y el código CNAE del nombre del archivo.
         
+        Las descargas de otro tamaño o país (sufijos_ejes) llevan un sufijo
+        (2023_0100_d2_Portugal.xls) que pasa al año: sus valores van a la hoja
+        "2023_d2_Portugal" en lugar de a la hoja "2023".
+        
         Args:
-            filename: Nombre del archivo (ej: 2023_0100.xls)
+            filename: Nombre del archivo (ej: 2023_0100.xls, o 2023_A01_b_20251119.xls
+                si el sector está en sector_map)
             
         Returns:
-            Tupla (año, cnae) o (None, None) si no coincide con el patrón
+            Tupla (año u hoja, cnae) o (None, None) si no coincide con el patrón
         """
+        filename, suffix = separar_sufijo(filename)
         pattern = r'^(\d{4})_(\d{4})\.xls$'
         match = re.match(pattern, filename)
         
         if match:
             year = match.group(1)
             cnae = match.group(2)
-            return year, cnae
+            return year + suffix, cnae
+        
+        # Nombre original del BdE: YYYY_<sector>_b_<fecha>.xls
+        parts = filename.split("_")
+        if (len(parts) == 4 and parts[2] == "b" and parts[3].endswith(".xls")
+                and parts[0].isdigit() and parts[1] in self.sector_map):
+            return parts[0] + suffix, self.sector_map[parts[1]]
         
         return None, None
     
-    def extract_ratios_from_file(self, filepath: Path) -> Dict[str, float]:
+    def extract_ratios_array(self, filepath: Path) -> Optional[RatiosArray]:
         """
-        Extrae los valores de los ratios de un archivo .xls del BdE.
+        Extrae los ratios de un archivo .xls del BdE con operaciones vectorizadas.
+        
+        Localiza la fila "Ratio", filtra los códigos R##/T# con una máscara sobre
+        la columna 0 y convierte las columnas 3-5 (Q1, Q2, Q3) a numérico de una vez.
         
         Args:
             filepath: Ruta al archivo .xls
             
         Returns:
-            Diccionario con los ratios y sus valores {ratio_name: {Q1: val, Q2: val, Q3: val}}
+            RatiosArray con los ratios del archivo, o None si no se pudo leer
         """
+        if self.reader == "xlrd":
+            ratios = self._read_ratios_xlrd(filepath)
+            if ratios is not None:
+                return ratios
+            logger.debug(f"{filepath.name} no tiene el formato esperado; se lee con pandas")
+        
         try:
             # Leer el archivo sin encabezado
             df = pd.read_excel(filepath, header=None)
+            return self._ratios_from_frame(df, filepath.name)
+        except Exception as e:
+            logger.error(f"Error leyendo archivo {filepath.name}: {e}")
+            return None
+    
+    def _read_ratios_xlrd(self, filepath: Path) -> Optional[RatiosArray]:
+        """
+        Lector ligero para el formato de ratios del BdE que no pasa por pandas.
+        
+        Abre el libro con xlrd bajo demanda (solo la primera hoja) y lee las
+        columnas 0, 3, 4 y 5 de las filas posteriores a "Ratio" cuya columna 0 es
+        un código R##/T#, con las mismas reglas que _ratios_from_frame (las demás
+        filas se saltan y los valores se convierten con pd.to_numeric).
+        
+        Returns:
+            RatiosArray, o None si el archivo no es un .xls con el formato esperado
+        """
+        if xlrd is None or filepath.suffix.lower() != '.xls':
+            return None
+        
+        try:
+            book = xlrd.open_workbook(str(filepath), on_demand=True)
+        except Exception:
+            return None
+        
+        try:
+            sheet = book.sheet_by_index(0)
+            if sheet.ncols < 6:
+                return None
             
-            ratios_data = {}
+            col0 = sheet.col_values(0)
+            start = next((idx + 1 for idx, label in enumerate(col0)
+                          if isinstance(label, str) and label.strip() == 'Ratio'), None)
+            if start is None:
+                return None
             
-            # Buscar la fila donde están los ratios (columna 0 contiene el código del ratio)
-            # Los ratios empiezan después de la fila que contiene "Ratio"
-            ratio_start_idx = None
-            for idx, row in df.iterrows():
-                if pd.notna(row[0]) and str(row[0]).strip() == 'Ratio':
-                    ratio_start_idx = idx + 1
-                    break
+            codes = []
+            rows = []
+            for idx in range(start, sheet.nrows):
+                code = str(col0[idx]).strip()
+                if not code.startswith(('R', 'T')):
+                    continue
+                codes.append(code)
+                rows.append([_cell_value(sheet.cell(idx, col)) for col in (3, 4, 5)])
             
-            if ratio_start_idx is None:
-                logger.warning(f"No se encontró la sección de ratios en {filepath.name}")
-                return ratios_data
+            if not codes:
+                return None
+            return RatiosArray(codes=np.array(codes), values=_quartile_values(rows))
+        except Exception:
+            return None
+        finally:
+            book.release_resources()
+    
+    def _ratios_from_frame(self, df: pd.DataFrame, filename: str) -> RatiosArray:
+        """Extrae los ratios de la hoja ya leída (ver extract_ratios_array)."""
+        if df.empty or 0 not in df.columns:
+            logger.warning(f"No se encontró la sección de ratios en {filename}")
+            return RatiosArray.empty()
+        
+        # Buscar la fila donde están los ratios (columna 0 contiene el código del ratio)
+        # Los ratios empiezan después de la fila que contiene "Ratio"
+        col0 = df[0].to_numpy(dtype=object)
+        present = ~pd.isna(col0)
+        labels = np.char.strip(col0.astype(str))
+        header_rows = np.flatnonzero(present & (labels == 'Ratio'))
+        
+        if len(header_rows) == 0:
+            logger.warning(f"No se encontró la sección de ratios en {filename}")
+            return RatiosArray.empty()
+        
+        # Códigos de ratio válidos (R## o T#) a partir de la fila siguiente a "Ratio"
+        mask = present & (np.char.startswith(labels, 'R') | np.char.startswith(labels, 'T'))
+        mask[:header_rows[0] + 1] = False
+        
+        if not mask.any():
+            return RatiosArray.empty()
+        
+        # Las columnas 3, 4, 5 contienen Q1, Q2, Q3 respectivamente
+        # (después de la columna de número de empresas)
+        if not all(col in df.columns for col in (3, 4, 5)):
+            logger.warning(f"Error extrayendo valores en {filename}: faltan las columnas Q1-Q3")
+            return RatiosArray.empty()
+        
+        block = np.column_stack([df[col].to_numpy(dtype=object)[mask] for col in (3, 4, 5)])
+        return RatiosArray(codes=labels[mask], values=_quartile_values(block))
+    
+    def timed_extract(self, filepath: Path) -> Tuple[Optional[RatiosArray], float]:
+        """extract_ratios_array y su duración en segundos."""
+        start = time.perf_counter()
+        ratios = self.extract_ratios_array(filepath)
+        return ratios, time.perf_counter() - start
+    
+    def extract_ratios_from_file(self, filepath: Path) -> Dict[str, Dict[str, float]]:
+        """
+        Extrae los valores de los ratios de un archivo .xls del BdE.
+        
+        Args:
+            filepath: Ruta al archivo .xls
             
-            # Extraer los ratios (R01, R02, etc. y T1)
-            for idx in range(ratio_start_idx, len(df)):
-                row = df.iloc[idx]
+        Returns:
+            Diccionario con los ratios y sus valores {ratio_name: {Q1: val, Q2: val, Q3: val}}
+        """
+        ratios = self.extract_ratios_array(filepath)
+        return ratios.to_dict() if ratios is not None else {}
+    
+    def load_masterfile(self, years: Optional[set] = None, reference_years: Optional[set] = None):
+        """
+        Carga el archivo masterfile en memoria.
+        
+        El libro se abre una sola vez. Si se indican años, solo se cargan sus
+        hojas; el resto no se lee y se conserva tal cual al guardar.
+        
+        Args:
+            years: Años (nombres de hoja) a cargar, o None para cargar todas las hojas
+            reference_years: Años que solo se leen como referencia de la validación
+                (en reference_data; no se modifican ni se vuelven a escribir)
+        """
+        try:
+            with pd.ExcelFile(self.masterfile_path) as xl_file:
+                self.sheet_names = list(xl_file.sheet_names)
                 
-                # La columna 0 contiene el código del ratio (R01, R02, etc.)
-                ratio_code = row[0]
+                selected = [name for name in self.sheet_names if years is None or name in years]
+                for sheet_name in selected:
+                    block = YearBlock.from_frame(xl_file.parse(sheet_name), self.layout, sheet_name)
+                    self.masterfile_data[sheet_name] = block
+                    logger.info(f"Cargada hoja '{sheet_name}' con {len(block)} filas")
                 
-                if pd.isna(ratio_code):
-                    continue
+                for sheet_name in self.sheet_names:
+                    if sheet_name in (reference_years or ()) and sheet_name not in self.masterfile_data:
+                        self.reference_data[sheet_name] = YearBlock.from_frame(xl_file.parse(sheet_name),
+                                                                               self.layout, sheet_name)
                 
-                ratio_code = str(ratio_code).strip()
+                skipped = len(self.sheet_names) - len(selected)
+                if skipped:
+                    logger.info(f"{skipped} hojas no necesarias se conservan sin cargar")
                 
-                # Verificar si es un código de ratio válido (R## o T#)
-                if not (ratio_code.startswith('R') or ratio_code.startswith('T')):
-                    continue
+                # Plantilla de columnas para crear hojas de años nuevos
+                if not self.masterfile_data and self.sheet_names:
+                    self._template = YearBlock.from_frame(xl_file.parse(self.sheet_names[0], nrows=0),
+                                                          self.layout)
                 
-                # Las columnas 3, 4, 5 contienen Q1, Q2, Q3 respectivamente
-                # (después de la columna de número de empresas)
-                try:
-                    q1 = pd.to_numeric(row[3], errors='coerce')
-                    q2 = pd.to_numeric(row[4], errors='coerce')
-                    q3 = pd.to_numeric(row[5], errors='coerce')
-                    
-                    ratios_data[ratio_code] = {
-                        'Q1': q1 if pd.notna(q1) else None,
-                        'Q2': q2 if pd.notna(q2) else None,
-                        'Q3': q3 if pd.notna(q3) else None
-                    }
-                except Exception as e:
-                    logger.warning(f"Error extrayendo valores para {ratio_code} en {filepath.name}: {e}")
-                    continue
-            
-            return ratios_data
-            
-        except Exception as e:
-            logger.error(f"Error leyendo archivo {filepath.name}: {e}")
-            return {}
-    
-    def load_masterfile(self):
-        """Carga el archivo masterfile en memoria."""
-        try:
-            # Leer todas las hojas del masterfile
-            xl_file = pd.ExcelFile(self.masterfile_path)
-            
-            for sheet_name in xl_file.sheet_names:
-                df = pd.read_excel(self.masterfile_path, sheet_name=sheet_name)
-                self.masterfile_data[sheet_name] = df
-                logger.info(f"Cargada hoja '{sheet_name}' con {len(df)} filas")
+                if self.masterfile_data:
+                    logger.info(f"Masterfile en memoria: {self.memory_bytes() / 1e6:.1f} MB")
                 
         except Exception as e:
             logger.error(f"Error cargando masterfile: {e}")
             raise
     
+    def memory_bytes(self) -> int:
+        """Memoria ocupada por las hojas cargadas."""
+        return sum(block.nbytes for block in self.masterfile_data.values())
+    
+    def sheet_frame(self, year: str) -> Optional[pd.DataFrame]:
+        """Hoja cargada como DataFrame con el formato del masterfile (None si no está cargada)."""
+        block = self.masterfile_data.get(year)
+        return block.to_frame() if block is not None else None
+    
+    def _get_year_sheet(self, year: str) -> Optional[YearBlock]:
+        """Devuelve la hoja del año, creándola con las columnas de la primera si no existe."""
+        # Verificar si existe la hoja para ese año
+        if year not in self.masterfile_data:
+            logger.warning(f"No existe la hoja '{year}' en el masterfile. Creando nueva hoja...")
+            # Crear una nueva hoja vacía con la estructura de una existente
+            if self.masterfile_data or self._template is not None:
+                template = next(iter(self.masterfile_data.values()), self._template)
+                self.masterfile_data[year] = YearBlock.empty_like(template)
+            else:
+                logger.error("No hay hojas en el masterfile para usar como plantilla")
+                return None
+        
+        return self.masterfile_data[year]
+    
     def update_masterfile_row(self, year: str, cnae: str, ratios_data: Dict[str, Dict[str, float]]):
         """
         Actualiza una fila del masterfile con los datos de ratios.
@@ -156,71 +563,421 @@ class MasterfileLoader:
             cnae: Código CNAE (identifica la fila)
             ratios_data: Diccionario con los ratios y sus valores
         """
-        # Verificar si existe la hoja para ese año
-        if year not in self.masterfile_data:
-            logger.warning(f"No existe la hoja '{year}' en el masterfile. Creando nueva hoja...")
-            # Crear una nueva hoja basada en la estructura de una existente
-            if self.masterfile_data:
-                template_df = list(self.masterfile_data.values())[0].copy()
-                template_df = template_df.iloc[:0]  # Vaciar datos pero mantener columnas
-                self.masterfile_data[year] = template_df
-            else:
-                logger.error("No hay hojas en el masterfile para usar como plantilla")
-                return
-        
-        df = self.masterfile_data[year]
-        
-        # Convertir CNAE a entero para comparación
-        cnae_int = int(cnae)
+        self.update_masterfile_batch([(year, cnae, ratios_data)])
+    
+    def update_masterfile_batch(self, parsed_files: List[Tuple[str, str, object]]) -> List[int]:
+        """
+        Actualiza el masterfile con los ratios de muchos archivos a la vez.
         
-        # Buscar la fila correspondiente al CNAE
-        row_idx = df[df['CNAE'] == cnae_int].index
+        Por cada año, los ratios se pasan a formato largo (fila, columna, valor) y
+        se escriben en el bloque float64 de la hoja con una sola asignación
+        indexada; las filas de CNAE nuevos se añaden de una vez. Si varios
+        archivos traen el mismo CNAE y año, prevalece el último valor no vacío,
+        como al actualizar fila a fila.
         
-        if len(row_idx) == 0:
-            # Si no existe la fila, agregarla
-            logger.info(f"Agregando nueva fila para CNAE {cnae} en año {year}")
-            new_row = {'CNAE': cnae_int}
-            df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
-            row_idx = [len(df) - 1]
-            self.masterfile_data[year] = df
+        Args:
+            parsed_files: Lista de (año, cnae, ratios) con ratios como RatiosArray
+                o como diccionario {ratio_name: {Q1: val, Q2: val, Q3: val}}
+            
+        Returns:
+            Número de valores actualizados por archivo, en el orden de entrada
+        """
+        counts = [0] * len(parsed_files)
         
-        row_idx = row_idx[0]
+        by_year: Dict[str, List[int]] = {}
+        for i, (year, _, _) in enumerate(parsed_files):
+            by_year.setdefault(year, []).append(i)
         
-        # Actualizar los valores de los ratios
-        updated_count = 0
-        for ratio_code, values in ratios_data.items():
-            for quartile in ['Q1', 'Q2', 'Q3']:
-                col_name = f"{ratio_code}_{quartile}"
+        for year, indices in by_year.items():
+            block = self._get_year_sheet(year)
+            if block is None:
+                continue
+            
+            # Formato largo: una fila por (archivo, columna, valor)
+            file_idx, cnaes, columns, values = [], [], [], []
+            for i in indices:
+                _, cnae, ratios = parsed_files[i]
+                if isinstance(ratios, dict):
+                    ratios = RatiosArray.from_dict(ratios)
+                n = len(ratios)
+                file_idx.append(np.full(n * 3, i))
+                cnaes.append(np.full(n * 3, int(cnae)))
+                columns.append(np.char.add(np.repeat(ratios.codes.astype(str), 3),
+                                           np.tile(np.array(['_Q1', '_Q2', '_Q3']), n)))
+                values.append(ratios.values.ravel())
+            file_idx = np.concatenate(file_idx)
+            cnaes = np.concatenate(cnaes)
+            columns = np.concatenate(columns)
+            values = np.concatenate(values).astype(float)
+            
+            # Solo las columnas que tiene la hoja
+            col_pos = self.layout.positions(columns)
+            known = col_pos >= 0
+            known[known] = block.present[col_pos[known]]
+            for col_name in np.unique(columns[~known]).tolist():
+                logger.debug(f"Columna {col_name} no existe en el masterfile")
+            keep = known & ~np.isnan(values)
+            file_idx, cnaes, columns, col_pos, values = (
+                file_idx[keep], cnaes[keep], columns[keep], col_pos[keep], values[keep])
+            
+            for i, n in zip(*np.unique(file_idx, return_counts=True)):
+                counts[int(i)] = int(n)
+            
+            # Añadir de una vez las filas de los CNAE que no existen
+            requested = list(dict.fromkeys(int(parsed_files[i][1]) for i in indices))
+            _, new_cnaes = block.rows_for(requested)
+            for cnae_int in new_cnaes:
+                logger.info(f"Agregando nueva fila para CNAE {cnae_int:04d} en año {year}")
+            
+            changed = self.changed_cells.setdefault(year, {})
+            if len(values):
+                # Aplicar todos los valores con una sola asignación indexada;
+                # el último archivo gana en cada celda
+                rows, _ = block.rows_for(cnaes.tolist())
+                flat = rows * len(self.layout) + col_pos
+                _, last = np.unique(flat[::-1], return_index=True)
+                last = len(flat) - 1 - last
+                new_values = values[last].astype(block.values.dtype)
+                old_values = block.values[rows[last], col_pos[last]]
+                block.values[rows[last], col_pos[last]] = new_values
                 
-                if col_name in df.columns:
-                    value = values.get(quartile)
-                    if value is not None:
-                        df.at[row_idx, col_name] = value
-                        updated_count += 1
-                else:
-                    logger.debug(f"Columna {col_name} no existe en el masterfile")
+                # Para el guardado incremental, solo las celdas cuyo valor cambia
+                differs = ~(old_values == new_values)
+                for cnae_int, col_name in zip(cnaes[last][differs].tolist(), columns[last][differs].tolist()):
+                    changed.setdefault(cnae_int, set()).add(col_name)
+            for cnae_int in new_cnaes:
+                changed.setdefault(cnae_int, set()).add('CNAE')
+            if not changed:
+                del self.changed_cells[year]
+            
+            for i in indices:
+                logger.info(f"Actualizados {counts[i]} valores para CNAE {parsed_files[i][1]} en año {year}")
         
-        self.masterfile_data[year] = df
-        logger.info(f"Actualizados {updated_count} valores para CNAE {cnae} en año {year}")
+        return counts
     
     def save_masterfile(self):
-        """Guarda el masterfile actualizado."""
+        """
+        Guarda el masterfile actualizado.
+        
+        Con write_mode="rewrite" se reescriben todas las hojas (ordenadas por CNAE);
+        con write_mode="incremental" solo se modifican las celdas cambiadas en el
+        libro existente (ver _save_incremental). En ambos casos se escribe en un
+        fichero temporal que después sustituye al masterfile.
+        """
+        if self.write_mode == "incremental" and self.masterfile_path.exists() and not self.changed_cells:
+            logger.info("No hay celdas cambiadas; el masterfile no se modifica")
+            return
+        
+        tmp_path = self.masterfile_path.with_name(f".{self.masterfile_path.name}.tmp")
         try:
-            with pd.ExcelWriter(self.masterfile_path, engine='openpyxl') as writer:
-                for sheet_name, df in self.masterfile_data.items():
-                    # Ordenar por CNAE antes de guardar
-                    df = df.sort_values('CNAE').reset_index(drop=True)
-                    df.to_excel(writer, sheet_name=sheet_name, index=False)
-                    logger.info(f"Guardada hoja '{sheet_name}' con {len(df)} filas")
+            unloaded = [name for name in self.sheet_names if name not in self.masterfile_data]
+            if self.write_mode == "incremental" and self.masterfile_path.exists():
+                self._save_incremental(tmp_path)
+            elif unloaded and self.masterfile_path.exists():
+                self._save_loaded_sheets(tmp_path)
+            else:
+                with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
+                    for sheet_name, block in self.masterfile_data.items():
+                        # Ordenadas por CNAE
+                        df = block.to_frame()
+                        df.to_excel(writer, sheet_name=sheet_name, index=False)
+                        logger.info(f"Guardada hoja '{sheet_name}' con {len(df)} filas")
             
+            os.replace(tmp_path, self.masterfile_path)
+            self.changed_cells = {}
             logger.info(f"Masterfile guardado exitosamente en {self.masterfile_path}")
             
         except Exception as e:
+            if tmp_path.exists():
+                tmp_path.unlink()
             logger.error(f"Error guardando masterfile: {e}")
             raise
     
-    def process_all_files(self):
-        """Procesa todos los archivos del directorio downloads."""
+    def _save_loaded_sheets(self, output_path: Path):
+        """
+        Reescribe solo las hojas cargadas en memoria y deja intactas las demás.
+        
+        Se usa cuando load_masterfile cargó únicamente algunos años.
+        """
+        wb = openpyxl.load_workbook(self.masterfile_path)
+        
+        for sheet_name, block in self.masterfile_data.items():
+            # Ordenadas por CNAE
+            df = block.to_frame()
+            
+            if sheet_name in wb.sheetnames:
+                position = wb.sheetnames.index(sheet_name)
+                wb.remove(wb[sheet_name])
+                ws = wb.create_sheet(sheet_name, position)
+            else:
+                ws = wb.create_sheet(sheet_name)
+            
+            ws.append(list(df.columns))
+            for row in df.itertuples(index=False):
+                ws.append([_to_cell_value(v) for v in row])
+            logger.info(f"Guardada hoja '{sheet_name}' con {len(df)} filas")
+        
+        wb.save(output_path)
+    
+    def _save_incremental(self, output_path: Path):
+        """
+        Aplica al libro existente solo las celdas cambiadas por update_masterfile_batch.
+        
+        Conserva formatos, fórmulas y hojas adicionales. Las filas de CNAE nuevos
+        se añaden al final de su hoja, ordenadas entre sí por CNAE pero no
+        intercaladas con las existentes: insertar filas desplazaría las celdas sin
+        ajustar las fórmulas que las referencian. El modo "rewrite" deja la hoja
+        entera ordenada. Los años nuevos se crean como hojas nuevas.
+        """
+        wb = openpyxl.load_workbook(self.masterfile_path)
+        
+        def write_sheet(sheet_name, block, index=None):
+            ws = wb.create_sheet(sheet_name, index)
+            df = block.to_frame()
+            ws.append(list(df.columns))
+            for row in df.itertuples(index=False):
+                ws.append([_to_cell_value(v) for v in row])
+            logger.info(f"Creada hoja '{sheet_name}' con {len(df)} filas")
+        
+        for sheet_name, cells in self.changed_cells.items():
+            block = self.masterfile_data[sheet_name]
+            
+            if sheet_name not in wb.sheetnames:
+                write_sheet(sheet_name, block)
+                continue
+            
+            ws = wb[sheet_name]
+            header = {cell.value: cell.column for cell in ws[1] if cell.value is not None}
+            if 'CNAE' not in header:
+                # Sin columna CNAE no se pueden localizar las filas: se reescribe la hoja entera
+                logger.warning(f"La hoja '{sheet_name}' no tiene columna CNAE; se reescribe completa")
+                index = wb.sheetnames.index(sheet_name)
+                wb.remove(ws)
+                write_sheet(sheet_name, block, index)
+                continue
+            cnae_col = header['CNAE']
+            sheet_rows = {}
+            for row_idx, (value,) in enumerate(
+                    ws.iter_rows(min_row=2, min_col=cnae_col, max_col=cnae_col, values_only=True),
+                    start=2):
+                if value is not None and _is_int_like(value):
+                    sheet_rows.setdefault(int(value), row_idx)
+            
+            written = 0
+            appended = 0
+            for cnae_int, columns in sorted(cells.items()):
+                row_idx = sheet_rows.get(cnae_int)
+                if row_idx is None:
+                    row_idx = ws.max_row + 1
+                    ws.cell(row=row_idx, column=cnae_col, value=cnae_int)
+                    sheet_rows[cnae_int] = row_idx
+                    appended += 1
+                
+                for col_name in sorted(columns):
+                    if col_name not in header:
+                        header[col_name] = ws.max_column + 1
+                        ws.cell(row=1, column=header[col_name], value=col_name)
+                    value = cnae_int if col_name == 'CNAE' else block.value(cnae_int, col_name)
+                    ws.cell(row=row_idx, column=header[col_name], value=value)
+                    written += 1
+            
+            logger.info(f"Hoja '{sheet_name}': {written} celdas actualizadas, {appended} filas nuevas")
+        
+        wb.save(output_path)
+    
+    def _load_target(self, years: set):
+        """Carga las hojas del masterfile necesarias (con almacén no hace falta leerlo)."""
+        if self.store is None:
+            # Con validación, también el año anterior de cada uno (solo como referencia)
+            previous = {hoja_anterior(year) for year in years} - years if self.validator else None
+            with metrics.timer("masterfile.load"):
+                self.load_masterfile(years, reference_years=previous)
+    
+    def _validation_reference(self, years: set, suffix: str = "") -> Dict[int, YearReference]:
+        """Valores ya cargados de los años indicados (hojas año + sufijo), para comparar con el año siguiente."""
+        reference = {}
+        codes = self.validator.expected_codes
+        columns = [f"{code}_{q}" for code in codes for q in QUARTILES]
+        stored_years = set(self.store.years()) if self.store is not None and not suffix else set()
+        for year in years:
+            sheet = f"{year}{suffix}"
+            block = self.masterfile_data.get(sheet, self.reference_data.get(sheet))
+            if block is not None:
+                positions = self.layout.positions(columns)
+                values = np.full((len(block), len(columns)), np.nan)
+                found = positions >= 0
+                found[found] = block.present[positions[found]]
+                values[:, found] = block.values[:, positions[found]]
+                reference[year] = YearReference(block.cnae.astype(np.int64),
+                                                values.reshape(len(block), len(codes), len(QUARTILES)))
+            elif year in stored_years:
+                reference[year] = reference_from_frame(self.store.year_frame(year), codes)
+        return reference
+    
+    def validate_parsed(self, entries: List[Tuple[Path, str, str, object]]) -> List[Tuple[Path, str, str, object]]:
+        """
+        Valida los ratios parseados (ratio_validation) y excluye los archivos en cuarentena.
+        
+        Args:
+            entries: Lista de (filepath, year, cnae, ratios), con ratios como
+                RatiosArray o diccionario
+        
+        Returns:
+            Las entradas que se pueden cargar, en el mismo orden
+        """
+        if self.validator is None or not entries:
+            return entries
+        
+        with metrics.timer("validation"):
+            ratios = [r if isinstance(r, RatiosArray) else RatiosArray.from_dict(r) for _, _, _, r in entries]
+            # Cada tamaño o país (sufijo de la hoja tras los 4 dígitos del año) se
+            # valida por separado: otra distribución y otra hoja del año anterior
+            groups: Dict[str, List[int]] = {}
+            for i, (_, sheet, _, _) in enumerate(entries):
+                groups.setdefault(sheet[4:], []).append(i)
+            reports = []
+            for suffix, rows in groups.items():
+                years = [int(entries[i][1][:4]) for i in rows]
+                reference = self._validation_reference({year - 1 for year in years}, suffix)
+                reports.append(self.validator.validate([entries[i][0].name for i in rows], years,
+                                                       [entries[i][2] for i in rows],
+                                                       [ratios[i] for i in rows], reference))
+            report = ValidationReport.merge(reports)
+        metrics.count("validation.issues", len(report.issues))
+        metrics.count("validation.quarantined", len(report.quarantined))
+        if self.validation_report:
+            report.save(self.validation_report)
+        
+        rejected = set(report.quarantined)
+        for summary in report.files:
+            if summary['quarantined']:
+                logger.warning(f"Validación: {summary['file']} no se carga ({', '.join(summary['reasons'])}; "
+                               f"cobertura {summary['coverage']:.0%}, {summary['order_violations']} "
+                               f"cuartiles desordenados, {summary['yoy_outliers']}/{summary['yoy_compared']} "
+                               f"saltos interanuales atípicos)")
+        logger.info(f"Validación: {len(entries)} archivos, {len(report.issues)} incidencias, "
+                    f"{len(rejected)} rechazados")
+        
+        if rejected and self.quarantine:
+            quarantine_dir = self.downloads_dir / QUARANTINE_DIRNAME
+            quarantine_dir.mkdir(parents=True, exist_ok=True)
+            for filepath, _, _, _ in entries:
+                if filepath.name in rejected and filepath.exists():
+                    os.replace(filepath, quarantine_dir / filepath.name)
+            logger.info(f"Archivos en cuarentena movidos a {quarantine_dir}")
+        
+        return [entry for entry in entries if entry[0].name not in rejected]
+    
+    def export_masterfile(self, years: Optional[set] = None):
+        """Genera el masterfile .xlsx a partir del almacén de ratios."""
+        if self.store is None:
+            raise ValueError("export_masterfile requiere un almacén de ratios")
+        self.store.export_xlsx(self.masterfile_path, years=years)
+    
+    def _iter_parsed(self, entries: List[Tuple[Path, str, str]], workers: int):
+        """
+        Parsea los archivos y devuelve (filepath, year, cnae, ratios) en el orden de entrada.
+        
+        Los archivos sin cambios desde la última ejecución se sirven desde la caché
+        de parseo (si está activada) y solo se parsean los nuevos o modificados.
+        Con workers > 1 el parseo se reparte en un pool de procesos y el masterfile
+        se carga en el proceso principal mientras tanto. Los resultados llegan en
+        el mismo orden que `entries`, sea cual sea el orden en que terminen.
+        
+        El pool usa siempre procesos "fork": este script se carga también con
+        scripts_bde.cargar_script con un nombre de módulo que un proceso "spawn"
+        no sabría importar. Donde no hay fork (Windows) se parsea en serie.
+        """
+        cached = {}
+        if self.cache is not None:
+            for filepath, _, _ in entries:
+                ratios = self.cache.get(filepath)
+                if ratios is not None:
+                    cached[filepath] = ratios
+            logger.info(f"Caché de parseo: {len(cached)} archivos sin cambios, "
+                        f"{len(entries) - len(cached)} por parsear")
+            metrics.count("parse.cache_hits", len(cached))
+            metrics.count("parse.cache_misses", len(entries) - len(cached))
+        misses = [filepath for filepath, _, _ in entries if filepath not in cached]
+        years = {year for _, year, _ in entries}
+        
+        if workers > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            logger.warning("Este sistema no permite procesos fork; se parsea en serie")
+            workers = 1
+        
+        with ExitStack() as stack:
+            if workers <= 1 or len(misses) <= 1:
+                self._load_target(years)
+                results = (self.timed_extract(filepath) for filepath in misses)
+            else:
+                workers = min(workers, len(misses))
+                logger.info(f"Parseando {len(misses)} archivos con {workers} procesos")
+                chunksize = max(1, len(misses) // (workers * 4))
+                executor = stack.enter_context(ProcessPoolExecutor(
+                    max_workers=workers, mp_context=multiprocessing.get_context("fork")))
+                results = executor.map(partial(_extract_ratios_worker, self.reader), misses,
+                                       chunksize=chunksize)
+                self._load_target(years)
+            
+            for filepath, year, cnae in entries:
+                logger.info(f"Procesando {filepath.name} -> Año: {year}, CNAE: {cnae}")
+                if filepath in cached:
+                    yield filepath, year, cnae, cached[filepath]
+                    continue
+                
+                ratios, elapsed = next(results)
+                metrics.observe("parse.file", elapsed, file=filepath.name)
+                if ratios is not None and self.cache is not None:
+                    self.cache.put(filepath, ratios)
+                yield filepath, year, cnae, ratios
+    
+    def extract_cached(self, filepath: Path) -> Optional[RatiosArray]:
+        """
+        Ratios de un archivo suelto desde la caché de parseo o, si es nuevo o ha
+        cambiado, parseándolo y guardándolo en ella (para quien recibe los
+        archivos de uno en uno, como el pipeline).
+        """
+        if self.cache is not None:
+            ratios = self.cache.get(filepath)
+            metrics.count("parse.cache_hits" if ratios is not None else "parse.cache_misses")
+            if ratios is not None:
+                return ratios
+        ratios, elapsed = self.timed_extract(filepath)
+        metrics.observe("parse.file", elapsed, file=filepath.name)
+        if ratios is not None and self.cache is not None:
+            self.cache.put(filepath, ratios)
+        return ratios
+    
+    def check_store_entries(self, entries: List[Tuple[Path, str, str]]) -> bool:
+        """
+        Comprueba que el almacén admite todos los archivos (solo tiene el tamaño y
+        país por defecto: hojas con el año sin sufijo).
+        
+        Returns:
+            False, tras explicar el motivo, si con almacén hay archivos con sufijo
+        """
+        if self.store is None:
+            return True
+        suffixed = [filepath.name for filepath, year, _ in entries if not year.isdigit()]
+        if suffixed:
+            logger.error(f"--store no admite descargas de otros tamaños o países: hay {len(suffixed)} "
+                         f"archivos con sufijo _d<dimension>_<país> (p. ej. {suffixed[0]}). Cárgalos "
+                         f"en el masterfile .xlsx sin --store o sácalos de {self.downloads_dir}")
+            return False
+        return True
+    
+    def process_all_files(self, workers: int = 1):
+        """
+        Procesa todos los archivos del directorio downloads.
+        
+        Args:
+            workers: Procesos para parsear los archivos en paralelo (1 = secuencial,
+                0 o None = todos los núcleos). Solo el proceso principal actualiza
+                el masterfile.
+        """
+        if not workers or workers < 0:
+            workers = os.cpu_count() or 1
+        
         if not self.downloads_dir.exists():
             logger.error(f"El directorio {self.downloads_dir} no existe")
             return
@@ -233,13 +990,10 @@ class MasterfileLoader:
             logger.warning("No se encontraron archivos para procesar")
             return
         
-        # Cargar el masterfile
-        self.load_masterfile()
-        
         # Procesar cada archivo
-        processed_count = 0
         error_count = 0
         
+        entries = []
         for filepath in sorted(xls_files):
             filename = filepath.name
             year, cnae = self.parse_filename(filename)
@@ -249,43 +1003,167 @@ class MasterfileLoader:
                 error_count += 1
                 continue
             
-            logger.info(f"Procesando {filename} -> Año: {year}, CNAE: {cnae}")
-            
-            # Extraer ratios del archivo
-            ratios_data = self.extract_ratios_from_file(filepath)
-            
-            if not ratios_data:
-                logger.warning(f"No se extrajeron ratios de {filename}")
+            entries.append((filepath, year, cnae))
+        
+        if not self.check_store_entries(entries):
+            return
+        
+        # Extraer ratios de cada archivo (cargando el masterfile)
+        parsed_files = []
+        for filepath, year, cnae, ratios in self._iter_parsed(entries, workers):
+            if ratios is None or len(ratios) == 0:
+                logger.warning(f"No se extrajeron ratios de {filepath.name}")
                 error_count += 1
                 continue
             
-            # Actualizar masterfile
-            self.update_masterfile_row(year, cnae, ratios_data)
-            processed_count += 1
+            parsed_files.append((filepath, year, cnae, ratios))
         
-        # Guardar el masterfile actualizado
-        if processed_count > 0:
-            self.save_masterfile()
+        self.load_parsed(parsed_files, error_count, len(xls_files))
+    
+    def load_parsed(self, parsed_files: List[Tuple[Path, str, str, object]], error_count: int = 0,
+                    total_files: Optional[int] = None) -> int:
+        """
+        Valida los ratios parseados y los guarda en el almacén o en el masterfile.
+        
+        Es el último paso de process_all_files y del pipeline (5_Pipeline_descarga_y_carga.py):
+        valida el lote completo, escribe los válidos (en el almacén, o en el
+        masterfile según write_mode) y guarda la caché de parseo. Sin almacén, las
+        hojas de los años del lote ya deben estar cargadas (load_masterfile).
+        
+        Args:
+            parsed_files: Lista de (filepath, year, cnae, ratios), con ratios como
+                RatiosArray o diccionario
+            error_count: Archivos que ya fallaron antes (nombre o parseo), para el resumen
+            total_files: Total de archivos del resumen (por defecto, los de
+                parsed_files más los que ya fallaron)
+        
+        Returns:
+            Número de archivos cargados
+        """
+        if total_files is None:
+            total_files = len(parsed_files) + error_count
+        
+        # Validar el lote completo antes de escribir nada
+        valid_files = self.validate_parsed(parsed_files)
+        error_count += len(parsed_files) - len(valid_files)
+        processed_count = len(valid_files)
+        parsed_files = [(year, cnae, ratios) for _, year, cnae, ratios in valid_files]
+        
+        if self.store is not None:
+            # Guardar solo los valores de esta carga en el almacén
+            if parsed_files:
+                with metrics.timer("store.upsert"):
+                    cells = self.store.upsert_parsed(parsed_files)
+                metrics.count("store.cells_written", cells)
+        else:
+            # Actualizar masterfile con todos los archivos a la vez
+            with metrics.timer("masterfile.update"):
+                counts = self.update_masterfile_batch(parsed_files)
+            metrics.count("masterfile.cells_updated", sum(counts))
+            
+            # Guardar el masterfile actualizado
+            if processed_count > 0:
+                with metrics.timer("masterfile.save"):
+                    self.save_masterfile()
+        
+        if self.cache is not None:
+            with metrics.timer("parse_cache.save"):
+                self.cache.save()
+        
+        metrics.count("files.processed", processed_count)
+        metrics.count("files.errors", error_count)
         
         # Resumen
         logger.info("=" * 60)
         logger.info(f"Procesamiento completado:")
         logger.info(f"  - Archivos procesados exitosamente: {processed_count}")
         logger.info(f"  - Archivos con errores: {error_count}")
-        logger.info(f"  - Total de archivos: {len(xls_files)}")
+        logger.info(f"  - Total de archivos: {total_files}")
         logger.info("=" * 60)
+        return processed_count
+
+
+def _extract_ratios_worker(reader: str, filepath: Path) -> Tuple[Optional[RatiosArray], float]:
+    """Parsea un archivo en un proceso del pool (sin tocar el masterfile)."""
+    return MasterfileLoader(reader=reader).timed_extract(filepath)
 
 
 def main():
     """Función principal."""
+    parser = argparse.ArgumentParser(description="Carga los ratios del BdE en el masterfile")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Procesos para parsear los archivos (1 = secuencial, 0 = todos los núcleos)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="No usar la caché de parseo (se parsean todos los archivos)")
+    parser.add_argument("--clear-cache", action="store_true",
+                        help="Invalidar la caché de parseo antes de empezar")
+    parser.add_argument("--cache-max-entries", type=int, default=None,
+                        help="Máximo de archivos en la caché de parseo (por defecto sin límite)")
+    parser.add_argument("--write-mode", choices=["rewrite", "incremental"], default="rewrite",
+                        help="rewrite: reescribe todas las hojas; incremental: solo las celdas "
+                             "cambiadas, conservando formatos, fórmulas y hojas adicionales")
+    parser.add_argument("--store", default=None,
+                        help="Almacén SQLite de ratios (p. ej. ratios.sqlite). Los ratios se guardan "
+                             "en él y el masterfile .xlsx solo se genera con --export-xlsx")
+    parser.add_argument("--import-masterfile", action="store_true",
+                        help="Con --store: importar antes el masterfile .xlsx actual al almacén")
+    parser.add_argument("--export-xlsx", action="store_true",
+                        help="Con --store: generar el masterfile .xlsx desde el almacén al terminar")
+    parser.add_argument("--no-validate", action="store_true",
+                        help="No validar los ratios parseados antes de cargarlos")
+    parser.add_argument("--quarantine", action="store_true",
+                        help="Mover a downloads/quarantine/ los archivos que no pasan la "
+                             "validación (por defecto no se cargan pero se quedan en downloads/)")
+    parser.add_argument("--validation-report", default=os.path.join("downloads", VALIDATION_REPORT_FILENAME),
+                        help="Ruta del informe JSON de la validación")
+    parser.add_argument("--metrics", default=None,
+                        help="Guardar un informe JSON con tiempos por etapa y por archivo en esta ruta")
+    parser.add_argument("--profile", choices=PROFILE_MODES, default=None,
+                        help="Con --metrics: perfilar con cProfile, tracemalloc o ambos (all)")
+    args = parser.parse_args()
+    if (args.import_masterfile or args.export_xlsx) and not args.store:
+        parser.error("--import-masterfile y --export-xlsx requieren --store")
+    
     logger.info("Iniciando carga de valores en masterfile...")
     
+    cache = None
+    if not args.no_cache:
+        cache = ParseCache(os.path.join("downloads", PARSE_CACHE_FILENAME),
+                           max_entries=args.cache_max_entries)
+        if args.clear_cache:
+            cache.clear()
+    
+    store = None
+    if args.store:
+        store = RatioStore(args.store)
+        if args.import_masterfile:
+            store.import_masterfile("CNAE masterfile.xlsx")
+    
     loader = MasterfileLoader(
         downloads_dir="downloads",
-        masterfile_path="CNAE masterfile.xlsx"
+        masterfile_path="CNAE masterfile.xlsx",
+        cache=cache,
+        write_mode=args.write_mode,
+        store=store,
+        sector_map=cargar_mapa_cnae(),
+        validator=None if args.no_validate else RatioValidator(),
+        quarantine=args.quarantine,
+        validation_report=args.validation_report
     )
     
-    loader.process_all_files()
+    with metrics_report(args.metrics, args.profile, script="4_Carga_valores_en_masterfile.py",
+                        options=vars(args)):
+        with metrics.timer("load.total"):
+            loader.process_all_files(workers=args.workers)
+        
+        if store is not None and args.export_xlsx:
+            with metrics.timer("store.export"):
+                loader.export_masterfile()
+    if args.metrics:
+        logger.info(f"Métricas guardadas en {args.metrics}")
+    
+    if store is not None:
+        store.close()
     
     logger.info("Proceso finalizado")
 
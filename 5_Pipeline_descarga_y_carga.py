@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Script que ejecuta los pasos 1, 3 y 4 como un único pipeline productor-consumidor.
+
+Mientras el descargador (1_descargar_ratios_bde.py) sigue bajando sectores,
+cada archivo terminado (ya publicado por el almacén de descargas con su nombre
+YYYY_CCCC.xls, o renombrado con transformar_nombre_archivo de
+3_Cambio nombre ficheros.py si se usa --sin-almacen) se parsea con
+MasterfileLoader.extract_cached (4_Carga_valores_en_masterfile.py). Las
+descargas idénticas a las que ya había no se vuelven a parsear, y los archivos
+que no han cambiado desde la última carga salen de la caché de parseo. El
+masterfile se carga en paralelo y al final el lote pasa por la misma
+validación y el mismo guardado que el script 4 (MasterfileLoader.load_parsed):
+una sola escritura del masterfile, con --modo-escritura, o del almacén SQLite
+con --almacen-ratios. El tiempo total es aproximadamente el de la descarga.
+
+Los archivos que ya estaban en downloads/ también se procesan, de modo que el
+resultado es el mismo que ejecutar los scripts 1, 3 y 4 uno detrás de otro.
+
+Uso:
+    python3 5_Pipeline_descarga_y_carga.py [opciones del descargador] [--masterfile RUTA]
+
+Ejemplo:
+    python3 5_Pipeline_descarga_y_carga.py --workers 3 --masterfile "CNAE masterfile.xlsx"
+    python3 5_Pipeline_descarga_y_carga.py --almacen-ratios ratios.sqlite --exportar-xlsx
+"""
+
+import argparse
+import logging
+import os
+import queue
+import threading
+from pathlib import Path
+from typing import Optional
+
+from almacen_descargas import AlmacenDescargas
+from catalogo_sectores import cargar_mapa_cnae
+from ratio_store import RatioStore
+from ratio_validation import RatioValidator
+from run_metrics import metrics, metrics_report
+from scripts_bde import (DIRECTORIO_PROYECTO, SCRIPT_CARGA, SCRIPT_DESCARGA, SCRIPT_RENOMBRADO,
+                         cargar_script)
+
+# Configurar logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class PipelineRatios:
+    """Renombra y parsea los archivos según van llegando y escribe el masterfile (o el almacén) al final."""
+
+    def __init__(self, downloads_dir: str, masterfile_path: str, validar: bool = True,
+                 cache: bool = True, write_mode: str = "rewrite", store: Optional[RatioStore] = None,
+                 cuarentena: bool = False):
+        """
+        Inicializa el pipeline.
+
+        Args:
+            downloads_dir: Directorio donde el descargador deja los archivos
+            masterfile_path: Ruta al archivo masterfile
+            validar: Validar los ratios antes de cargarlos (ratio_validation); los
+                archivos que no pasen no se cargan
+            cache: Usar la caché de parseo de downloads/ (la misma que el script 4)
+            write_mode: "rewrite" o "incremental" (ver MasterfileLoader)
+            store: Almacén de ratios donde guardar la carga en lugar del masterfile
+            cuarentena: Mover a downloads/quarantine/ los archivos que no pasen la validación
+        """
+        self.downloads_dir = Path(downloads_dir)
+        self.renombrador = cargar_script(SCRIPT_RENOMBRADO)
+        # Mapa del catálogo de sectores: renombrado sin expresión regular
+        self.mapa_cnae = cargar_mapa_cnae()
+        carga = cargar_script(SCRIPT_CARGA)
+        self.loader = carga.MasterfileLoader(
+            downloads_dir=str(downloads_dir), masterfile_path=str(masterfile_path),
+            cache=carga.ParseCache(str(self.downloads_dir / carga.PARSE_CACHE_FILENAME)) if cache else None,
+            write_mode=write_mode, store=store, sector_map=self.mapa_cnae,
+            validator=RatioValidator() if validar else None, quarantine=cuarentena,
+            validation_report=str(self.downloads_dir / carga.VALIDATION_REPORT_FILENAME))
+        self.cola = queue.Queue()
+        self.parseados = {}  # (año, cnae) -> (ruta del archivo, ratios)
+        self.errores = []
+        self._consumidor = threading.Thread(target=self._consumir, name="parser", daemon=True)
+        self._carga_masterfile = threading.Thread(target=self._cargar_masterfile,
+                                                  name="masterfile", daemon=True)
+
+    def encolar(self, nombre_archivo: str):
+        """Añade un archivo descargado a la cola de procesamiento."""
+        self.cola.put(nombre_archivo)
+
+    def al_completar(self, resultado: dict):
+        """Callback del descargador: encola cada sector descargado con éxito y con contenido nuevo."""
+        if resultado['ok'] and resultado['archivo'] and not resultado.get('sin_cambios'):
+            self.encolar(resultado['archivo'])
+
+    def _cargar_masterfile(self):
+        # Con almacén no hace falta leer el masterfile
+        if self.loader.store is None:
+            with metrics.timer("masterfile.load"):
+                self.loader.load_masterfile()
+
+    def _consumir(self):
+        while True:
+            nombre = self.cola.get()
+            if nombre is None:
+                break
+            try:
+                self._procesar(nombre)
+            except Exception as e:
+                logger.error(f"Error procesando {nombre}: {e}")
+                self.errores.append(nombre)
+
+    def _procesar(self, nombre: str):
+        """Renombra (si hace falta) y parsea un archivo."""
+        ruta = self.downloads_dir / nombre
+        nuevo_nombre = self.renombrador.transformar_nombre_archivo(nombre, self.mapa_cnae)
+        if nuevo_nombre:
+            nueva_ruta = self.downloads_dir / nuevo_nombre
+            os.replace(ruta, nueva_ruta)
+            nombre, ruta = nuevo_nombre, nueva_ruta
+
+        year, cnae = self.loader.parse_filename(nombre)
+        if year is None or cnae is None:
+            logger.warning(f"Archivo {nombre} no coincide con el patrón esperado (YYYY_CCCC.xls)")
+            self.errores.append(nombre)
+            return
+
+        ratios = self.loader.extract_cached(ruta)
+        if ratios is None or len(ratios) == 0:
+            logger.warning(f"No se extrajeron ratios de {nombre}")
+            self.errores.append(nombre)
+            return
+
+        self.parseados[(year, cnae)] = (ruta, ratios)
+        logger.info(f"Parseado {nombre} -> Año: {year}, CNAE: {cnae}")
+
+    def _entradas_existentes(self):
+        """(ruta, año, cnae) de los archivos que ya estaban en downloads/ con nombre reconocible."""
+        entradas = []
+        for ruta in sorted(self.downloads_dir.glob("*.xls")):
+            year, cnae = self.loader.parse_filename(ruta.name)
+            if year is not None:
+                entradas.append((ruta, year, cnae))
+        return entradas
+
+    def ejecutar(self, args_descarga) -> bool:
+        """
+        Ejecuta descarga, renombrado, parseo y carga.
+
+        Args:
+            args_descarga: Opciones del descargador (ver parsear_argumentos del script 1)
+
+        Returns:
+            True si se cargó algún archivo en el masterfile o en el almacén
+        """
+        # Con almacén, los archivos con sufijo de tamaño o país se rechazan antes de descargar
+        if not self.loader.check_store_entries(self._entradas_existentes()):
+            return False
+
+        self._carga_masterfile.start()
+        self._consumidor.start()
+
+        # Lo que ya estaba descargado entra primero (pasando antes al almacén los
+        # archivos sueltos, para no renombrarlos a la vez que el descargador)
+        if not args_descarga.sin_almacen:
+            AlmacenDescargas(str(self.downloads_dir), self.mapa_cnae).importar_sueltos()
+        for ruta in sorted(self.downloads_dir.glob("*.xls")):
+            self.encolar(ruta.name)
+
+        descargador = cargar_script(SCRIPT_DESCARGA)
+        try:
+            descargador.ejecutar_descarga(args_descarga, al_completar=self.al_completar)
+        finally:
+            self.cola.put(None)
+            self._consumidor.join()
+            self._carga_masterfile.join()
+
+        if self.loader.store is None and not self.loader.masterfile_data:
+            logger.error("No se pudo cargar el masterfile")
+            return False
+
+        entradas = [(ruta, year, cnae, ratios)
+                    for (year, cnae), (ruta, ratios) in sorted(self.parseados.items())]
+        if not self.loader.check_store_entries([entrada[:3] for entrada in entradas]):
+            return False
+
+        # La misma validación y el mismo guardado que el script 4
+        cargados = self.loader.load_parsed(entradas, len(self.errores), len(entradas) + len(self.errores))
+        return cargados > 0
+
+
+def main(argv=None):
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Descarga, renombra y carga los ratios en un solo paso",
+                                     add_help=False)
+    parser.add_argument("--masterfile", default=os.path.join(DIRECTORIO_PROYECTO, "CNAE masterfile.xlsx"),
+                        help="Ruta al archivo masterfile")
+    parser.add_argument("--sin-validar", action="store_true",
+                        help="No validar los ratios antes de cargarlos en el masterfile")
+    parser.add_argument("--cuarentena", action="store_true",
+                        help="Mover a downloads/quarantine/ los archivos que no pasan la validación")
+    parser.add_argument("--sin-cache", action="store_true",
+                        help="No usar la caché de parseo (parsear siempre todos los archivos)")
+    parser.add_argument("--modo-escritura", choices=["rewrite", "incremental"], default="rewrite",
+                        help="Como --write-mode del script 4: reescribir todas las hojas o solo "
+                             "las celdas cambiadas")
+    parser.add_argument("--almacen-ratios", default=None,
+                        help="Como --store del script 4: guardar los ratios en este almacén SQLite "
+                             "en lugar del masterfile")
+    parser.add_argument("--exportar-xlsx", action="store_true",
+                        help="Con --almacen-ratios: generar el masterfile .xlsx desde el almacén al terminar")
+    args, resto = parser.parse_known_args(argv)
+    if args.exportar_xlsx and not args.almacen_ratios:
+        parser.error("--exportar-xlsx requiere --almacen-ratios")
+
+    descargador = cargar_script(SCRIPT_DESCARGA)
+    args_descarga = descargador.parsear_argumentos(resto)
+    if args.almacen_ratios and (args_descarga.dimensiones or args_descarga.paises):
+        parser.error("--almacen-ratios no admite --dimensiones ni --paises: el almacén solo guarda "
+                     "el tamaño y el país por defecto")
+
+    logger.info("Iniciando pipeline de descarga y carga...")
+    store = RatioStore(args.almacen_ratios) if args.almacen_ratios else None
+    pipeline = PipelineRatios(
+        downloads_dir=os.path.join(DIRECTORIO_PROYECTO, "downloads"),
+        masterfile_path=args.masterfile,
+        validar=not args.sin_validar,
+        cache=not args.sin_cache,
+        write_mode=args.modo_escritura,
+        store=store,
+        cuarentena=args.cuarentena,
+    )
+    with metrics_report(args_descarga.metricas, args_descarga.perfil,
+                        script="5_Pipeline_descarga_y_carga.py", opciones=vars(args_descarga)):
+        with metrics.timer("pipeline.total"):
+            pipeline.ejecutar(args_descarga)
+        if store is not None and args.exportar_xlsx:
+            with metrics.timer("store.export"):
+                pipeline.loader.export_masterfile()
+    if store is not None:
+        store.close()
+    if args_descarga.metricas:
+        logger.info(f"Métricas guardadas en {args_descarga.metricas}")
+    logger.info("Proceso finalizado")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Almacén de descargas direccionado por contenido.
+
+Cada Excel descargado se guarda una sola vez, con el SHA-256 de su contenido
+como nombre (downloads/.blobs/ab/ab12….xls), y un índice
+(downloads/indice_descargas.json) asocia cada nombre de la carga
+(YYYY_CCCC.xls, con el sufijo de tamaño y país si lo lleva) a su blob más
+reciente. En cuanto termina cada descarga, ese nombre se publica en downloads/
+como enlace duro al blob mediante un rename atómico, así que la carga ve
+exactamente un archivo vigente por clave y nunca uno a medio escribir.
+
+- Una descarga idéntica a la vigente no cambia nada: solo se borra la copia nueva
+- El blob que deja de estar en el índice se borra, así que en disco queda un
+  archivo por clave aunque se acumulen ejecuciones
+- Los archivos sueltos de ejecuciones anteriores (con el nombre del BdE o ya
+  renombrados) se incorporan con importar_sueltos()
+
+Formato (downloads/indice_descargas.json):
+    {"version": 1,
+     "archivos": {"2023_0110.xls": {"sha256": "ab12…", "tamano": 31744,
+                                    "origen": "2023_A011_b_20251119.xls",
+                                    "mtime": 1763546400.0,
+                                    "actualizado": "2025-11-19T10:00:00"}, ...}}
+
+mtime es la fecha de modificación del archivo descargado: importar_sueltos
+solo sustituye la versión vigente por una copia suelta estrictamente posterior.
+
+Uso:
+    almacen = AlmacenDescargas("downloads", cargar_mapa_cnae())
+    nombre, nuevo = almacen.guardar("downloads/2023_A011_b_20251119.xls")  # -> "2023_0110.xls"
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+
+from sufijos_ejes import separar_sufijo
+from catalogo_sectores import cnae_de_sector
+
+DIRECTORIO_BLOBS = ".blobs"
+NOMBRE_INDICE = "indice_descargas.json"
+
+def calcular_sha256(ruta, tam_bloque=1024 * 1024):
+    """Checksum SHA-256 de un fichero"""
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        for bloque in iter(lambda: f.read(tam_bloque), b""):
+            h.update(bloque)
+    return h.hexdigest()
+
+def nombre_publicado(nombre, mapa_cnae=None):
+    """
+    Nombre con el que se carga una descarga del BdE (2023_A011_b_20251119_d2_Portugal.xls
+    -> 2023_0110_d2_Portugal.xls), con la misma regla que transformar_nombre_archivo.
+    Los nombres que no siguen el formato del BdE se publican tal cual.
+    """
+    base, sufijo = separar_sufijo(nombre)
+    partes = base.split("_")
+    if len(partes) == 4 and partes[0].isdigit() and partes[2] == "b" and partes[3].endswith(".xls"):
+        cnae = (mapa_cnae or {}).get(partes[1]) or cnae_de_sector(partes[1])
+        if cnae:
+            return f"{partes[0]}_{cnae}{sufijo}.xls"
+    return nombre
+
+def _enlazar(origen, destino):
+    """Crea destino con el contenido de origen (enlace duro o, si no se puede, copia) de forma atómica"""
+    temporal = os.path.join(os.path.dirname(destino), f".{os.path.basename(destino)}.tmp")
+    if os.path.lexists(temporal):
+        os.remove(temporal)
+    try:
+        os.link(origen, temporal)
+    except OSError:
+        shutil.copyfile(origen, temporal)
+    os.replace(temporal, destino)
+
+class AlmacenDescargas:
+    """Blobs por SHA-256 y el índice nombre -> blob vigente, en el directorio de descargas"""
+
+    def __init__(self, directorio, mapa_cnae=None):
+        """
+        Args:
+            directorio: Directorio de descargas donde se publican los nombres
+            mapa_cnae: Valor del desplegable -> CNAE (catálogo de sectores); sin
+                él se aplica la regla de cnae_de_sector
+        """
+        self.directorio = directorio
+        self.directorio_blobs = os.path.join(directorio, DIRECTORIO_BLOBS)
+        self.ruta_indice = os.path.join(directorio, NOMBRE_INDICE)
+        self.mapa_cnae = mapa_cnae or {}
+        self._lock = threading.Lock()
+        self.entradas = {}
+        if os.path.exists(self.ruta_indice):
+            try:
+                with open(self.ruta_indice, encoding="utf-8") as f:
+                    self.entradas = json.load(f).get("archivos", {})
+            except (OSError, ValueError) as e:
+                # Los nombres publicados siguen ahí: importar_sueltos reconstruye el índice
+                print(f"⚠ Índice de descargas ilegible ({e}); se reconstruirá")
+
+    def ruta_blob(self, sha256):
+        return os.path.join(self.directorio_blobs, sha256[:2], f"{sha256}.xls")
+
+    def guardar(self, ruta, nombre=None, mtime=None):
+        """
+        Incorpora un archivo recién descargado: lo pasa a su blob, publica su
+        nombre de carga y actualiza el índice. El archivo original desaparece.
+
+        Args:
+            ruta: Archivo descargado (dentro o fuera del directorio de descargas)
+            nombre: Nombre a publicar (por defecto, nombre_publicado del original)
+            mtime: Fecha de modificación a registrar (por defecto, la del archivo)
+
+        Returns:
+            Tupla (nombre publicado, True si el contenido es nuevo para ese nombre)
+        """
+        origen = os.path.basename(ruta)
+        nombre = nombre or nombre_publicado(origen, self.mapa_cnae)
+        publicado = os.path.join(self.directorio, nombre)
+        sha256 = calcular_sha256(ruta)
+        tamano = os.path.getsize(ruta)
+        mtime = os.path.getmtime(ruta) if mtime is None else mtime
+        blob = self.ruta_blob(sha256)
+
+        with self._lock:
+            anterior = self.entradas.get(nombre)
+            nuevo = anterior is None or anterior["sha256"] != sha256
+
+            if not os.path.exists(blob):
+                os.makedirs(os.path.dirname(blob), exist_ok=True)
+                _enlazar(ruta, blob)
+            # Un nombre publicado puede faltar (p. ej. apartado en cuarentena)
+            if not os.path.exists(publicado) or (nuevo and not os.path.samefile(publicado, blob)):
+                _enlazar(blob, publicado)
+            if os.path.abspath(ruta) != os.path.abspath(publicado):
+                os.remove(ruta)
+
+            if nuevo:
+                self.entradas[nombre] = {
+                    "sha256": sha256,
+                    "tamano": tamano,
+                    "origen": origen,
+                    "mtime": mtime,
+                    "actualizado": datetime.now().isoformat(timespec="seconds"),
+                }
+                self._guardar()
+                if anterior is not None:
+                    self._descartar_blob(anterior["sha256"])
+        return nombre, nuevo
+
+    def _descartar_blob(self, sha256):
+        """Borra un blob que ya no es vigente para ningún nombre"""
+        if any(e["sha256"] == sha256 for e in self.entradas.values()):
+            return
+        try:
+            os.remove(self.ruta_blob(sha256))
+        except FileNotFoundError:
+            pass
+
+    def _guardar(self):
+        temporal = self.ruta_indice + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump({"version": 1, "archivos": self.entradas}, f, indent=2, ensure_ascii=False)
+        os.replace(temporal, self.ruta_indice)
+
+    def importar_sueltos(self):
+        """
+        Incorpora los .xls de downloads/ que no están en el índice (descargas
+        anteriores al almacén o renombradas a mano) y borra los blobs huérfanos
+        de una ejecución interrumpida.
+
+        Los archivos que dan el mismo nombre de carga (copias con distinta fecha
+        del BdE) se comparan por fecha de modificación con la versión vigente
+        (el mtime del índice o, en índices antiguos, el de su blob): solo una
+        copia estrictamente más reciente la sustituye; las demás se borran.
+
+        Returns:
+            Número de archivos incorporados
+        """
+        if not os.path.isdir(self.directorio):
+            return 0
+        grupos = {}
+        for nombre in os.listdir(self.directorio):
+            ruta = os.path.join(self.directorio, nombre)
+            if nombre.startswith(".") and nombre.endswith(".xls.tmp"):
+                os.remove(ruta)  # Publicación interrumpida
+                continue
+            if not nombre.endswith(".xls") or not os.path.isfile(ruta):
+                continue
+            entrada = self.entradas.get(nombre)
+            if entrada is not None and os.path.exists(self.ruta_blob(entrada["sha256"])) \
+                    and os.path.samefile(ruta, self.ruta_blob(entrada["sha256"])):
+                continue
+            grupos.setdefault(nombre_publicado(nombre, self.mapa_cnae), []).append(ruta)
+
+        incorporados = descartados = 0
+        for nombre, rutas in grupos.items():
+            rutas.sort(key=os.path.getmtime)
+            *antiguas, reciente = rutas
+            vigente = self._mtime_vigente(nombre)
+            if vigente is None or os.path.getmtime(reciente) > vigente:
+                self.guardar(reciente, nombre)
+                incorporados += 1
+            else:
+                antiguas.append(reciente)
+            for ruta in antiguas:
+                self._descartar_suelto(ruta, nombre)
+                descartados += 1
+        self.limpiar()
+        if incorporados or descartados:
+            print(f"📦 Incorporados {incorporados} archivos sueltos al almacén de descargas "
+                  f"({descartados} copias anteriores descartadas, {len(self.entradas)} nombres vigentes)")
+        return incorporados
+
+    def _mtime_vigente(self, nombre):
+        """Fecha de modificación de la versión vigente de un nombre, o None si no hay"""
+        entrada = self.entradas.get(nombre)
+        if entrada is None or not os.path.exists(self.ruta_blob(entrada["sha256"])):
+            return None
+        if entrada.get("mtime") is not None:
+            return entrada["mtime"]
+        return os.path.getmtime(self.ruta_blob(entrada["sha256"]))
+
+    def _descartar_suelto(self, ruta, nombre):
+        """Borra una copia suelta descartada; si ocupaba el nombre publicado, lo vuelve a enlazar al blob"""
+        publicado = os.path.join(self.directorio, nombre)
+        if os.path.abspath(ruta) == os.path.abspath(publicado):
+            _enlazar(self.ruta_blob(self.entradas[nombre]["sha256"]), publicado)
+        else:
+            os.remove(ruta)
+
+    def limpiar(self):
+        """Borra los blobs y temporales que no corresponden a ninguna entrada del índice"""
+        vigentes = {e["sha256"] for e in self.entradas.values()}
+        borrados = 0
+        for raiz, _, ficheros in os.walk(self.directorio_blobs):
+            for fichero in ficheros:
+                sha256, _, _ = fichero.partition(".")
+                if sha256 not in vigentes or fichero.endswith(".tmp"):
+                    os.remove(os.path.join(raiz, fichero))
+                    borrados += 1
+        return borrados
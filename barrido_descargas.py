@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Barrido de descargas sobre varios ejes del formulario del BdE: sector,
+ejercicio, tamaño (dimension) y país.
+
+Cada combinación es un trabajo: el diccionario del sector ({'value', 'text'})
+con 'ejercicio', 'dimension' y 'pais'. Los trabajos se ordenan agrupados por
+sector y recorriendo el resto de ejes en orden Gray reflejado, de modo que
+entre dos trabajos consecutivos solo cambia un desplegable (también al pasar
+de un sector al siguiente).
+
+Los archivos de tamaño o país distintos de los de siempre ("Menos de 50
+millones", España) llevan un sufijo con esos ejes antes de la extensión
+(2023_A011_b_20251119_d2_Portugal.xls -> 2023_0110_d2_Portugal.xls), y en el
+masterfile van a la hoja del año con el mismo sufijo (2023_d2_Portugal); ver
+sufijos_ejes.py. Las descargas de siempre conservan sus nombres y sus hojas.
+
+Uso:
+    barrido = Barrido(ejercicios="todos", dimensiones="0,1,2")
+    trabajos = barrido.trabajos(sectores, ejercicio_defecto, opciones_formulario)
+    limitador = LimitadorPeticiones(60)   # compartido por todas las sesiones
+    limitador.esperar()                   # antes de cada envío del formulario
+"""
+
+import threading
+import time
+
+from run_metrics import metrics
+from sufijos_ejes import DIMENSION_POR_DEFECTO, PAIS_POR_DEFECTO
+
+# Envíos del formulario por minuto entre todas las sesiones (0 = sin límite)
+PETICIONES_POR_MINUTO = 60
+
+# Valor de los ejes que pide todas las opciones del desplegable
+TODOS = ("todos", "todas")
+
+def orden_gray(tamanos):
+    """
+    Índices del producto cartesiano en orden Gray reflejado (mixto): entre dos
+    combinaciones consecutivas cambia exactamente un eje.
+    """
+    if not tamanos:
+        yield ()
+        return
+    interior = list(orden_gray(tamanos[1:]))
+    for i in range(tamanos[0]):
+        for combinacion in (interior if i % 2 == 0 else reversed(interior)):
+            yield (i,) + combinacion
+
+def clave_trabajo(trabajo):
+    """Clave de un trabajo (la del manifiesto): (ejercicio, sector, dimension, pais)"""
+    return (trabajo.get('ejercicio'), trabajo['value'],
+            trabajo.get('dimension', DIMENSION_POR_DEFECTO), trabajo.get('pais', PAIS_POR_DEFECTO))
+
+class Barrido:
+    """Ejes que se recorren en una ejecución, tal como se piden en la línea de comandos"""
+
+    def __init__(self, ejercicios=None, dimensiones=None, paises=None, max_trabajos=None):
+        """
+        Args:
+            ejercicios: Lista o texto separado por comas ('2023,2022'), 'todos',
+                o None para el ejercicio seleccionado por defecto en la web
+            dimensiones: Valores del desplegable de tamaño, 'todas', o None para
+                DIMENSION_POR_DEFECTO
+            paises: Textos del desplegable de país, 'todos', o None para PAIS_POR_DEFECTO
+            max_trabajos: Máximo de trabajos pendientes por ejecución (None = sin límite)
+        """
+        self.ejes = {'ejercicio': ejercicios, 'dimension': dimensiones, 'pais': paises}
+        self.max_trabajos = max_trabajos
+
+    def necesita_opciones(self):
+        """True si algún eje pide todas las opciones (hay que leerlas del formulario o del catálogo)"""
+        return any(isinstance(v, str) and v.lower() in TODOS for v in self.ejes.values())
+
+    def _valores(self, eje, por_defecto, disponibles):
+        pedido = self.ejes[eje]
+        if pedido is None:
+            return [por_defecto]
+        if isinstance(pedido, str):
+            if pedido.lower() in TODOS:
+                if not disponibles:
+                    print(f"⚠ No se conocen las opciones de '{eje}'; se usa {por_defecto}")
+                    return [por_defecto]
+                return list(disponibles)
+            pedido = [v.strip() for v in pedido.split(",") if v.strip()]
+        valores = list(dict.fromkeys(str(v) for v in pedido))
+        if disponibles:
+            desconocidos = [v for v in valores if v not in disponibles]
+            if desconocidos:
+                print(f"⚠ Opciones de '{eje}' que no están en el formulario: {', '.join(desconocidos)}")
+            valores = [v for v in valores if v in disponibles]
+        return valores
+
+    def trabajos(self, sectores, ejercicio_defecto, opciones_formulario=None):
+        """
+        Lista ordenada de trabajos del barrido.
+
+        Args:
+            sectores: Lista de {'value', 'text'}
+            ejercicio_defecto: Ejercicio seleccionado por defecto en el formulario
+            opciones_formulario: {'ejercicio': [...], 'dimension': [...], 'pais': [...]}
+                con las opciones de cada desplegable ({'value', 'text'}); el
+                ejercicio y el tamaño se eligen por valor y el país por texto
+        """
+        opciones = opciones_formulario or {}
+        ejes = [
+            ('ejercicio', self._valores('ejercicio', ejercicio_defecto,
+                                        [o['value'] for o in opciones.get('ejercicio', [])])),
+            ('dimension', self._valores('dimension', DIMENSION_POR_DEFECTO,
+                                        [o['value'] for o in opciones.get('dimension', [])])),
+            ('pais', self._valores('pais', PAIS_POR_DEFECTO,
+                                   [o['text'] for o in opciones.get('pais', [])])),
+        ]
+        variables = [(nombre, valores) for nombre, valores in ejes if len(valores) > 1]
+
+        trabajos = []
+        for indices in orden_gray([len(sectores)] + [len(valores) for _, valores in ejes]):
+            sector = sectores[indices[0]]
+            trabajo = dict(sector)
+            for (nombre, valores), i in zip(ejes, indices[1:]):
+                trabajo[nombre] = valores[i]
+            # En los mensajes, el sector con los ejes que varían en este barrido
+            if variables:
+                detalle = ", ".join(str(trabajo[nombre]) for nombre, _ in variables)
+                trabajo['descripcion'] = f"{sector['text']} [{detalle}]"
+            trabajos.append(trabajo)
+
+        if variables:
+            resumen = " × ".join(f"{len(valores)} {nombre}" for nombre, valores in ejes)
+            print(f"🗂 Barrido: {len(sectores)} sectores × {resumen} = {len(trabajos)} trabajos")
+        return trabajos
+
+    def limitar(self, trabajos):
+        """Recorta los trabajos pendientes a max_trabajos (el resto queda para la siguiente ejecución)"""
+        if self.max_trabajos and len(trabajos) > self.max_trabajos:
+            print(f"⏸ Se descargan {self.max_trabajos} de {len(trabajos)} trabajos pendientes; "
+                  f"el resto en la siguiente ejecución")
+            return trabajos[:self.max_trabajos]
+        return trabajos
+
+class LimitadorPeticiones:
+    """
+    Límite global de envíos del formulario por minuto, compartido por todos los
+    hilos, sesiones y contextos de una ejecución. Cada envío reserva el siguiente
+    hueco libre, así que los envíos quedan espaciados al menos 60/por_minuto segundos.
+    """
+
+    def __init__(self, por_minuto=PETICIONES_POR_MINUTO):
+        self.intervalo = 60.0 / por_minuto if por_minuto else 0.0
+        self._siguiente = 0.0
+        self._lock = threading.Lock()
+
+    def reservar(self):
+        """Reserva el siguiente hueco y devuelve los segundos que faltan para él"""
+        if not self.intervalo:
+            return 0.0
+        with self._lock:
+            ahora = time.monotonic()
+            turno = max(ahora, self._siguiente)
+            self._siguiente = turno + self.intervalo
+        return turno - ahora
+
+    def esperar(self):
+        """Bloquea hasta el hueco reservado (para los hilos; con asyncio usar reservar)"""
+        espera = self.reservar()
+        if espera > 0:
+            metrics.observe("descarga.espera_limite", espera)
+            time.sleep(espera)
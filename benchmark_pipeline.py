@@ -0,0 +1,308 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark sintético del pipeline descarga -> renombrado -> carga.
+
+Genera archivos con el formato de los Excel del BdE (fila "Ratio", filas
+R01-R28 y T1, Q1-Q3 en las columnas 3-5) y un masterfile a juego, levanta el
+servidor simulado (servidor_simulado_bde.py) y mide, para cada escala:
+
+- download_http: descargas con MotorHTTP contra el servidor simulado
+- transformar_nombre_archivo: renombrado de nombres del BdE (2023_A011_b_...)
+- extract_ratios_from_file: lectura de los Excel
+- load_masterfile / save_masterfile: lectura y escritura del masterfile
+- update_masterfile_row: carga archivo a archivo
+- update_masterfile_batch: carga de todos los archivos a la vez
+
+La escala 1 equivale al volumen actual (BASE_FILES archivos y un masterfile de
+BASE_YEARS hojas). Las etapas por archivo pueden medirse sobre una muestra
+(--sample) y extrapolarse; el resultado indica "sampled" en ese caso.
+
+Uso:
+    python3 benchmark_pipeline.py --scales 10,100 --output benchmark.json
+    python3 benchmark_pipeline.py --scales 1000 --sample 2000
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import math
+import platform
+import random
+import shutil
+import tempfile
+import time
+from datetime import date, datetime
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from ratio_store import QUARTILES, RATIO_CODES, masterfile_columns
+from scripts_bde import SCRIPT_CARGA, SCRIPT_DESCARGA, SCRIPT_RENOMBRADO, cargar_script
+from servidor_simulado_bde import arrancar_en_segundo_plano
+
+try:
+    import xlwt
+except ImportError:  # pragma: no cover - el benchmark no arranca sin xlwt (ver bde_workbook_bytes)
+    xlwt = None
+
+logger = logging.getLogger(__name__)
+
+# Volumen actual: archivos por descarga completa y hojas (años) del masterfile
+BASE_FILES = 295
+BASE_YEARS = 2
+FIRST_YEAR = 2023
+
+# Claves CNAE de 4 dígitos disponibles para los sectores sintéticos
+MAX_SECTORS = 9999
+
+SECTION_LETTERS = "ABCDEFGHIJKLMNOPQRS"
+
+
+def bde_workbook_bytes(rnd: random.Random) -> bytes:
+    """
+    Contenido de un Excel .xls (BIFF, como los del BdE) con el formato de los ratios.
+
+    Raises:
+        RuntimeError: Si xlwt no está instalado (un .xlsx con extensión .xls no lo
+            lee el lector xlrd, y se mediría el respaldo de pandas)
+    """
+    if xlwt is None:
+        raise RuntimeError("El benchmark necesita xlwt para generar .xls reales: pip install xlwt")
+    rows = [["Ratios sectoriales de sociedades no financieras"], [],
+            ["Ratio", "Descripción", "Nº empresas", "Q1", "Q2", "Q3"]]
+    for code in RATIO_CODES:
+        q = sorted(round(rnd.uniform(-50, 150), 2) for _ in QUARTILES)
+        rows.append([code, f"Descripción {code}", rnd.randint(20, 5000)] + q)
+    rows += [[], ["Fuente: Banco de España. Central de Balances"]]
+
+    buffer = io.BytesIO()
+    wb = xlwt.Workbook()
+    ws = wb.add_sheet("Ratios")
+    for i, row in enumerate(rows):
+        for j, value in enumerate(row):
+            ws.write(i, j, value)
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+def bde_download_name(year: int, key: int) -> str:
+    """Nombre con el que el BdE entrega el archivo (p. ej. 2023_A011_b_20251119.xls)."""
+    letter = SECTION_LETTERS[key % len(SECTION_LETTERS)]
+    return f"{year}_{letter}{key // 10:03d}_b_{date.today():%Y%m%d}.xls"
+
+
+class SyntheticDataset:
+    """Archivos del BdE y masterfile sintéticos para una escala."""
+
+    def __init__(self, root: Path, scale: float, unique_files: int = 200, seed: int = 0):
+        """
+        Args:
+            root: Directorio de trabajo (se crean downloads/ y el masterfile dentro)
+            scale: Múltiplo del volumen actual
+            unique_files: Contenidos distintos generados (el resto son copias)
+            seed: Semilla de los valores aleatorios
+        """
+        # Primero crece el número de sectores y, cuando se agotan las claves, el de años
+        total = max(1, round(BASE_FILES * scale))
+        self.n_sectors = min(total, MAX_SECTORS)
+        self.years = max(BASE_YEARS, math.ceil(total / self.n_sectors))
+        self.root = Path(root)
+        self.downloads_dir = self.root / "downloads"
+        self.masterfile_path = self.root / "CNAE masterfile.xlsx"
+        self.unique_files = unique_files
+        self.rnd = random.Random(seed)
+
+        keys = sorted(self.rnd.sample(range(1, MAX_SECTORS + 1), self.n_sectors))
+        years = [FIRST_YEAR - i for i in range(self.years)]
+        self.entries = [(year, key) for year in years for key in keys][:total]
+        self.sector_keys = keys
+        self.sheet_years = years
+
+    def generate(self) -> Dict[str, float]:
+        """Escribe los archivos y el masterfile; devuelve los tiempos de generación."""
+        self.downloads_dir.mkdir(parents=True, exist_ok=True)
+        start = time.perf_counter()
+        self.contents = [bde_workbook_bytes(self.rnd) for _ in range(min(self.unique_files,
+                                                                         len(self.entries)))]
+        for i, (year, key) in enumerate(self.entries):
+            (self.downloads_dir / f"{year}_{key:04d}.xls").write_bytes(self.contents[i % len(self.contents)])
+        files_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        columns = masterfile_columns()
+        with pd.ExcelWriter(self.masterfile_path, engine="openpyxl") as writer:
+            for year in sorted(self.sheet_years):
+                df = pd.DataFrame({'CNAE': self.sector_keys})
+                values = pd.DataFrame(
+                    [[round(self.rnd.uniform(-50, 150), 2) for _ in columns[1:]]
+                     for _ in range(min(len(self.sector_keys), 50))],
+                    columns=columns[1:],
+                )
+                # Filas repetidas a partir de una muestra: el coste de E/S es el mismo
+                df = pd.concat([df, values.sample(len(df), replace=True, random_state=year)
+                                .reset_index(drop=True)], axis=1)
+                df.to_excel(writer, sheet_name=str(year), index=False)
+        masterfile_s = time.perf_counter() - start
+        return {"generate_files_s": files_s, "generate_masterfile_s": masterfile_s}
+
+    def files(self) -> List[Path]:
+        return [self.downloads_dir / f"{year}_{key:04d}.xls" for year, key in self.entries]
+
+    def download_names(self) -> List[str]:
+        return [bde_download_name(year, key) for year, key in self.entries]
+
+
+def time_calls(func: Callable, items: list, sample: Optional[int] = None) -> Dict[str, object]:
+    """Llama a func con cada elemento (o con una muestra) y devuelve los tiempos."""
+    subset = items if not sample or sample >= len(items) else items[:sample]
+    start = time.perf_counter()
+    for item in subset:
+        func(item)
+    elapsed = time.perf_counter() - start
+    return _stage(elapsed, len(subset), len(items))
+
+
+def time_once(func: Callable) -> Dict[str, object]:
+    """Mide una sola llamada."""
+    start = time.perf_counter()
+    func()
+    return _stage(time.perf_counter() - start, 1, 1)
+
+
+def _stage(elapsed: float, calls: int, total_calls: int) -> Dict[str, object]:
+    per_call = elapsed / calls if calls else 0.0
+    return {
+        "calls": calls,
+        "total_s": round(elapsed, 6),
+        "per_call_ms": round(per_call * 1000, 4),
+        "sampled": calls < total_calls,
+        "estimated_total_s": round(per_call * total_calls, 6),
+    }
+
+
+def run_scale(scale: float, workdir: Path, sample: Optional[int], download_sample: int,
+              unique_files: int, seed: int) -> Dict[str, object]:
+    """Genera el conjunto de datos de una escala y mide cada etapa."""
+    root = Path(tempfile.mkdtemp(prefix=f"scale_{scale:g}_", dir=workdir))
+    dataset = SyntheticDataset(root, scale, unique_files=unique_files, seed=seed)
+    logger.info(f"Escala {scale:g}x: {len(dataset.entries)} archivos, {dataset.n_sectors} sectores, "
+                f"{dataset.years} hojas")
+    result = {"scale": scale, "files": len(dataset.entries), "sectors": dataset.n_sectors,
+              "years": dataset.years, "file_format": "xls"}
+    result.update({k: round(v, 3) for k, v in dataset.generate().items()})
+
+    stages = {}
+    stages["download_http"] = _time_download(dataset, download_sample)
+
+    renombrador = cargar_script(SCRIPT_RENOMBRADO)
+    with contextlib.redirect_stdout(io.StringIO()):
+        stages["transformar_nombre_archivo"] = time_calls(renombrador.transformar_nombre_archivo,
+                                                          dataset.download_names(), sample)
+
+    carga = cargar_script(SCRIPT_CARGA)
+    loader = carga.MasterfileLoader(downloads_dir=str(dataset.downloads_dir),
+                                    masterfile_path=str(dataset.masterfile_path))
+    files = dataset.files()
+    # Se mide el lector por defecto: si no aceptara los archivos, se mediría el respaldo de pandas
+    if loader._read_ratios_xlrd(files[0]) is None:
+        raise RuntimeError(f"El lector xlrd no acepta {files[0].name}; el benchmark no mediría el lector por defecto")
+    parsed = []
+    stages["extract_ratios_from_file"] = time_calls(
+        lambda path: parsed.append(loader.extract_ratios_from_file(path)), files, sample)
+
+    stages["load_masterfile"] = time_once(loader.load_masterfile)
+
+    # Todas las entradas, reutilizando los ratios de la muestra leída
+    updates = [(str(year), f"{key:04d}", parsed[i % len(parsed)])
+               for i, (year, key) in enumerate(dataset.entries)]
+    stages["update_masterfile_row"] = time_calls(lambda entry: loader.update_masterfile_row(*entry),
+                                                 updates, sample)
+    stages["update_masterfile_batch"] = time_once(lambda: loader.update_masterfile_batch(updates))
+    stages["save_masterfile"] = time_once(loader.save_masterfile)
+
+    result["stages"] = stages
+    shutil.rmtree(root, ignore_errors=True)
+    return result
+
+
+def _time_download(dataset: SyntheticDataset, download_sample: int) -> Dict[str, object]:
+    """Descarga sectores del servidor simulado con MotorHTTP."""
+    descargador = cargar_script(SCRIPT_DESCARGA)
+    sectors = [(f"S{key:04d}", f"S{key:04d} - Sector {key:04d}") for key in dataset.sector_keys]
+    contents = dataset.contents
+    server = arrancar_en_segundo_plano(
+        sectores=sectors, sin_datos=set(), ejercicios=[str(FIRST_YEAR)],
+        generar_excel=lambda sector, ejercicio: contents[int(sector[1:]) % len(contents)],
+    )
+    target = dataset.root / "http"
+    target.mkdir()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            motor = descargador.MotorHTTP(server.url).iniciar()
+            selected = motor.opciones_sector[:download_sample or None]
+            stage = time_calls(lambda o: motor.descargar(o["value"], o["text"], str(target)),
+                               selected)
+        stage.update(_stage(stage["total_s"], stage["calls"], len(dataset.entries)))
+        return stage
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def main(argv: Optional[list] = None):
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Benchmark sintético del pipeline de ratios del BdE")
+    parser.add_argument("--scales", default="10,100,1000",
+                        help="Múltiplos del volumen actual separados por comas (por defecto 10,100,1000)")
+    parser.add_argument("--sample", type=int, default=None,
+                        help="Medir las etapas por archivo sobre N archivos y extrapolar")
+    parser.add_argument("--download-sample", type=int, default=200,
+                        help="Descargas a medir contra el servidor simulado (0 = todas)")
+    parser.add_argument("--unique-files", type=int, default=200,
+                        help="Contenidos distintos de archivo generados (el resto son copias)")
+    parser.add_argument("--seed", type=int, default=0, help="Semilla de los datos sintéticos")
+    parser.add_argument("--workdir", default=None, help="Directorio temporal (por defecto el del sistema)")
+    parser.add_argument("--output", default="benchmark_results.json", help="Fichero JSON de resultados")
+    args = parser.parse_args(argv)
+    if xlwt is None:
+        parser.error("hace falta xlwt para generar .xls reales (pip install -r requirements.txt)")
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    # Los scripts del pipeline registran una línea por archivo; aquí solo interesan los tiempos
+    for script in (SCRIPT_CARGA, SCRIPT_DESCARGA):
+        logging.getLogger(cargar_script(script).__name__).setLevel(logging.WARNING)
+
+    scales = [float(s) for s in args.scales.split(",") if s.strip()]
+    workdir = Path(args.workdir) if args.workdir else None
+    if workdir:
+        workdir.mkdir(parents=True, exist_ok=True)
+
+    report = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "base_volume": {"files": BASE_FILES, "masterfile_years": BASE_YEARS},
+        "results": [],
+    }
+    for scale in scales:
+        result = run_scale(scale, workdir, args.sample, args.download_sample, args.unique_files, args.seed)
+        report["results"].append(result)
+        for name, stage in result["stages"].items():
+            logger.info(f"  {name:<28} {stage['estimated_total_s']:>10.3f} s "
+                        f"({stage['per_call_ms']:.3f} ms x {stage['calls']}"
+                        f"{', muestra' if stage['sampled'] else ''})")
+
+        # Guardar tras cada escala para no perder resultados si se interrumpe
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+
+    logger.info(f"Resultados guardados en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
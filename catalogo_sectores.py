@@ -0,0 +1,133 @@
+#!/usr/bin/env python3
+"""
+Catálogo de sectores del desplegable #sector de la web del BdE, guardado en disco.
+
+Lo escriben 2_Extrae lista CNAEs.py y 1_descargar_ratios_bde.py cada vez que
+leen el desplegable, y lo reutiliza el descargador mientras esté fresco (TTL)
+para no volver a leerlo. Cada sector guarda su valor, su texto, el código CNAE
+de 4 dígitos que le corresponde en el masterfile (la misma regla que
+transformar_nombre_archivo: A -> 0000, A01 -> 0100, A011 -> 0110) y la fecha en
+que se vio por última vez. También guarda las opciones de los desplegables de
+ejercicio, tamaño y país, que usa el barrido de descargas (barrido_descargas.py).
+
+Formato (downloads/catalogo_sectores.json):
+    {"actualizado": "2025-11-19T10:00:00", "ejercicio": "2023",
+     "opciones": {"ejercicio": [{"value": "2023", "text": "2023"}, ...],
+                  "dimension": [...], "pais": [...]},
+     "sectores": [{"value": "A011", "text": "A011 - Cultivos no perennes",
+                   "cnae": "0110", "visto": "2025-11-19T10:00:00"}, ...]}
+"""
+
+import json
+import os
+import re
+from datetime import datetime, timedelta
+
+RUTA_CATALOGO = os.path.join(os.path.dirname(os.path.abspath(__file__)), "downloads",
+                             "catalogo_sectores.json")
+
+# Horas que el catálogo se da por bueno sin volver a leer la web
+TTL_HORAS = 24
+
+# Desplegables del formulario, además del sector, cuyas opciones guarda el catálogo
+EJES_FORMULARIO = ("ejercicio", "dimension", "pais")
+
+def cnae_de_sector(valor):
+    """Código CNAE de 4 dígitos de un valor del desplegable (p. ej. 'A011' -> '0110'), o None"""
+    coincidencia = re.fullmatch(r'[A-Z](\d*)', valor or "")
+    if not coincidencia:
+        return None
+    numeros = coincidencia.group(1).ljust(3, '0')
+    return f"{numeros}0" if len(numeros) == 3 else None
+
+class CatalogoSectores:
+    """Catálogo de sectores con caducidad, guardado como JSON"""
+
+    def __init__(self, ruta=RUTA_CATALOGO, ttl_horas=TTL_HORAS):
+        self.ruta = ruta
+        self.ttl = timedelta(hours=ttl_horas)
+        self.actualizado = None
+        self.ejercicio = None
+        self.opciones = {}  # desplegable -> [{"value", "text"}]
+        self.entradas = {}  # value -> {"value", "text", "cnae", "visto"}
+        self._cargar()
+
+    def _cargar(self):
+        if not os.path.exists(self.ruta):
+            return
+        try:
+            with open(self.ruta, encoding="utf-8") as f:
+                datos = json.load(f)
+            self.actualizado = datetime.fromisoformat(datos["actualizado"])
+            self.ejercicio = datos.get("ejercicio")
+            self.opciones = datos.get("opciones", {})
+            self.entradas = {s["value"]: s for s in datos.get("sectores", [])}
+        except (OSError, ValueError, KeyError) as e:
+            print(f"⚠ Catálogo de sectores ilegible ({e}); se volverá a leer de la web")
+            self.actualizado = None
+            self.entradas = {}
+
+    def fresco(self):
+        """True si el catálogo existe, tiene ejercicio y se actualizó hace menos del TTL"""
+        return (self.actualizado is not None and bool(self.entradas) and bool(self.ejercicio)
+                and datetime.now() - self.actualizado < self.ttl)
+
+    def invalidar(self):
+        """Fuerza a leer de nuevo el desplegable en esta ejecución"""
+        self.actualizado = None
+
+    def actualizar(self, sectores, ejercicio=None, opciones=None):
+        """
+        Registra los sectores leídos del desplegable y guarda el catálogo.
+
+        Args:
+            sectores: Lista de {'value', 'text'} (como devuelve obtener_sectores)
+            ejercicio: Ejercicio seleccionado por defecto en el formulario
+            opciones: Opciones de los desplegables ejercicio, dimension y pais
+                ({desplegable: [{'value', 'text'}]})
+        """
+        ahora = datetime.now().isoformat(timespec='seconds')
+        for sector in sectores:
+            if not sector.get('value'):
+                continue
+            self.entradas[sector['value']] = {
+                "value": sector['value'],
+                "text": sector['text'],
+                "cnae": cnae_de_sector(sector['value']),
+                "visto": ahora,
+            }
+        self.actualizado = datetime.fromisoformat(ahora)
+        if ejercicio:
+            self.ejercicio = ejercicio
+        if opciones:
+            self.opciones = opciones
+        self._guardar()
+
+    def _guardar(self):
+        os.makedirs(os.path.dirname(self.ruta) or ".", exist_ok=True)
+        datos = {
+            "actualizado": self.actualizado.isoformat(timespec='seconds'),
+            "ejercicio": self.ejercicio,
+            "opciones": self.opciones,
+            "sectores": list(self.entradas.values()),
+        }
+        temporal = self.ruta + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as f:
+            json.dump(datos, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, self.ruta)
+
+    def sectores(self):
+        """Sectores vistos en la última lectura, con el formato de obtener_sectores"""
+        ultimo = self.actualizado.isoformat(timespec='seconds') if self.actualizado else None
+        return [{'value': s['value'], 'text': s['text']}
+                for s in self.entradas.values() if s['visto'] == ultimo]
+
+    def mapa_cnae(self):
+        """Diccionario valor del desplegable -> código CNAE de 4 dígitos"""
+        return {valor: s['cnae'] for valor, s in self.entradas.items() if s.get('cnae')}
+
+def cargar_mapa_cnae(ruta=RUTA_CATALOGO):
+    """Mapa valor -> CNAE del catálogo en disco (vacío si no existe), sin comprobar el TTL"""
+    if not os.path.exists(ruta):
+        return {}
+    return CatalogoSectores(ruta).mapa_cnae()
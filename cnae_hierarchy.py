@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice jerárquico de CNAE (clase -> grupo -> división -> sección) con búsqueda
+del antecesor más cercano que tiene datos.
+
+El masterfile usa claves de 4 dígitos generadas por transformar_nombre_archivo
+(3_Cambio nombre ficheros.py): la división A01 es 0100, el grupo A011 es 0110 y
+todas las secciones (A, B, ...) son 0000. Una empresa con la clase 0111 no tiene
+fila propia, y muchos grupos o divisiones no tienen datos ("Datos no
+disponibles" en la web del BdE). El índice precalcula, para cada año y cada una
+de las 10.000 claves posibles, el antecesor más cercano con datos, de modo que
+un lote de búsquedas se resuelve con indexado directo de arrays.
+
+Las secciones comparten la clave 0000 en el masterfile, así que la fila 0000
+solo se usa (como nivel "sección") si la lista de CNAEs tiene una única
+sección; si no, la búsqueda se detiene en la división.
+
+Uso:
+    python3 cnae_hierarchy.py 0111 4631 --year 2023
+"""
+
+import argparse
+import logging
+import re
+from pathlib import Path
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('class', 'group', 'division', 'section')
+N_KEYS = 10000
+
+# Clave de masterfile de cada nivel a partir de la clave de clase de 4 dígitos
+_ANCESTOR_DIVISORS = np.array([1, 10, 100, N_KEYS])
+
+CNAE_LIST_FILENAME = "lista CNAEs.txt"
+
+
+class HierarchyMatch(NamedTuple):
+    """Resultado de resolve(): un elemento por búsqueda."""
+    key: np.ndarray    # clave del masterfile usada (-1 si no hay datos en ningún nivel)
+    level: np.ndarray  # índice en LEVELS del nivel usado (-1 si no hay datos)
+
+
+def cnae_key(code) -> int:
+    """
+    Clave de 4 dígitos del masterfile para un código CNAE.
+
+    Acepta la clave del masterfile como entero o como texto de solo dígitos
+    (110, "110" o "0110" son el grupo 0110, tal como queda el CNAE del
+    masterfile al pasar por un CSV) y códigos del BdE con la letra de sección
+    ("A", "A01", "A011"), que se completan como en transformar_nombre_archivo.
+    Devuelve -1 si el código no es válido.
+    """
+    if isinstance(code, (float, np.floating)) and float(code).is_integer():
+        code = int(code)
+    if isinstance(code, (int, np.integer)):
+        return int(code) if 0 <= code < N_KEYS else -1
+    code = str(code).strip()
+    match = re.fullmatch(r'([A-Za-z]?)(\d*)', code)
+    if not match or not code:
+        return -1
+    letter, digits = match.groups()
+    if not letter:
+        return int(digits) if len(digits) <= 4 else -1
+    if len(digits) == 4:
+        return int(digits)
+    if len(digits) > 4:
+        return -1
+    return int(digits.ljust(3, '0') + '0')
+
+
+def key_level(keys: np.ndarray) -> np.ndarray:
+    """Índice en LEVELS según la forma de la clave (0111 clase, 0110 grupo, 0100 división, 0000 sección)."""
+    keys = np.asarray(keys)
+    return np.select([keys % 10 != 0, keys % 100 != 0, keys != 0], [0, 1, 2], 3).astype(np.int8)
+
+
+def read_cnae_list(path) -> List[str]:
+    """Códigos de sector de la lista generada por 2_Extrae lista CNAEs.py ("valor - texto")."""
+    codes = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            value = line.split(" - ", 1)[0].strip()
+            if value:
+                codes.append(value)
+    return codes
+
+
+class CnaeHierarchy:
+    """Resolución al antecesor con datos más cercano, precalculada por año."""
+
+    def __init__(self, available: Dict[int, Iterable[int]], sections: Optional[Dict[int, str]] = None):
+        """
+        Args:
+            available: {año: claves del masterfile con datos}
+            sections: {división (2 dígitos): letra de sección}, p. ej. de la lista de CNAEs
+        """
+        self.sections = dict(sections or {})
+        # La fila 0000 mezcla todas las secciones: solo sirve si hay una única sección
+        self.single_section = len(set(self.sections.values())) == 1
+        self.years = sorted(int(y) for y in available)
+        self.year_index = {year: i for i, year in enumerate(self.years)}
+
+        # Antecesores de cada clave posible: (N_KEYS, niveles)
+        keys = np.arange(N_KEYS)
+        ancestors = (keys[:, None] // _ANCESTOR_DIVISORS) * _ANCESTOR_DIVISORS
+
+        self.resolved = np.full((len(self.years), N_KEYS), -1, dtype=np.int16)
+        self.level = np.full((len(self.years), N_KEYS), -1, dtype=np.int8)
+        for i, year in enumerate(self.years):
+            has_data = np.zeros(N_KEYS, dtype=bool)
+            has_data[[k for k in available[year] if 0 <= k < N_KEYS]] = True
+            has_data[0] &= self.single_section
+            candidates = has_data[ancestors]
+            found = candidates.any(axis=1)
+            first = candidates.argmax(axis=1)
+            self.resolved[i, found] = ancestors[found, first[found]]
+            self.level[i, found] = key_level(self.resolved[i, found])
+
+    @classmethod
+    def from_frames(cls, masterfile_data: Dict[str, pd.DataFrame],
+                    cnae_codes: Optional[Iterable[str]] = None) -> 'CnaeHierarchy':
+        """
+        Construye el índice desde hojas con formato de masterfile ({año: DataFrame}).
+
+        Una clave tiene datos en un año si su fila tiene algún valor. Con la lista
+        de CNAEs del BdE se conoce además la sección de cada división.
+        """
+        available = {}
+        for year, df in masterfile_data.items():
+            if not str(year).isdigit() or 'CNAE' not in df.columns:
+                continue
+            values = df.drop(columns='CNAE').apply(pd.to_numeric, errors='coerce')
+            with_data = df.loc[values.notna().any(axis=1).to_numpy(), 'CNAE'].dropna()
+            available[int(year)] = with_data.astype(int).tolist()
+
+        sections = {}
+        for code in cnae_codes or ():
+            match = re.fullmatch(r'([A-Za-z])(\d{2})\d*', str(code).strip())
+            if match:
+                sections[int(match.group(2))] = match.group(1).upper()
+        return cls(available, sections)
+
+    @classmethod
+    def from_sources(cls, masterfile_path, cnae_list_path=None) -> 'CnaeHierarchy':
+        """Construye el índice desde el masterfile .xlsx y (opcionalmente) la lista de CNAEs."""
+        cnae_codes = None
+        if cnae_list_path and Path(cnae_list_path).exists():
+            cnae_codes = read_cnae_list(cnae_list_path)
+        elif cnae_list_path:
+            logger.warning(f"No se encontró la lista de CNAEs {cnae_list_path}; secciones desconocidas")
+        return cls.from_frames(pd.read_excel(masterfile_path, sheet_name=None), cnae_codes)
+
+    def resolve(self, cnae, year) -> HierarchyMatch:
+        """
+        Antecesor con datos más cercano para cada (cnae, año).
+
+        cnae puede contener enteros o códigos de texto (ver cnae_key); year,
+        enteros. Ambos con la misma longitud (o year escalar).
+        """
+        cnae = np.asarray(cnae)
+        if cnae.dtype.kind in 'iu':
+            keys = np.where((cnae >= 0) & (cnae < N_KEYS), cnae, -1).astype(np.int64)
+        else:
+            keys = pd.Series(cnae.ravel()).map(cnae_key).to_numpy(dtype=np.int64)
+        years = np.broadcast_to(np.asarray(year), keys.shape)
+        year_rows = pd.to_numeric(pd.Series(years.ravel()), errors='coerce').map(self.year_index)
+        year_rows = year_rows.fillna(-1).to_numpy(dtype=np.int64)
+
+        ok = (keys >= 0) & (year_rows >= 0)
+        key = np.full(keys.shape, -1, dtype=np.int64)
+        level = np.full(keys.shape, -1, dtype=np.int8)
+        key[ok] = self.resolved[year_rows[ok], keys[ok]]
+        level[ok] = self.level[year_rows[ok], keys[ok]]
+        return HierarchyMatch(key, level)
+
+    def resolve_one(self, cnae, year) -> Optional[tuple]:
+        """(clave, nivel) para una búsqueda suelta, o None si no hay datos."""
+        match = self.resolve([cnae], year)
+        if match.key[0] < 0:
+            return None
+        return int(match.key[0]), LEVELS[match.level[0]]
+
+    def section_of(self, cnae) -> Optional[str]:
+        """Letra de sección de un código (según la lista de CNAEs), si se conoce."""
+        key = cnae_key(cnae)
+        return self.sections.get(key // 100) if key >= 0 else None
+
+
+def main(argv: Optional[list] = None):
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Resuelve códigos CNAE al antecesor más cercano con datos")
+    parser.add_argument("cnaes", nargs="+", help="Códigos CNAE (p. ej. 0111, 4631 o A011)")
+    parser.add_argument("--year", type=int, required=True, help="Año (hoja del masterfile)")
+    parser.add_argument("--masterfile", default="CNAE masterfile.xlsx", help="Ruta al archivo masterfile")
+    parser.add_argument("--cnae-list", default=str(Path("downloads") / CNAE_LIST_FILENAME),
+                        help="Lista de CNAEs generada por 2_Extrae lista CNAEs.py")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    hierarchy = CnaeHierarchy.from_sources(args.masterfile, args.cnae_list)
+    match = hierarchy.resolve(args.cnaes, args.year)
+    for code, key, level in zip(args.cnaes, match.key, match.level):
+        if key < 0:
+            print(f"{code}: sin datos en {args.year}")
+            continue
+        section = hierarchy.section_of(code)
+        extra = f" (sección {section})" if section else ""
+        print(f"{code}: {int(key):04d} - nivel {LEVELS[level]}{extra}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Representación compacta en memoria de las hojas del masterfile.
+
+Cada hoja (año) se guarda como un YearBlock: los CNAE en un array int16 y todos
+los valores R##_Qn en un único bloque float64 contiguo (filas × columnas), con
+NaN donde falta el valor. Los nombres y el orden de las columnas (ratio y
+cuartil) viven en un SheetLayout compartido por todas las hojas en lugar de
+repetirse en cada DataFrame; cada bloque solo guarda qué columnas tiene su hoja.
+
+Los valores se guardan con la misma precisión con la que se leyeron (float64,
+como los lee openpyxl), así que reescribir el libro no cambia ninguna celda que
+no se haya actualizado. Una hoja que no cabe en este formato (un CNAE fuera del
+rango de int16 o no entero, o texto en una columna de valores) es un error: se
+lanza ValueError en lugar de convertirla con pérdida.
+
+Uso:
+    layout = SheetLayout(masterfile_columns()[1:])
+    block = YearBlock.from_frame(df, layout)
+    rows, new_cnaes = block.rows_for([100, 110])
+    block.values[rows, layout.positions(['R01_Q1'])[0]] = 1.5
+    block.to_frame()   # DataFrame con el formato del masterfile
+"""
+
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# CNAE de las filas sin código válido (int16 no admite NaN)
+MISSING_CNAE = -1
+
+# Mayor CNAE representable en el array int16
+MAX_CNAE = np.iinfo(np.int16).max
+
+
+def _first_invalid(original: pd.Series, valid: pd.Series) -> Optional[str]:
+    """Primer valor original no vacío que no es válido (para el mensaje de error), o None."""
+    bad = original.notna() & ~valid
+    return repr(original[bad].iloc[0]) if bad.any() else None
+
+
+class SheetLayout:
+    """Columnas de valores (sin CNAE) compartidas por todas las hojas."""
+
+    def __init__(self, columns: Iterable[str] = ()):
+        self.columns: List[str] = []
+        self.index: Dict[str, int] = {}
+        self.extend(columns)
+
+    def __len__(self) -> int:
+        return len(self.columns)
+
+    def extend(self, columns: Iterable[str]) -> np.ndarray:
+        """Añade las columnas que falten y devuelve la posición de cada una."""
+        for name in columns:
+            if name not in self.index:
+                self.index[name] = len(self.columns)
+                self.columns.append(name)
+        return self.positions(columns)
+
+    def positions(self, names) -> np.ndarray:
+        """Posición de cada nombre de columna (-1 si no existe), vectorizado sobre nombres repetidos."""
+        names = np.asarray(list(names) if not isinstance(names, np.ndarray) else names, dtype=str)
+        if names.size == 0:
+            return np.empty(0, dtype=np.int64)
+        unique, inverse = np.unique(names, return_inverse=True)
+        return np.array([self.index.get(name, -1) for name in unique.tolist()], dtype=np.int64)[inverse]
+
+
+class YearBlock:
+    """Una hoja del masterfile: CNAE int16 y bloque float64 (filas × columnas del layout)."""
+
+    def __init__(self, layout: SheetLayout, cnae: Optional[np.ndarray] = None,
+                 values: Optional[np.ndarray] = None, present: Optional[np.ndarray] = None):
+        """
+        Args:
+            layout: Columnas compartidas
+            cnae: Código CNAE de cada fila
+            values: Bloque (filas, len(layout)) con NaN donde falte el valor
+            present: Máscara de las columnas del layout que tiene la hoja
+        """
+        self.layout = layout
+        cnae = np.asarray(cnae if cnae is not None else [], dtype=np.int16)
+        self._n = len(cnae)
+        self._cnae = cnae.copy()
+        if values is None:
+            values = np.full((self._n, len(layout)), np.nan)
+        self._values = np.ascontiguousarray(values, dtype=np.float64)
+        self._present = (np.ones(len(layout), dtype=bool) if present is None
+                         else np.asarray(present, dtype=bool).copy())
+        self._row_of: Dict[int, int] = {}
+        for row, code in enumerate(self._cnae.tolist()):
+            if code != MISSING_CNAE:
+                self._row_of.setdefault(code, row)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, layout: SheetLayout, name: str = "") -> 'YearBlock':
+        """
+        Convierte una hoja leída con pandas (CNAE + columnas de valores).
+
+        Raises:
+            ValueError: Si un CNAE no es un entero entre 0 y MAX_CNAE o una
+                columna de valores tiene celdas no numéricas
+        """
+        sheet = f"Hoja '{name}': " if name else ""
+        if 'CNAE' in df.columns:
+            cnae = pd.to_numeric(df['CNAE'], errors='coerce')
+            invalid = _first_invalid(df['CNAE'], (cnae % 1 == 0) & (cnae >= 0) & (cnae <= MAX_CNAE))
+            if invalid is not None:
+                raise ValueError(f"{sheet}CNAE no válido {invalid} (se esperaba un entero entre 0 y {MAX_CNAE})")
+        else:
+            cnae = pd.Series(np.nan, index=df.index)
+        cnae = cnae.fillna(MISSING_CNAE).to_numpy(dtype=np.int64)
+
+        value_idx = [i for i, c in enumerate(df.columns) if str(c) != 'CNAE']
+        block = df.iloc[:, value_idx].apply(pd.to_numeric, errors='coerce')
+        for i, column in enumerate(value_idx):
+            invalid = _first_invalid(df.iloc[:, column], block.iloc[:, i].notna())
+            if invalid is not None:
+                raise ValueError(f"{sheet}valor no numérico {invalid} en la columna {df.columns[column]}")
+
+        positions = layout.extend([str(df.columns[i]) for i in value_idx])
+        values = np.full((len(df), len(layout)), np.nan)
+        values[:, positions] = block.to_numpy(dtype=np.float64)
+        present = np.zeros(len(layout), dtype=bool)
+        present[positions] = True
+        return cls(layout, cnae.astype(np.int16), values, present)
+
+    @classmethod
+    def empty_like(cls, other: 'YearBlock') -> 'YearBlock':
+        """Hoja vacía con las mismas columnas que otra (plantilla para años nuevos)."""
+        return cls(other.layout, present=other.present)
+
+    def __len__(self) -> int:
+        return self._n
+
+    @property
+    def cnae(self) -> np.ndarray:
+        return self._cnae[:self._n]
+
+    @property
+    def values(self) -> np.ndarray:
+        """Vista (filas, columnas) del bloque; se puede modificar en el sitio."""
+        self._sync_width()
+        return self._values[:self._n]
+
+    @property
+    def present(self) -> np.ndarray:
+        """Máscara de las columnas del layout que tiene la hoja."""
+        self._sync_width()
+        return self._present
+
+    @property
+    def nbytes(self) -> int:
+        """Memoria ocupada por los arrays (incluida la capacidad reservada)."""
+        return self._cnae.nbytes + self._values.nbytes + self._present.nbytes
+
+    def _sync_width(self):
+        # El layout es compartido: si otra hoja añadió columnas, este bloque las tiene vacías
+        extra = len(self.layout) - self._values.shape[1]
+        if extra > 0:
+            pad = np.full((self._values.shape[0], extra), np.nan)
+            self._values = np.ascontiguousarray(np.hstack([self._values, pad]))
+            self._present = np.concatenate([self._present, np.zeros(extra, dtype=bool)])
+
+    def _reserve(self, n_rows: int):
+        # Capacidad creciente (x2) para que añadir filas una a una no copie el bloque cada vez
+        if n_rows <= self._values.shape[0]:
+            return
+        capacity = max(n_rows, 2 * self._values.shape[0], 16)
+        values = np.full((capacity, len(self.layout)), np.nan)
+        values[:self._n] = self._values[:self._n]
+        cnae = np.full(capacity, MISSING_CNAE, dtype=np.int16)
+        cnae[:self._n] = self._cnae[:self._n]
+        self._values, self._cnae = values, cnae
+
+    def row_of(self, cnae: int) -> Optional[int]:
+        """Fila del CNAE (la primera si está repetido), o None."""
+        return self._row_of.get(int(cnae))
+
+    def rows_for(self, cnaes: Iterable[int]) -> Tuple[np.ndarray, List[int]]:
+        """
+        Fila de cada CNAE, añadiendo al final las de los CNAE que no existen.
+
+        Raises:
+            ValueError: Si un CNAE nuevo no es representable (ver from_frame)
+
+        Returns:
+            (filas en el orden de entrada, CNAE añadidos)
+        """
+        cnaes = [int(c) for c in cnaes]
+        new_cnaes = list(dict.fromkeys(c for c in cnaes if c not in self._row_of))
+        invalid = [c for c in new_cnaes if not 0 <= c <= MAX_CNAE]
+        if invalid:
+            raise ValueError(f"CNAE no válido {invalid[0]} (se esperaba un entero entre 0 y {MAX_CNAE})")
+        if new_cnaes:
+            self._sync_width()
+            self._reserve(self._n + len(new_cnaes))
+            for code in new_cnaes:
+                self._cnae[self._n] = code
+                self._row_of[code] = self._n
+                self._n += 1
+        return np.array([self._row_of[c] for c in cnaes], dtype=np.int64), new_cnaes
+
+    def value(self, cnae: int, column: str) -> Optional[float]:
+        """Valor de una celda como float de Python (None si está vacía o no existe)."""
+        row, col = self.row_of(cnae), self.layout.index.get(column)
+        if row is None or col is None or col >= self._values.shape[1]:
+            return None
+        value = float(self._values[row, col])
+        return None if value != value else value
+
+    def to_frame(self, sort: bool = True) -> pd.DataFrame:
+        """DataFrame con el formato del masterfile (CNAE + columnas de la hoja)."""
+        positions = np.flatnonzero(self.present)
+        values = self._values[:self._n, positions]
+        cnae = self.cnae.astype(np.int64)
+        missing = cnae == MISSING_CNAE
+        if missing.any():
+            cnae = np.where(missing, np.nan, cnae)
+        df = pd.DataFrame(values, columns=[self.layout.columns[i] for i in positions])
+        df.insert(0, 'CNAE', cnae)
+        if sort:
+            df = df.sort_values('CNAE', kind='stable').reset_index(drop=True)
+        return df
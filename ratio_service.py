@@ -0,0 +1,362 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Servicio local de consulta de ratios (HTTP/JSON, solo lectura).
+
+Carga el masterfile (o el almacén de ratios) una sola vez en un índice en
+memoria por (año, CNAE) y responde desde él, con una caché LRU para las
+consultas repetidas. Un hilo vigila el origen y, cuando save_masterfile (o una
+carga en el almacén) escribe una versión nueva, reconstruye el índice y lo
+sustituye sin cortar el servicio.
+
+Rutas:
+    GET  /health                          estado, años, sectores y caché
+    GET  /sector/<año>/<cnae>[?ratios=R01,R02]
+    GET  /series/<cnae>[?ratios=R01]      {año: {ratio: {Q1, Q2, Q3}}}
+    POST /batch   {"queries": [{"year": 2023, "cnae": "0100", "ratios": ["R01"]},
+                               {"cnae": "A01"}]}   (sin year: serie completa)
+
+El CNAE admite los mismos formatos que cnae_hierarchy.cnae_key (110, "110" o
+"0110" para el grupo 0110, o "A011"). Las respuestas de sector tienen el formato de RatioStore.get_sector.
+
+Uso:
+    python3 ratio_service.py --masterfile "CNAE masterfile.xlsx" --port 8780
+    curl http://127.0.0.1:8780/sector/2023/0100
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, Iterable, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import pandas as pd
+
+from cnae_hierarchy import cnae_key
+from ratio_store import QUARTILES, RATIO_CODES, RatioStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PORT = 8780
+DEFAULT_CACHE_SIZE = 4096
+
+# Segundos entre comprobaciones de si el origen ha cambiado
+DEFAULT_POLL_INTERVAL = 1.0
+
+SectorRatios = Dict[str, Dict[str, Optional[float]]]
+
+
+class RatioIndex:
+    """Instantánea inmutable de los ratios indexada por (año, CNAE)."""
+
+    def __init__(self, sectors: Dict[Tuple[int, int], SectorRatios], source: str = ""):
+        """
+        Args:
+            sectors: {(año, cnae): {ratio: {Q1, Q2, Q3}}}
+            source: Descripción del origen (para /health)
+        """
+        self.sectors = sectors
+        self.source = source
+        self.loaded_at = datetime.now()
+        self.years = sorted({year for year, _ in sectors})
+        self.cnae_years: Dict[int, list] = {}
+        for year, cnae in sorted(sectors):
+            self.cnae_years.setdefault(cnae, []).append(year)
+
+    @classmethod
+    def from_frames(cls, masterfile_data: Dict[str, pd.DataFrame], source: str = "") -> 'RatioIndex':
+        """Construye el índice desde hojas con formato de masterfile ({año: DataFrame})."""
+        sectors = {}
+        for sheet, df in masterfile_data.items():
+            if not str(sheet).isdigit() or 'CNAE' not in df.columns:
+                continue
+            year = int(sheet)
+            df = df.dropna(subset=['CNAE'])
+            codes = [code for code in RATIO_CODES if f"{code}_Q1" in df.columns]
+            columns = [f"{code}_{q}" for code in codes for q in QUARTILES]
+            values = df.reindex(columns=columns).apply(pd.to_numeric, errors='coerce').to_numpy()
+            for cnae, row in zip(df['CNAE'].astype(int), values.tolist()):
+                ratios = {}
+                for i, code in enumerate(codes):
+                    quartiles = row[3 * i:3 * i + 3]
+                    if any(not math.isnan(v) for v in quartiles):
+                        ratios[code] = {q: None if math.isnan(v) else v
+                                        for q, v in zip(QUARTILES, quartiles)}
+                sectors[(year, int(cnae))] = ratios
+        return cls(sectors, source)
+
+    @classmethod
+    def from_masterfile(cls, masterfile_path: str) -> 'RatioIndex':
+        """Lee todas las hojas del masterfile .xlsx una vez."""
+        return cls.from_frames(pd.read_excel(masterfile_path, sheet_name=None), str(masterfile_path))
+
+    @classmethod
+    def from_store(cls, store: RatioStore) -> 'RatioIndex':
+        """Construye el índice desde el almacén de ratios."""
+        frames = {str(year): store.year_frame(year) for year in store.years()}
+        return cls.from_frames(frames, str(store.path))
+
+    def sector(self, year: int, cnae: int, ratios: Optional[Tuple[str, ...]] = None) -> Optional[SectorRatios]:
+        """Ratios de un sector-año ({} si la fila existe sin datos, None si no existe)."""
+        found = self.sectors.get((year, cnae))
+        if found is None or ratios is None:
+            return found
+        return {code: found[code] for code in ratios if code in found}
+
+    def series(self, cnae: int, ratios: Optional[Tuple[str, ...]] = None) -> Optional[Dict[int, SectorRatios]]:
+        """Serie temporal de un sector ({año: ratios}), o None si el CNAE no existe."""
+        years = self.cnae_years.get(cnae)
+        if years is None:
+            return None
+        return {year: self.sector(year, cnae, ratios) for year in years}
+
+
+class RatioService:
+    """Índice vigente, caché LRU y recarga en caliente."""
+
+    def __init__(self, load: Callable[[], RatioIndex], signature: Callable[[], object],
+                 cache_size: int = DEFAULT_CACHE_SIZE):
+        """
+        Args:
+            load: Construye un índice nuevo desde el origen
+            signature: Valor que cambia cuando cambia el origen (mtime, data_version...)
+            cache_size: Entradas de la caché LRU
+        """
+        self._load = load
+        self._signature = signature
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        self.reloads = 0
+        # La instantánea forma parte de la clave: tras una recarga las entradas
+        # antiguas no se vuelven a servir aunque una consulta en curso las guarde
+        self._cached = lru_cache(maxsize=cache_size)(self._query)
+        self.current_signature = signature()
+        self.index = self._build()
+
+    @classmethod
+    def for_masterfile(cls, masterfile_path: str, **kwargs) -> 'RatioService':
+        """Servicio sobre el masterfile .xlsx (se recarga al cambiar el fichero)."""
+        def signature():
+            try:
+                stat = os.stat(masterfile_path)
+            except FileNotFoundError:
+                return None
+            return stat.st_mtime_ns, stat.st_size, stat.st_ino
+        return cls(lambda: RatioIndex.from_masterfile(masterfile_path), signature, **kwargs)
+
+    @classmethod
+    def for_store(cls, store: RatioStore, **kwargs) -> 'RatioService':
+        """Servicio sobre el almacén de ratios (se recarga tras cada carga confirmada)."""
+        return cls(lambda: RatioIndex.from_store(store), store.data_version, **kwargs)
+
+    def _build(self) -> RatioIndex:
+        start = time.perf_counter()
+        index = self._load()
+        logger.info(f"Índice cargado desde {index.source}: {len(index.sectors)} sectores-año, "
+                    f"{len(index.years)} años en {time.perf_counter() - start:.2f} s")
+        return index
+
+    # ------------------------------------------------------------------
+    # Consultas
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _query(index: RatioIndex, kind: str, key: tuple):
+        if kind == 'sector':
+            return index.sector(*key)
+        return index.series(*key)
+
+    def sector(self, year, cnae, ratios: Optional[Iterable[str]] = None) -> Optional[SectorRatios]:
+        """Ratios de un sector-año (cnae en cualquier formato de cnae_key)."""
+        ratios = tuple(ratios) if ratios else None
+        return self._cached(self.index, 'sector', (int(year), cnae_key(cnae), ratios))
+
+    def series(self, cnae, ratios: Optional[Iterable[str]] = None) -> Optional[Dict[int, SectorRatios]]:
+        """Serie temporal de un sector."""
+        ratios = tuple(ratios) if ratios else None
+        return self._cached(self.index, 'series', (cnae_key(cnae), ratios))
+
+    def batch(self, queries: Iterable[dict]) -> list:
+        """Resuelve una lista de consultas {year?, cnae, ratios?} (sin year: serie)."""
+        results = []
+        for query in queries:
+            cnae, ratios = query.get('cnae'), query.get('ratios')
+            try:
+                if query.get('year') is None:
+                    results.append({'cnae': cnae, 'series': self.series(cnae, ratios)})
+                else:
+                    results.append({'year': query['year'], 'cnae': cnae,
+                                    'ratios': self.sector(query['year'], cnae, ratios)})
+            except (ValueError, TypeError) as e:
+                results.append({**query, 'error': f"Consulta no válida: {e}"})
+        return results
+
+    def health(self) -> dict:
+        """Estado del índice y de la caché."""
+        info = self._cached.cache_info()
+        return {
+            'source': self.index.source,
+            'loaded_at': self.index.loaded_at.isoformat(timespec='seconds'),
+            'reloads': self.reloads,
+            'years': self.index.years,
+            'sectors': len(self.index.sectors),
+            'cache': {'hits': info.hits, 'misses': info.misses, 'size': info.currsize,
+                      'max_size': info.maxsize},
+        }
+
+    # ------------------------------------------------------------------
+    # Recarga en caliente
+    # ------------------------------------------------------------------
+
+    def reload_if_changed(self) -> bool:
+        """Reconstruye el índice si el origen ha cambiado; True si se recargó."""
+        with self._reload_lock:
+            signature = self._signature()
+            if signature == self.current_signature or signature is None:
+                return False
+            try:
+                index = self._build()
+            except Exception as e:
+                # Fichero a medio escribir o ilegible: se reintenta en la siguiente vuelta
+                logger.warning(f"No se pudo recargar el índice ({e}); se mantiene el anterior")
+                return False
+            self.index = index
+            self.current_signature = signature
+            self.reloads += 1
+            self._cached.cache_clear()
+            return True
+
+    def start_watching(self, interval: float = DEFAULT_POLL_INTERVAL):
+        """Comprueba el origen cada `interval` segundos en un hilo aparte."""
+        def watch():
+            while not self._stop.wait(interval):
+                self.reload_if_changed()
+        self._watcher = threading.Thread(target=watch, name="ratio-service-watch", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """Detiene el hilo de vigilancia."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+
+class RatioServer(ThreadingHTTPServer):
+    """Servidor HTTP del servicio de consulta."""
+
+    daemon_threads = True
+
+    def __init__(self, address, service: RatioService):
+        super().__init__(address, _RatioHandler)
+        self.service = service
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+class _RatioHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Permite conexiones keep-alive
+    disable_nagle_algorithm = True  # Cabeceras y cuerpo van en escrituras separadas
+
+    def log_message(self, format, *args):
+        pass  # Silenciar el log por petición
+
+    def _send_json(self, data, status: int = 200):
+        body = json.dumps(data, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _not_found(self, message: str):
+        self._send_json({'error': message}, 404)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = [p for p in url.path.split("/") if p]
+        params = parse_qs(url.query)
+        ratios = params['ratios'][0].split(",") if 'ratios' in params else None
+        service = self.server.service
+        try:
+            if parts == ['health']:
+                self._send_json(service.health())
+            elif len(parts) == 3 and parts[0] == 'sector':
+                result = service.sector(parts[1], parts[2], ratios)
+                if result is None:
+                    self._not_found(f"Sin fila para el año {parts[1]} y el CNAE {parts[2]}")
+                else:
+                    self._send_json({'year': int(parts[1]), 'cnae': parts[2], 'ratios': result})
+            elif len(parts) == 2 and parts[0] == 'series':
+                result = service.series(parts[1], ratios)
+                if result is None:
+                    self._not_found(f"Sin filas para el CNAE {parts[1]}")
+                else:
+                    self._send_json({'cnae': parts[1], 'series': result})
+            else:
+                self._not_found(f"Ruta desconocida: {url.path}")
+        except ValueError as e:
+            self._send_json({'error': str(e)}, 400)
+
+    def do_POST(self):
+        if urlparse(self.path).path != "/batch":
+            self._not_found(f"Ruta desconocida: {self.path}")
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            self._send_json({'results': self.server.service.batch(payload.get('queries', []))})
+        except (ValueError, TypeError, KeyError, AttributeError) as e:
+            self._send_json({'error': f"Consulta no válida: {e}"}, 400)
+
+
+def main(argv: Optional[list] = None):
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Servicio local de consulta de ratios (HTTP/JSON)")
+    parser.add_argument("--masterfile", default="CNAE masterfile.xlsx", help="Ruta al archivo masterfile")
+    parser.add_argument("--store", default=None, help="Servir el almacén SQLite de ratios en lugar del masterfile")
+    parser.add_argument("--host", default="127.0.0.1", help="Dirección de escucha (por defecto solo local)")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT,
+                        help=f"Puerto de escucha (por defecto {DEFAULT_PORT})")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help=f"Entradas de la caché LRU (por defecto {DEFAULT_CACHE_SIZE})")
+    parser.add_argument("--poll-interval", type=float, default=DEFAULT_POLL_INTERVAL,
+                        help="Segundos entre comprobaciones de cambios del origen (0 = sin recarga)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    store = RatioStore(args.store) if args.store else None
+    if store is not None:
+        service = RatioService.for_store(store, cache_size=args.cache_size)
+    else:
+        service = RatioService.for_masterfile(args.masterfile, cache_size=args.cache_size)
+    if args.poll_interval > 0:
+        service.start_watching(args.poll_interval)
+
+    server = RatioServer((args.host, args.port), service)
+    logger.info(f"Servicio de ratios escuchando en {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.stop_watching()
+        if store is not None:
+            store.close()
+        logger.info("Servicio detenido")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Almacén de ratios del Banco de España en formato largo (SQLite).
+
+Guarda cada valor como una fila (año, CNAE, ratio, cuartil, valor) con clave
+primaria (year, cnae, ratio, quartile), de modo que consultar un sector-año es
+una búsqueda indexada y cada carga solo escribe los valores que trae. El
+masterfile .xlsx pasa a ser una exportación que se genera bajo demanda.
+
+Uso:
+    from ratio_store import RatioStore
+
+    store = RatioStore("ratios.sqlite")
+    store.import_masterfile("CNAE masterfile.xlsx")   # carga inicial
+    store.get_sector(2023, 100)                          # {R01: {Q1, Q2, Q3}, ...}
+    store.export_xlsx("CNAE masterfile.xlsx")
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+QUARTILES = ('Q1', 'Q2', 'Q3')
+
+# Orden de los ratios en el masterfile (el mismo que en los archivos del BdE)
+RATIO_CODES = (["R01", "R02", "R03", "R04", "R05", "R16", "R10", "R11", "R12",
+                "R17", "R18", "R19", "R20", "R07", "R06", "R09", "R08", "R13", "R14", "R15"]
+               + [f"R{i:02d}" for i in range(21, 29)] + ["T1"])
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ratios (
+    year INTEGER NOT NULL,
+    cnae INTEGER NOT NULL,
+    ratio TEXT NOT NULL,
+    quartile TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (year, cnae, ratio, quartile)
+) WITHOUT ROWID;
+
+CREATE INDEX IF NOT EXISTS ratios_cnae ON ratios (cnae, year);
+
+-- Filas (año, CNAE) del masterfile, aunque todavía no tengan valores
+CREATE TABLE IF NOT EXISTS sectors (
+    year INTEGER NOT NULL,
+    cnae INTEGER NOT NULL,
+    PRIMARY KEY (year, cnae)
+) WITHOUT ROWID;
+
+CREATE TABLE IF NOT EXISTS loads (
+    id INTEGER PRIMARY KEY,
+    loaded_at TEXT NOT NULL,
+    files INTEGER NOT NULL,
+    cells INTEGER NOT NULL
+);
+"""
+
+
+def masterfile_columns(ratio_codes: Iterable[str] = RATIO_CODES) -> List[str]:
+    """Columnas del masterfile: CNAE y R##_Qn en el orden habitual."""
+    return ['CNAE'] + [f"{code}_{q}" for code in ratio_codes for q in QUARTILES]
+
+
+class RatioStore:
+    """Almacén de ratios en formato largo sobre SQLite."""
+
+    def __init__(self, path: str):
+        """
+        Abre (o crea) el almacén.
+
+        Args:
+            path: Ruta al fichero SQLite
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self.conn = sqlite3.connect(str(self.path), check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        """Cierra la conexión."""
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # ------------------------------------------------------------------
+    # Escritura
+    # ------------------------------------------------------------------
+
+    def upsert_long(self, rows: Iterable[Tuple[int, int, str, str, float]],
+                    sectors: Iterable[Tuple[int, int]] = ()) -> int:
+        """
+        Inserta o actualiza valores en formato largo en una sola transacción.
+
+        Args:
+            rows: Tuplas (year, cnae, ratio, quartile, value); se ignoran los NaN
+            sectors: Filas (year, cnae) a registrar aunque no traigan valores
+
+        Returns:
+            Número de valores escritos
+        """
+        clean = [(int(y), int(c), str(r), str(q), float(v))
+                 for y, c, r, q, v in rows if v is not None and v == v]
+        keys = {(int(y), int(c)) for y, c in sectors} | {(y, c) for y, c, _, _, _ in clean}
+        with self._lock, self.conn:
+            self.conn.executemany("INSERT OR IGNORE INTO sectors (year, cnae) VALUES (?, ?)", sorted(keys))
+            self.conn.executemany(
+                "INSERT INTO ratios (year, cnae, ratio, quartile, value) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT (year, cnae, ratio, quartile) DO UPDATE SET value = excluded.value",
+                clean,
+            )
+        return len(clean)
+
+    def upsert_parsed(self, parsed_files: List[Tuple[str, str, object]]) -> int:
+        """
+        Guarda los ratios de una carga de archivos.
+
+        Args:
+            parsed_files: Lista de (año, cnae, ratios) con ratios como RatiosArray
+                (codes, values) o como diccionario {ratio: {Q1, Q2, Q3}}
+
+        Returns:
+            Número de valores escritos
+        """
+        rows = []
+        sectors = [(year, cnae) for year, cnae, _ in parsed_files]
+        for year, cnae, ratios in parsed_files:
+            if isinstance(ratios, dict):
+                items = ((code, [vals.get(q) for q in QUARTILES]) for code, vals in ratios.items())
+            else:
+                items = zip(ratios.codes.tolist(), ratios.values.tolist())
+            for code, values in items:
+                for quartile, value in zip(QUARTILES, values):
+                    rows.append((year, cnae, code, quartile, value))
+
+        cells = self.upsert_long(rows, sectors)
+        with self._lock, self.conn:
+            self.conn.execute("INSERT INTO loads (loaded_at, files, cells) VALUES (?, ?, ?)",
+                              (datetime.now().isoformat(timespec='seconds'), len(parsed_files), cells))
+        logger.info(f"Almacén de ratios: {cells} valores de {len(parsed_files)} archivos guardados")
+        return cells
+
+    def import_frame(self, year, df: pd.DataFrame) -> int:
+        """Importa una hoja con formato de masterfile (CNAE + R##_Qn) para un año."""
+        value_cols = [c for c in df.columns if c != 'CNAE' and '_' in str(c)]
+        df = df.dropna(subset=['CNAE'])
+        long = df.melt(id_vars='CNAE', value_vars=value_cols, var_name='column', value_name='value')
+        long = long[long['value'].notna()]
+        parts = long['column'].astype(str).str.rsplit('_', n=1, expand=True)
+        return self.upsert_long(zip([int(year)] * len(long), long['CNAE'].astype(int),
+                                    parts[0], parts[1], long['value'].astype(float)),
+                                sectors=((int(year), cnae) for cnae in df['CNAE'].astype(int)))
+
+    def import_masterfile(self, masterfile_path: str) -> int:
+        """Carga en el almacén todas las hojas de año de un masterfile .xlsx."""
+        total = 0
+        with pd.ExcelFile(masterfile_path) as xl_file:
+            for sheet_name in xl_file.sheet_names:
+                if not str(sheet_name).isdigit():
+                    continue
+                df = xl_file.parse(sheet_name)
+                if 'CNAE' not in df.columns:
+                    continue
+                cells = self.import_frame(sheet_name, df)
+                logger.info(f"Importada hoja '{sheet_name}' al almacén ({cells} valores)")
+                total += cells
+        return total
+
+    # ------------------------------------------------------------------
+    # Consulta
+    # ------------------------------------------------------------------
+
+    def data_version(self) -> int:
+        """Valor que cambia cada vez que otra conexión confirma cambios (PRAGMA data_version)."""
+        with self._lock:
+            return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def years(self) -> List[int]:
+        """Años presentes en el almacén."""
+        with self._lock:
+            return [y for (y,) in self.conn.execute("SELECT DISTINCT year FROM sectors ORDER BY year")]
+
+    def get_sector(self, year, cnae) -> Dict[str, Dict[str, Optional[float]]]:
+        """Ratios de un sector-año en el formato {ratio: {Q1, Q2, Q3}} (vacío si no hay datos)."""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT ratio, quartile, value FROM ratios WHERE year = ? AND cnae = ?",
+                (int(year), int(cnae)),
+            ).fetchall()
+        result: Dict[str, Dict[str, Optional[float]]] = {}
+        for ratio, quartile, value in rows:
+            result.setdefault(ratio, dict.fromkeys(QUARTILES))[quartile] = value
+        return {code: result[code] for code in _ordered_codes(result)}
+
+    def sector_series(self, cnae) -> pd.DataFrame:
+        """Serie temporal de un sector: una fila por año con las columnas R##_Qn."""
+        with self._lock:
+            long = pd.read_sql_query(
+                "SELECT year, ratio || '_' || quartile AS column, value FROM ratios WHERE cnae = ?",
+                self.conn, params=(int(cnae),),
+            )
+        return self._pivot(long, 'year')
+
+    def year_frame(self, year) -> pd.DataFrame:
+        """Hoja de un año con el formato del masterfile (CNAE + R##_Qn)."""
+        with self._lock:
+            long = pd.read_sql_query(
+                "SELECT cnae, ratio || '_' || quartile AS column, value FROM ratios WHERE year = ?",
+                self.conn, params=(int(year),),
+            )
+            cnaes = [c for (c,) in self.conn.execute(
+                "SELECT cnae FROM sectors WHERE year = ? ORDER BY cnae", (int(year),))]
+        wide = self._pivot(long, 'cnae').set_index('cnae').reindex(cnaes)
+        return wide.rename_axis('CNAE').reset_index()
+
+    @staticmethod
+    def _pivot(long: pd.DataFrame, index: str) -> pd.DataFrame:
+        if long.empty:
+            return pd.DataFrame(columns=[index] + masterfile_columns()[1:])
+        wide = long.pivot(index=index, columns='column', values='value')
+        extra = sorted(set(wide.columns) - set(masterfile_columns()))
+        wide = wide.reindex(columns=masterfile_columns()[1:] + extra)
+        return wide.sort_index().reset_index()
+
+    # ------------------------------------------------------------------
+    # Exportación
+    # ------------------------------------------------------------------
+
+    def export_xlsx(self, output_path: str, years: Optional[Iterable[int]] = None):
+        """
+        Genera un masterfile .xlsx (una hoja por año) a partir del almacén.
+
+        Se escribe en un fichero temporal que después sustituye al destino.
+        """
+        output_path = Path(output_path)
+        tmp_path = output_path.with_name(f".{output_path.name}.tmp")
+        selected = sorted(int(y) for y in (years if years is not None else self.years()))
+        try:
+            with pd.ExcelWriter(tmp_path, engine='openpyxl') as writer:
+                for year in selected:
+                    df = self.year_frame(year)
+                    df.to_excel(writer, sheet_name=str(year), index=False)
+                    logger.info(f"Exportada hoja '{year}' con {len(df)} filas")
+            os.replace(tmp_path, output_path)
+        except Exception:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            raise
+        logger.info(f"Masterfile exportado desde el almacén en {output_path}")
+
+
+def _ordered_codes(codes: Iterable[str]) -> List[str]:
+    """Ordena los códigos de ratio como en el masterfile (los desconocidos al final)."""
+    position = {code: i for i, code in enumerate(RATIO_CODES)}
+    return sorted(codes, key=lambda code: (position.get(code, len(position)), code))
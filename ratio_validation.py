@@ -0,0 +1,297 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Validación vectorizada de los ratios parseados antes de cargarlos.
+
+Todo el lote se coloca en un único array (archivos, ratios R01–R28/T1, Q1-Q3)
+y cada comprobación es una operación sobre ese array:
+
+- order: los cuartiles con los tres valores deben cumplir Q1 <= Q2 <= Q3
+- coverage: qué códigos esperados faltan (sin ningún valor) y cuáles no se
+  esperaban (p. ej. una fila de otra tabla leída como ratio)
+- yoy: diferencia con el mismo CNAE, ratio y cuartil del año anterior (del lote
+  o de la hoja del masterfile), centrada en cero y medida en unidades de la
+  dispersión robusta (MAD) de ese ratio y cuartil entre sectores el año
+  anterior. Ni el centro ni la escala salen de los valores nuevos, así que un
+  cambio de formato que afecta a todos los archivos del lote también se
+  detecta. Solo se evalúa si hay al menos `min_yoy_samples` comparaciones.
+
+Un archivo va a cuarentena si su CNAE no está entre 0000 y 9999, si su
+cobertura es inferior a `min_coverage`, si más de `max_order_fraction` de sus
+ratios tienen los cuartiles desordenados o si más de `max_yoy_fraction` de sus
+valores comparables son atípicos: lo que deja un cambio de formato del BdE que
+desplaza filas o columnas. Los umbrales aún no están calibrados con muchos
+años de datos, así que la carga solo excluye esos archivos y los deja en su
+sitio salvo que se pida moverlos (--quarantine).
+
+Uso:
+    validator = RatioValidator()
+    report = validator.validate(names, years, cnaes, ratios, reference)
+    report.quarantined        # nombres de archivo que no se cargan
+    report.save("validation_report.json")
+"""
+
+import json
+import os
+import warnings
+from datetime import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from ratio_store import QUARTILES, RATIO_CODES
+
+# Tolerancia relativa al comparar cuartiles (redondeos del BdE)
+ORDER_TOLERANCE = 1e-6
+
+# Salto interanual, en dispersiones entre sectores del año anterior, a partir del
+# cual un valor es atípico (con datos reales del BdE, como mucho un tercio de los
+# valores de un archivo correcto lo superan; más de un 45 % si se desplaza una fila)
+YOY_Z_THRESHOLD = 1.5
+
+# Comparaciones mínimas por ratio y cuartil para estimar la dispersión
+MIN_YOY_SAMPLES = 10
+
+# Comparaciones mínimas de un archivo para juzgarlo por sus saltos interanuales
+MIN_YOY_COMPARED = 10
+
+# Umbrales de cuarentena
+MIN_COVERAGE = 0.5
+MAX_ORDER_FRACTION = 0.1
+MAX_YOY_FRACTION = 0.4
+
+# Escala mínima de la z robusta, relativa a la mediana de |valor anterior|,
+# para que un ratio casi constante (MAD ~ 0) no marque cualquier cambio
+MIN_SCALE_FRACTION = 0.01
+
+N_CNAE_KEYS = 10000
+
+
+class YearReference(NamedTuple):
+    """Valores de un año ya cargado: CNAE (n,) y cuartiles (n, ratios esperados, 3)."""
+    cnae: np.ndarray
+    values: np.ndarray
+
+
+def reference_from_frame(df: pd.DataFrame, codes: Sequence[str] = RATIO_CODES) -> YearReference:
+    """Referencia desde una hoja con formato de masterfile (CNAE + R##_Qn)."""
+    df = df.dropna(subset=['CNAE'])
+    columns = [f"{code}_{q}" for code in codes for q in QUARTILES]
+    values = df.reindex(columns=columns).apply(pd.to_numeric, errors='coerce').to_numpy(dtype=np.float64)
+    return YearReference(df['CNAE'].to_numpy(dtype=np.int64),
+                         values.reshape(len(df), len(codes), len(QUARTILES)))
+
+
+def _code_positions(codes: np.ndarray, expected_index: Dict[str, int]) -> np.ndarray:
+    if codes.size == 0:
+        return np.empty(0, dtype=np.int64)
+    unique, inverse = np.unique(codes.astype(str), return_inverse=True)
+    return np.array([expected_index.get(code, -1) for code in unique.tolist()], dtype=np.int64)[inverse]
+
+
+def _as_list(values: np.ndarray) -> list:
+    """Array -> listas de Python para el informe JSON (NaN como None)."""
+    return np.where(np.isnan(values), None, values).tolist()
+
+
+class ValidationReport:
+    """Resultado de una validación: resumen por archivo, incidencias y cuarentena."""
+
+    def __init__(self, files: List[dict], issues: List[dict], settings: dict):
+        self.created_at = datetime.now()
+        self.files = files
+        self.issues = issues
+        self.settings = settings
+
+    @classmethod
+    def merge(cls, reports: Sequence['ValidationReport']) -> 'ValidationReport':
+        """Une los informes de varios lotes validados por separado."""
+        if len(reports) == 1:
+            return reports[0]
+        return cls([f for r in reports for f in r.files], [i for r in reports for i in r.issues],
+                   reports[0].settings)
+
+    @property
+    def quarantined(self) -> List[str]:
+        """Archivos que no deben cargarse."""
+        return [f['file'] for f in self.files if f['quarantined']]
+
+    def to_dict(self) -> dict:
+        counts: Dict[str, int] = {}
+        for issue in self.issues:
+            counts[issue['check']] = counts.get(issue['check'], 0) + 1
+        return {
+            'created_at': self.created_at.isoformat(timespec='seconds'),
+            'settings': self.settings,
+            'summary': {'files': len(self.files), 'quarantined': len(self.quarantined),
+                        'issues': counts},
+            'files': self.files,
+            'issues': self.issues,
+        }
+
+    def save(self, path):
+        """Guarda el informe en JSON (mediante un fichero temporal)."""
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class RatioValidator:
+    """Comprobaciones vectorizadas sobre un lote de archivos parseados."""
+
+    def __init__(self, expected_codes: Iterable[str] = RATIO_CODES, yoy_z: float = YOY_Z_THRESHOLD,
+                 min_yoy_samples: int = MIN_YOY_SAMPLES, min_yoy_compared: int = MIN_YOY_COMPARED,
+                 min_coverage: float = MIN_COVERAGE, max_order_fraction: float = MAX_ORDER_FRACTION,
+                 max_yoy_fraction: float = MAX_YOY_FRACTION):
+        self.expected_codes = list(expected_codes)
+        self.expected_index = {code: i for i, code in enumerate(self.expected_codes)}
+        self.yoy_z = yoy_z
+        self.min_yoy_samples = min_yoy_samples
+        self.min_yoy_compared = min_yoy_compared
+        self.min_coverage = min_coverage
+        self.max_order_fraction = max_order_fraction
+        self.max_yoy_fraction = max_yoy_fraction
+
+    def settings(self) -> dict:
+        return {'yoy_z': self.yoy_z, 'min_yoy_samples': self.min_yoy_samples,
+                'min_yoy_compared': self.min_yoy_compared, 'min_coverage': self.min_coverage,
+                'max_order_fraction': self.max_order_fraction, 'max_yoy_fraction': self.max_yoy_fraction}
+
+    def _stack(self, ratios: Sequence) -> tuple:
+        """Array (archivos, ratios esperados, 3) y códigos no esperados por archivo."""
+        n, n_codes = len(ratios), len(self.expected_codes)
+        values = np.full((n, n_codes, len(QUARTILES)), np.nan)
+        sizes = np.array([len(r.codes) for r in ratios], dtype=np.int64)
+        unknown: List[List[str]] = [[] for _ in range(n)]
+        if sizes.sum() == 0:
+            return values, unknown
+        file_idx = np.repeat(np.arange(n), sizes)
+        codes = np.concatenate([np.asarray(r.codes, dtype=str) for r in ratios])
+        block = np.concatenate([np.asarray(r.values, dtype=np.float64).reshape(-1, 3) for r in ratios])
+        positions = _code_positions(codes, self.expected_index)
+        known = positions >= 0
+        values[file_idx[known], positions[known]] = block[known]
+        for i, code in zip(file_idx[~known].tolist(), codes[~known].tolist()):
+            unknown[i].append(code)
+        return values, unknown
+
+    def _previous(self, years: np.ndarray, cnaes: np.ndarray, values: np.ndarray,
+                  reference: Dict[int, YearReference], valid: np.ndarray) -> np.ndarray:
+        """Valores del año anterior para cada archivo (NaN si no hay o si el CNAE no es válido)."""
+        previous = np.full_like(values, np.nan)
+        for year in np.unique(years[valid]).tolist():
+            rows = np.flatnonzero(valid & (years == year))
+            lookup = np.full(N_CNAE_KEYS, -1, dtype=np.int64)
+            ref = reference.get(year - 1)
+            sources = []
+            if ref is not None and len(ref.cnae):
+                ok = (ref.cnae >= 0) & (ref.cnae < N_CNAE_KEYS)
+                # La primera fila de cada CNAE, como al actualizar el masterfile
+                keys, first = np.unique(ref.cnae[ok], return_index=True)
+                sources.append(ref.values[ok][first])
+                lookup[keys] = np.arange(len(keys))
+            # El propio lote manda sobre la hoja: es lo que quedará cargado
+            same_batch = np.flatnonzero(valid & (years == year - 1))
+            if len(same_batch):
+                offset = sum(len(s) for s in sources)
+                sources.append(values[same_batch])
+                lookup[cnaes[same_batch]] = offset + np.arange(len(same_batch))
+            if not sources:
+                continue
+            pool = np.concatenate(sources)
+            found = lookup[cnaes[rows]]
+            has = found >= 0
+            previous[rows[has]] = pool[found[has]]
+        return previous
+
+    def validate(self, names: Sequence[str], years: Sequence, cnaes: Sequence, ratios: Sequence,
+                 reference: Optional[Dict[int, YearReference]] = None) -> ValidationReport:
+        """
+        Valida un lote.
+
+        Args:
+            names: Nombre de cada archivo
+            years: Año de cada archivo
+            cnaes: CNAE de cada archivo
+            ratios: Ratios de cada archivo (objetos con codes y values, como RatiosArray)
+            reference: {año: YearReference} de los años ya cargados (para yoy)
+        """
+        years = np.asarray([int(y) for y in years], dtype=np.int64)
+        cnaes = np.asarray([int(c) for c in cnaes], dtype=np.int64)
+        # Los CNAE fuera de 0000-9999 no se comparan con ningún otro sector y el archivo se rechaza
+        valid_cnae = (cnaes >= 0) & (cnaes < N_CNAE_KEYS)
+        values, unknown = self._stack(ratios)
+        n_codes = len(self.expected_codes)
+        codes = self.expected_codes
+
+        # Cobertura
+        present = ~np.isnan(values).all(axis=2)
+        coverage = present.sum(axis=1) / n_codes
+
+        # Orden de los cuartiles
+        q1, q2, q3 = values[..., 0], values[..., 1], values[..., 2]
+        tolerance = ORDER_TOLERANCE * (1 + np.abs(values).max(axis=2, initial=0))
+        with np.errstate(invalid='ignore'):
+            disordered = (q1 > q2 + tolerance) | (q2 > q3 + tolerance)
+        complete = ~np.isnan(values).any(axis=2)
+        disordered &= complete
+        order_fraction = disordered.sum(axis=1) / np.maximum(complete.sum(axis=1), 1)
+
+        # Saltos interanuales centrados en cero, en unidades de la dispersión entre
+        # sectores del año anterior (no de las diferencias del lote, que un cambio
+        # de formato en todos los archivos desplazaría e inflaría a la vez)
+        previous = self._previous(years, cnaes, values, reference or {}, valid_cnae)
+        diff = values - previous
+        comparable = ~np.isnan(diff)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # columnas sin ninguna comparación
+            compared_previous = np.where(comparable, previous, np.nan)
+            center = np.nanmedian(compared_previous, axis=0)
+            mad = np.nanmedian(np.abs(compared_previous - center), axis=0)
+            floor = MIN_SCALE_FRACTION * np.nanmedian(np.abs(compared_previous), axis=0)
+        scale = np.fmax(1.4826 * np.nan_to_num(mad), np.nan_to_num(floor)) + 1e-12
+        enough = comparable.sum(axis=0) >= self.min_yoy_samples
+        z = np.abs(diff) / scale
+        with np.errstate(invalid='ignore'):
+            outlier = comparable & enough & (z > self.yoy_z)
+        compared = (comparable & enough).sum(axis=(1, 2))
+        yoy_fraction = outlier.sum(axis=(1, 2)) / np.maximum(compared, 1)
+
+        # Decisión por archivo
+        low_coverage = coverage < self.min_coverage
+        bad_order = order_fraction > self.max_order_fraction
+        shifted = (compared >= self.min_yoy_compared) & (yoy_fraction > self.max_yoy_fraction)
+        bad_cnae = ~valid_cnae
+        quarantined = bad_cnae | low_coverage | bad_order | shifted
+
+        missing = [[] for _ in names]
+        for f, c in zip(*(axis.tolist() for axis in np.nonzero(~present))):
+            missing[f].append(codes[c])
+        flags = zip(bad_cnae.tolist(), low_coverage.tolist(), bad_order.tolist(), shifted.tolist())
+        columns = zip(names, years.tolist(), cnaes.tolist(), np.round(coverage, 4).tolist(), missing, unknown,
+                      disordered.sum(axis=1).tolist(), compared.tolist(), outlier.sum(axis=(1, 2)).tolist(),
+                      quarantined.tolist(), flags)
+        files = []
+        for name, year, cnae, cov, miss, unk, n_order, n_compared, n_outliers, bad, flag in columns:
+            files.append({
+                'file': name, 'year': year, 'cnae': f"{cnae:04d}", 'coverage': cov,
+                'missing': miss, 'unknown': unk, 'order_violations': n_order,
+                'yoy_compared': n_compared, 'yoy_outliers': n_outliers, 'quarantined': bad,
+                'reasons': [reason for reason, on in zip(('cnae', 'coverage', 'order', 'yoy'), flag) if on],
+            })
+
+        issues = []
+        i, c = np.nonzero(disordered)
+        for f, r, v in zip(i.tolist(), c.tolist(), _as_list(values[i, c])):
+            issues.append({'file': names[f], 'check': 'order', 'ratio': codes[r], 'values': v})
+        i, c, q = np.nonzero(outlier)
+        for f, r, k, v, p, zz in zip(i.tolist(), c.tolist(), q.tolist(), _as_list(values[i, c, q]),
+                                     _as_list(previous[i, c, q]), np.round(z[i, c, q], 2).tolist()):
+            issues.append({'file': names[f], 'check': 'yoy', 'ratio': codes[r], 'quartile': QUARTILES[k],
+                           'value': v, 'previous': p, 'z': zz})
+        for f in np.flatnonzero(~present.all(axis=1) | np.array([bool(u) for u in unknown], dtype=bool)).tolist():
+            issues.append({'file': names[f], 'check': 'coverage', 'missing': files[f]['missing'],
+                           'unknown': unknown[f]})
+        return ValidationReport(files, issues, self.settings())
@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Métricas ligeras por ejecución: temporizadores, contadores e histogramas.
+
+Los scripts registran sus etapas en el registro del proceso (`metrics`) y, si
+se pide, se vuelca un informe JSON al terminar:
+
+    from run_metrics import metrics, metrics_report
+
+    with metrics_report("metricas.json", profile="cprofile"):
+        with metrics.timer("masterfile.save"):
+            ...
+        metrics.count("masterfile.cells_updated", 120)
+
+Cada temporizador o `observe` alimenta un histograma (count, sum, min, max,
+media, p50, p90, p99). Si se pasan etiquetas (p. ej. sector o file), además se
+guarda cada observación en "items" para poder ver el detalle por sector o por
+archivo. Registrar sin informe cuesta poco más que una llamada a perf_counter.
+"""
+
+import cProfile
+import io
+import json
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, List, Optional
+
+PROFILE_MODES = ("cprofile", "tracemalloc", "all")
+
+# Funciones y líneas que se incluyen en el informe del perfilado
+PROFILE_TOP = 25
+
+
+def _percentile(sorted_values: List[float], fraction: float) -> float:
+    index = min(len(sorted_values) - 1, max(0, round(fraction * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Metrics:
+    """Registro de métricas seguro entre hilos."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Descarta todo lo registrado."""
+        with self._lock:
+            self.started_at = datetime.now()
+            self._start = time.perf_counter()
+            self.counters: Dict[str, float] = {}
+            self.histograms: Dict[str, List[float]] = {}
+            self.items: Dict[str, List[dict]] = {}
+
+    def count(self, name: str, n: float = 1):
+        """Suma n al contador name."""
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def observe(self, name: str, value: float, **labels):
+        """Añade un valor al histograma name (y al detalle si lleva etiquetas)."""
+        with self._lock:
+            self.histograms.setdefault(name, []).append(value)
+            if labels:
+                self.items.setdefault(name, []).append({**labels, 'value': value})
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """
+        Mide en segundos el bloque y lo registra con observe.
+
+        Devuelve el diccionario de etiquetas, que el bloque puede completar
+        (p. ej. con el estado final de la descarga).
+        """
+        start = time.perf_counter()
+        try:
+            yield labels
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def report(self) -> dict:
+        """Resumen de la ejecución como diccionario serializable en JSON."""
+        with self._lock:
+            histograms = {}
+            for name, values in sorted(self.histograms.items()):
+                ordered = sorted(values)
+                total = sum(ordered)
+                histograms[name] = {
+                    'count': len(ordered), 'sum': total, 'min': ordered[0], 'max': ordered[-1],
+                    'mean': total / len(ordered), 'p50': _percentile(ordered, 0.5),
+                    'p90': _percentile(ordered, 0.9), 'p99': _percentile(ordered, 0.99),
+                }
+            return {
+                'started_at': self.started_at.isoformat(timespec='seconds'),
+                'elapsed_s': time.perf_counter() - self._start,
+                'counters': dict(sorted(self.counters.items())),
+                'histograms': histograms,
+                'items': {name: list(values) for name, values in sorted(self.items.items())},
+            }
+
+
+# Registro del proceso
+metrics = Metrics()
+
+
+class Profiler:
+    """Perfilado opcional con cProfile y/o tracemalloc."""
+
+    def __init__(self, mode: Optional[str]):
+        if mode is not None and mode not in PROFILE_MODES:
+            raise ValueError(f"Modo de perfilado no soportado: {mode}")
+        self.mode = mode
+        self._profile = None
+
+    def start(self):
+        if self.mode in ("tracemalloc", "all"):
+            tracemalloc.start()
+        if self.mode in ("cprofile", "all"):
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+
+    def stop(self, stats_path: Optional[str] = None) -> dict:
+        """Detiene el perfilado y devuelve su resumen (guarda las estadísticas de cProfile en stats_path)."""
+        result = {}
+        if self._profile is not None:
+            self._profile.disable()
+            if stats_path:
+                self._profile.dump_stats(stats_path)
+                result['cprofile_stats'] = stats_path
+            stats = pstats.Stats(self._profile, stream=io.StringIO()).sort_stats('cumulative')
+            top = []
+            for (filename, line, function), (_, calls, tottime, cumtime, _) in stats.stats.items():
+                top.append({'function': f"{os.path.basename(filename)}:{line}({function})",
+                            'calls': calls, 'tottime_s': tottime, 'cumtime_s': cumtime})
+            top.sort(key=lambda entry: entry['cumtime_s'], reverse=True)
+            result['cprofile_top'] = top[:PROFILE_TOP]
+            self._profile = None
+        if tracemalloc.is_tracing():
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+            result['tracemalloc'] = {
+                'current_bytes': current,
+                'peak_bytes': peak,
+                'top': [{'location': str(stat.traceback), 'size_bytes': stat.size, 'count': stat.count}
+                        for stat in snapshot.statistics('lineno')[:PROFILE_TOP]],
+            }
+        return result
+
+
+@contextmanager
+def metrics_report(path: Optional[str], profile: Optional[str] = None, **info):
+    """
+    Reinicia el registro, perfila si se pide y escribe el informe JSON al salir.
+
+    Args:
+        path: Ruta del informe (None para no escribirlo; el perfilado también lo requiere)
+        profile: None, "cprofile", "tracemalloc" o "all"
+        info: Datos adicionales para el informe (p. ej. el script y sus opciones)
+    """
+    metrics.reset()
+    profiler = Profiler(profile if path else None)
+    profiler.start()
+    try:
+        yield metrics
+    finally:
+        stats_path = os.path.splitext(path)[0] + ".prof" if path else None
+        profile_result = profiler.stop(stats_path)
+        if path:
+            report = {**info, **metrics.report()}
+            if profile_result:
+                report['profile'] = profile_result
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+            os.replace(tmp_path, path)
@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Utilidades para reutilizar los scripts numerados del proyecto desde otros scripts.
+
+Los nombres de los scripts (p. ej. "1_descargar_ratios_bde.py" o
+"3_Cambio nombre ficheros.py") no son identificadores válidos de Python, así
+que no pueden importarse con `import`. cargar_script los carga por ruta y los
+registra en sys.modules con un nombre válido.
+"""
+
+import importlib.util
+import os
+import re
+import sys
+
+DIRECTORIO_PROYECTO = os.path.dirname(os.path.abspath(__file__))
+
+SCRIPT_DESCARGA = "1_descargar_ratios_bde.py"
+SCRIPT_LISTA_CNAES = "2_Extrae lista CNAEs.py"
+SCRIPT_RENOMBRADO = "3_Cambio nombre ficheros.py"
+SCRIPT_CARGA = "4_Carga_valores_en_masterfile.py"
+
+def nombre_modulo(nombre_fichero):
+    """Nombre de módulo válido para un script (p. ej. 'bde_4_carga_valores_en_masterfile')"""
+    base = os.path.splitext(os.path.basename(nombre_fichero))[0]
+    return "bde_" + re.sub(r"\W", "_", base).lower()
+
+def cargar_script(nombre_fichero):
+    """Carga (una sola vez) un script del proyecto y devuelve el módulo"""
+    nombre = nombre_modulo(nombre_fichero)
+    if nombre in sys.modules:
+        return sys.modules[nombre]
+
+    ruta = os.path.join(DIRECTORIO_PROYECTO, nombre_fichero)
+    spec = importlib.util.spec_from_file_location(nombre, ruta)
+    modulo = importlib.util.module_from_spec(spec)
+    sys.modules[nombre] = modulo
+    try:
+        spec.loader.exec_module(modulo)
+    except BaseException:
+        del sys.modules[nombre]
+        raise
+    return modulo
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Comparación vectorizada de ratios de empresas con los cuartiles de su sector.
+
+Carga todos los años del masterfile (o del almacén de ratios) en un único array
+denso de forma (años, CNAE, ratios, 3) y resuelve millones de filas
+(CNAE, año, ratio, valor) en una sola llamada, sin búsquedas fila a fila en
+pandas. Para cada fila devuelve:
+
+- band: 0 = por debajo de Q1, 1 = entre Q1 y Q2, 2 = entre Q2 y Q3,
+  3 = por encima de Q3, -1 = sin datos del sector para ese año/ratio
+- position: posición interpolada en [0, 1] (Q1 = 0.25, Q2 = 0.5, Q3 = 0.75,
+  lineal entre cuartiles y extrapolada con el rango intercuartílico contiguo
+  fuera de ellos); NaN si no hay datos
+
+Uso:
+    python3 sector_scoring.py empresas.csv --output puntuaciones.csv
+    python3 sector_scoring.py empresas.csv --store ratios.sqlite
+    python3 sector_scoring.py empresas.csv --fallback   # CNAE sin datos -> grupo/división
+
+El CSV de entrada necesita las columnas cnae, year, ratio y value.
+"""
+
+import argparse
+import logging
+import os
+from typing import Dict, Iterable, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from cnae_hierarchy import CNAE_LIST_FILENAME, LEVELS, CnaeHierarchy, read_cnae_list
+from ratio_store import QUARTILES, RATIO_CODES, RatioStore
+
+logger = logging.getLogger(__name__)
+
+# Posición asignada a cada cuartil
+QUARTILE_POSITIONS = np.array([0.25, 0.5, 0.75])
+
+# Cuartil desde el que se interpola en cada banda (0-1 desde Q1, 2 desde Q2, 3 desde Q3)
+ANCHOR_QUARTILE = np.array([0, 0, 1, 2])
+
+
+class QuartileScores(NamedTuple):
+    """Resultado de score(): un elemento por fila de entrada."""
+    band: np.ndarray      # int8, -1 si no hay datos
+    position: np.ndarray  # float64, NaN si no hay datos
+
+
+class SectorQuartiles:
+    """Cuartiles sectoriales de todos los años en un array denso."""
+
+    def __init__(self, years: Iterable[int], cnaes: Iterable[int], ratio_codes: Iterable[str],
+                 values: np.ndarray):
+        """
+        Args:
+            years: Años (eje 0 de values)
+            cnaes: Códigos CNAE (eje 1)
+            ratio_codes: Códigos de ratio (eje 2)
+            values: Array (años, CNAE, ratios, 3) con Q1, Q2, Q3 y NaN donde falte
+        """
+        self.years = np.asarray(list(years), dtype=np.int64)
+        self.cnaes = np.asarray(list(cnaes), dtype=np.int64)
+        self.ratio_codes = list(ratio_codes)
+        self.values = np.asarray(values, dtype=np.float64)
+        expected = (len(self.years), len(self.cnaes), len(self.ratio_codes), len(QUARTILES))
+        if self.values.shape != expected:
+            raise ValueError(f"Forma de values {self.values.shape}, se esperaba {expected}")
+
+        # Índice CNAE -> fila: array directo (los CNAE son enteros de 4 dígitos)
+        size = int(self.cnaes.max()) + 1 if len(self.cnaes) else 1
+        self.cnae_index = np.full(size, -1, dtype=np.int64)
+        self.cnae_index[self.cnaes] = np.arange(len(self.cnaes))
+        self.year_index = {int(y): i for i, y in enumerate(self.years)}
+        self.ratio_index = {code: i for i, code in enumerate(self.ratio_codes)}
+
+    @classmethod
+    def from_frames(cls, masterfile_data: Dict[str, pd.DataFrame]) -> 'SectorQuartiles':
+        """Construye el array desde hojas con formato de masterfile ({año: DataFrame})."""
+        frames = {int(year): df.dropna(subset=['CNAE']) for year, df in masterfile_data.items()
+                  if str(year).isdigit() and 'CNAE' in df.columns}
+        years = sorted(frames)
+        cnaes = sorted({int(c) for df in frames.values() for c in df['CNAE']})
+        columns = {str(c) for df in frames.values() for c in df.columns}
+        ratio_codes = [code for code in RATIO_CODES if f"{code}_Q1" in columns]
+
+        value_cols = [f"{code}_{q}" for code in ratio_codes for q in QUARTILES]
+        values = np.full((len(years), len(cnaes), len(ratio_codes), len(QUARTILES)), np.nan)
+        cnae_pos = pd.Index(cnaes)
+        for i, year in enumerate(years):
+            df = frames[year]
+            rows = cnae_pos.get_indexer(df['CNAE'].astype(int))
+            block = df.reindex(columns=value_cols).apply(pd.to_numeric, errors='coerce')
+            values[i, rows] = block.to_numpy(dtype=np.float64).reshape(len(df), len(ratio_codes),
+                                                                        len(QUARTILES))
+        logger.info(f"Cuartiles cargados: {len(years)} años × {len(cnaes)} CNAE × {len(ratio_codes)} ratios")
+        return cls(years, cnaes, ratio_codes, values)
+
+    @classmethod
+    def from_masterfile(cls, masterfile_path: str) -> 'SectorQuartiles':
+        """Construye el array leyendo todas las hojas del masterfile .xlsx."""
+        return cls.from_frames(pd.read_excel(masterfile_path, sheet_name=None))
+
+    @classmethod
+    def from_store(cls, store: RatioStore) -> 'SectorQuartiles':
+        """Construye el array desde el almacén de ratios."""
+        return cls.from_frames({str(year): store.year_frame(year) for year in store.years()})
+
+    def lookup(self, cnae, year, ratio) -> np.ndarray:
+        """Cuartiles (n, 3) para cada fila; NaN si el sector, año o ratio no existen o faltan."""
+        # Filas incompletas (CNAE o año vacíos o no numéricos) quedan sin cuartiles, sin abortar el lote
+        cnae = pd.to_numeric(pd.Series(np.asarray(cnae)), errors='coerce')
+        cnae = cnae.where(cnae % 1 == 0, -1).fillna(-1).to_numpy(dtype=np.int64)
+        year_rows = pd.to_numeric(pd.Series(np.asarray(year)), errors='coerce').map(self.year_index)
+        ratio_rows = pd.Series(np.asarray(ratio)).astype(str).map(self.ratio_index)
+        year_rows = year_rows.fillna(-1).to_numpy(dtype=np.int64)
+        ratio_rows = ratio_rows.fillna(-1).to_numpy(dtype=np.int64)
+
+        in_range = (cnae >= 0) & (cnae < len(self.cnae_index))
+        cnae_rows = np.where(in_range, self.cnae_index[np.where(in_range, cnae, 0)], -1)
+
+        found = (cnae_rows >= 0) & (year_rows >= 0) & (ratio_rows >= 0)
+        result = np.full((len(cnae), len(QUARTILES)), np.nan)
+        result[found] = self.values[year_rows[found], cnae_rows[found], ratio_rows[found]]
+        return result
+
+    def score(self, cnae, year, ratio, value) -> QuartileScores:
+        """
+        Sitúa cada valor respecto a los cuartiles de su sector, año y ratio.
+
+        Todos los argumentos son arrays (o listas) de la misma longitud.
+        """
+        value = np.asarray(value, dtype=np.float64)
+        quartiles = self.lookup(cnae, year, ratio)
+        q1, q2, q3 = quartiles[:, 0], quartiles[:, 1], quartiles[:, 2]
+
+        valid = ~np.isnan(quartiles).any(axis=1) & ~np.isnan(value)
+        band = np.full(len(value), -1, dtype=np.int8)
+        band[valid] = (value[valid, None] >= quartiles[valid]).sum(axis=1)
+
+        # Cuartil de referencia y rango intercuartílico usado en cada banda
+        rows = np.arange(len(value))
+        b = np.clip(band, 0, 3)
+        anchor = quartiles[rows, ANCHOR_QUARTILE[b]]
+        width = np.where(b <= 1, q2 - q1, q3 - q2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            offset = np.where(width > 0, (value - anchor) / width, 0.0)
+        position = np.clip(QUARTILE_POSITIONS[ANCHOR_QUARTILE[b]] + 0.25 * offset, 0.0, 1.0)
+        position[~valid] = np.nan
+        return QuartileScores(band, position)
+
+    def score_frame(self, df: pd.DataFrame, cnae_col: str = 'cnae', year_col: str = 'year',
+                    ratio_col: str = 'ratio', value_col: str = 'value',
+                    hierarchy: Optional[CnaeHierarchy] = None) -> pd.DataFrame:
+        """
+        Devuelve una copia de df con las columnas band y position.
+
+        Con hierarchy, cada CNAE se sustituye por su antecesor más cercano con
+        datos y se añaden las columnas cnae_used y level.
+        """
+        cnae = df[cnae_col].to_numpy()
+        extra = {}
+        if hierarchy is not None:
+            match = hierarchy.resolve(cnae, df[year_col].to_numpy())
+            cnae = match.key
+            extra = {'cnae_used': match.key,
+                     'level': np.array([None] + list(LEVELS), dtype=object)[match.level + 1]}
+        scores = self.score(cnae, df[year_col].to_numpy(), df[ratio_col].to_numpy(),
+                            df[value_col].to_numpy())
+        return df.assign(band=scores.band, position=scores.position, **extra)
+
+
+def main(argv: Optional[list] = None):
+    """Función principal."""
+    parser = argparse.ArgumentParser(description="Compara ratios de empresas con los cuartiles de su sector")
+    parser.add_argument("input", help="CSV con las columnas cnae, year, ratio y value")
+    parser.add_argument("--masterfile", default="CNAE masterfile.xlsx", help="Ruta al archivo masterfile")
+    parser.add_argument("--store", default=None, help="Usar el almacén SQLite de ratios en lugar del masterfile")
+    parser.add_argument("--output", default=None, help="CSV de salida (por defecto <input>_scores.csv)")
+    parser.add_argument("--fallback", action="store_true",
+                        help="Usar el antecesor más cercano con datos (grupo, división, sección) "
+                             "cuando el CNAE no tiene datos")
+    parser.add_argument("--cnae-list", default=f"downloads/{CNAE_LIST_FILENAME}",
+                        help="Lista de CNAEs generada por 2_Extrae lista CNAEs.py (con --fallback)")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+    if args.store:
+        with RatioStore(args.store) as store:
+            frames = {str(year): store.year_frame(year) for year in store.years()}
+    else:
+        frames = pd.read_excel(args.masterfile, sheet_name=None)
+    quartiles = SectorQuartiles.from_frames(frames)
+
+    hierarchy = None
+    if args.fallback:
+        cnae_codes = None
+        if os.path.exists(args.cnae_list):
+            cnae_codes = read_cnae_list(args.cnae_list)
+        hierarchy = CnaeHierarchy.from_frames(frames, cnae_codes)
+
+    companies = pd.read_csv(args.input, dtype={'cnae': str} if args.fallback else None)
+    scored = quartiles.score_frame(companies, hierarchy=hierarchy)
+    output = args.output or args.input.rsplit('.', 1)[0] + "_scores.csv"
+    scored.to_csv(output, index=False)
+
+    missing = int((scored['band'] < 0).sum())
+    logger.info(f"Puntuadas {len(scored)} filas ({missing} sin datos del sector) -> {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+Servidor local que imita la página de ratios sectoriales del Banco de España
+(https://app.bde.es/rss_www/Ratios) para probar los descargadores sin acceder
+a la web real.
+
+Reproduce lo que usan los scripts de descarga:
+- La página con el formulario (entidad, objetivo, paisRegistro, sector,
+  ejercicio, dimension, pais y el botón "Consultar en EXCEL")
+- La cookie de sesión que se obtiene al cargar la página
+- El paso de registro: un envío del formulario sin sector, que deja la sesión
+  registrada (las consultas también se aceptan si traen los campos de registro)
+- La respuesta con el Excel adjunto (nombre tipo 2023_A011_b_20251119.xls)
+- El aviso "Datos no disponibles" con su botón "Aceptar"
+
+Cada consulta recibida queda en servidor.consultas como (sector, ejercicio,
+dimension, pais) para comprobar qué pidió un barrido y en qué orden.
+
+Uso:
+    python3 servidor_simulado_bde.py --puerto 8765
+    python3 1_descargar_ratios_bde.py --motor http --url http://127.0.0.1:8765/rss_www/Ratios
+"""
+
+import argparse
+import threading
+import uuid
+from datetime import date
+from html import escape
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RUTA_PAGINA = "/rss_www/Ratios"
+RUTA_CONSULTA = "/rss_www/Ratios/consulta"
+
+SECTORES_SIMULADOS = [
+    ("A", "A - Agricultura, ganadería, silvicultura y pesca"),
+    ("A01", "A01 - Agricultura, ganadería, caza y servicios relacionados"),
+    ("A011", "A011 - Cultivos no perennes"),
+    ("B", "B - Industrias extractivas"),
+    ("B05", "B05 - Extracción de antracita, hulla y lignito"),
+    ("C10", "C10 - Industria de la alimentación"),
+]
+
+# Sectores para los que el servidor responde "Datos no disponibles"
+SECTORES_SIN_DATOS = {"B05"}
+
+EJERCICIOS_SIMULADOS = ["2023", "2022", "2021"]
+
+def excel_simulado(sector, ejercicio):
+    """Contenido por defecto del Excel descargado (no es un libro real)"""
+    return f"Ratios simulados {ejercicio} {sector}\n".encode("utf-8")
+
+def _opciones(pares, seleccionado=None):
+    return "\n".join(
+        f'<option value="{escape(v)}"{" selected" if v == seleccionado else ""}>{escape(t)}</option>'
+        for v, t in pares
+    )
+
+def pagina_formulario(sectores, ejercicios):
+    """HTML de la página principal con el formulario de consulta"""
+    return f"""<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>Ratios sectoriales (simulado)</title></head>
+<body>
+<form id="formRatios" action="{RUTA_CONSULTA}" method="post">
+  <input type="hidden" name="formato" value="excel">
+  <select id="entidad" name="entidad">
+    {_opciones([("", "Seleccione..."), ("1", "Empresa"), ("2", "Universidad")])}
+  </select>
+  <select id="objetivo" name="objetivo">
+    {_opciones([("", "Seleccione..."), ("1", "Análisis sectorial"), ("2", "Docencia")])}
+  </select>
+  <select id="paisRegistro" name="paisRegistro">
+    {_opciones([("ES", "España"), ("PT", "Portugal")])}
+  </select>
+  <select id="sector" name="sector">
+    {_opciones([("", "Seleccione un sector")] + list(sectores))}
+  </select>
+  <select id="ejercicio" name="ejercicio">
+    {_opciones([(e, e) for e in ejercicios], seleccionado=ejercicios[0])}
+  </select>
+  <select id="dimension" name="dimension">
+    {_opciones([("0", "Total"), ("1", "Menos de 50 millones"), ("2", "50 millones o más")])}
+  </select>
+  <select id="pais" name="pais">
+    {_opciones([("ES", "España"), ("PT", "Portugal")])}
+  </select>
+  <input type="button" name="consulta" value="Consultar en EXCEL" onclick="this.form.submit()">
+</form>
+</body>
+</html>"""
+
+PAGINA_SIN_DATOS = """<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>Aviso</title></head>
+<body>
+<div class="popup">Datos no disponibles para la selección realizada.
+<input type="button" value="Aceptar" onclick="history.back()"></div>
+</body>
+</html>"""
+
+PAGINA_SESION_CADUCADA = """<!DOCTYPE html>
+<html lang="es">
+<head><meta charset="utf-8"><title>Sesión</title></head>
+<body><p>La sesión ha caducado. Vuelva a la página inicial.</p></body>
+</html>"""
+
+class ServidorSimuladoBDE(ThreadingHTTPServer):
+    """Servidor HTTP con el estado de la simulación (sesiones, sectores, contadores)"""
+
+    daemon_threads = True
+
+    def __init__(self, direccion, sectores=None, sin_datos=None, ejercicios=None,
+                 generar_excel=excel_simulado):
+        super().__init__(direccion, _ManejadorBDE)
+        self.sectores = list(sectores or SECTORES_SIMULADOS)
+        self.sin_datos = set(SECTORES_SIN_DATOS if sin_datos is None else sin_datos)
+        self.ejercicios = list(ejercicios or EJERCICIOS_SIMULADOS)
+        self.generar_excel = generar_excel
+        self.sesiones = set()
+        self.registradas = set()
+        self.peticiones = {"pagina": 0, "registro": 0, "excel": 0, "sin_datos": 0, "rechazadas": 0}
+        self.consultas = []
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, puerto = self.server_address[:2]
+        return f"http://{host}:{puerto}{RUTA_PAGINA}"
+
+    def contar(self, clave):
+        with self._lock:
+            self.peticiones[clave] += 1
+
+class _ManejadorBDE(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Permite conexiones keep-alive
+    disable_nagle_algorithm = True  # Cabeceras y cuerpo van en escrituras separadas
+
+    def log_message(self, formato, *args):
+        pass  # Silenciar el log por petición
+
+    def _responder(self, cuerpo, tipo="text/html; charset=utf-8", cabeceras=None):
+        self.send_response(200)
+        self.send_header("Content-Type", tipo)
+        self.send_header("Content-Length", str(len(cuerpo)))
+        for clave, valor in (cabeceras or {}).items():
+            self.send_header(clave, valor)
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _sesion(self):
+        for parte in self.headers.get("Cookie", "").split(";"):
+            clave, _, valor = parte.strip().partition("=")
+            if clave == "JSESSIONID":
+                return valor
+        return None
+
+    def do_GET(self):
+        if urlparse(self.path).path != RUTA_PAGINA:
+            self.send_error(404)
+            return
+
+        sesion = self._sesion()
+        cabeceras = {}
+        if sesion not in self.server.sesiones:
+            sesion = uuid.uuid4().hex
+            self.server.sesiones.add(sesion)
+            cabeceras["Set-Cookie"] = f"JSESSIONID={sesion}; Path=/"
+
+        self.server.contar("pagina")
+        html = pagina_formulario(self.server.sectores, self.server.ejercicios)
+        self._responder(html.encode("utf-8"), cabeceras=cabeceras)
+
+    def do_POST(self):
+        if urlparse(self.path).path != RUTA_CONSULTA:
+            self.send_error(404)
+            return
+
+        longitud = int(self.headers.get("Content-Length", 0))
+        campos = {k: v[0] for k, v in parse_qs(self.rfile.read(longitud).decode("utf-8")).items()}
+
+        # Sin cookie de sesión o sin registro el servidor real vuelve a la portada
+        sesion = self._sesion()
+        datos_registro = all(campos.get(c) for c in ("entidad", "objetivo", "paisRegistro"))
+        if sesion not in self.server.sesiones or not (datos_registro or sesion in self.server.registradas):
+            self.server.contar("rechazadas")
+            self._responder(PAGINA_SESION_CADUCADA.encode("utf-8"))
+            return
+
+        # Paso de registro: el formulario sin sector devuelve la página de consulta
+        if "sector" not in campos:
+            with self.server._lock:
+                self.server.registradas.add(sesion)
+            self.server.contar("registro")
+            html = pagina_formulario(self.server.sectores, self.server.ejercicios)
+            self._responder(html.encode("utf-8"))
+            return
+
+        sector = campos.get("sector", "")
+        ejercicio = campos.get("ejercicio", self.server.ejercicios[0])
+        with self.server._lock:
+            self.server.consultas.append((sector, ejercicio, campos.get("dimension"), campos.get("pais")))
+        if sector in self.server.sin_datos or sector not in dict(self.server.sectores):
+            self.server.contar("sin_datos")
+            self._responder(PAGINA_SIN_DATOS.encode("utf-8"))
+            return
+
+        self.server.contar("excel")
+        nombre = f"{ejercicio}_{sector}_b_{date.today():%Y%m%d}.xls"
+        self._responder(
+            self.server.generar_excel(sector, ejercicio),
+            tipo="application/vnd.ms-excel",
+            cabeceras={"Content-Disposition": f'attachment; filename="{nombre}"'},
+        )
+
+def arrancar_en_segundo_plano(puerto=0, **kwargs):
+    """Arranca el servidor en un hilo y lo devuelve (su URL está en servidor.url)"""
+    servidor = ServidorSimuladoBDE(("127.0.0.1", puerto), **kwargs)
+    hilo = threading.Thread(target=servidor.serve_forever, daemon=True)
+    hilo.start()
+    return servidor
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Servidor local que simula la página de ratios del BdE")
+    parser.add_argument("--puerto", type=int, default=8765, help="Puerto de escucha (por defecto 8765)")
+    args = parser.parse_args()
+
+    servidor = ServidorSimuladoBDE(("127.0.0.1", args.puerto))
+    print(f"🌐 Servidor simulado escuchando en {servidor.url}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+        print("✓ Servidor detenido")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""
+Sufijo de tamaño (dimension) y país en los nombres de archivo y de hoja.
+
+Las descargas de tamaño o país distintos de los de siempre ("Menos de 50
+millones", España) llevan el sufijo _d<dimension>_<país> antes de la
+extensión (2023_0110_d2_Portugal.xls) y sus valores van a la hoja del año con
+el mismo sufijo (2023_d2_Portugal). Lo usan tanto la descarga
+(barrido_descargas) como el renombrado, el almacén de descargas y la carga en
+el masterfile.
+"""
+
+import re
+import unicodedata
+
+# Tamaño ("Menos de 50 millones") y país que se consultan por defecto
+DIMENSION_POR_DEFECTO = "1"
+PAIS_POR_DEFECTO = "España"
+
+# Sufijo de tamaño y país en nombres de archivo y de hoja: _d<dimension>_<país>
+PATRON_SUFIJO = r'_d[0-9A-Za-z]+_[0-9A-Za-z]+'
+
+def _simplificar(texto):
+    """Texto sin acentos ni separadores, apto para nombres de archivo y de hoja"""
+    ascii_ = unicodedata.normalize("NFKD", str(texto)).encode("ascii", "ignore").decode()
+    return re.sub(r'[^0-9A-Za-z]', '', ascii_)[:16]
+
+def sufijo_ejes(dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+    """Sufijo de un trabajo ('' para el tamaño y el país por defecto)"""
+    if str(dimension) == DIMENSION_POR_DEFECTO and pais == PAIS_POR_DEFECTO:
+        return ""
+    return f"_d{_simplificar(dimension)}_{_simplificar(pais)}"
+
+def etiquetar_archivo(nombre, dimension=DIMENSION_POR_DEFECTO, pais=PAIS_POR_DEFECTO):
+    """Añade el sufijo de los ejes antes de la extensión (sin cambios para los de por defecto)"""
+    base, punto, extension = nombre.rpartition(".")
+    if not punto:
+        return nombre + sufijo_ejes(dimension, pais)
+    return f"{base}{sufijo_ejes(dimension, pais)}.{extension}"
+
+def separar_sufijo(nombre):
+    """Divide un nombre de archivo en (nombre sin sufijo de ejes, sufijo)"""
+    coincidencia = re.fullmatch(rf'(.*?)({PATRON_SUFIJO})?(\.[^.]+)?', nombre)
+    return coincidencia.group(1) + (coincidencia.group(3) or ""), coincidencia.group(2) or ""
+
+def hoja_anterior(hoja):
+    """Hoja del año anterior con el mismo sufijo (2023_d2_Portugal -> 2022_d2_Portugal)"""
+    coincidencia = re.fullmatch(r'(\d{4})(.*)', str(hoja))
+    return f"{int(coincidencia.group(1)) - 1}{coincidencia.group(2)}" if coincidencia else None
@@ -0,0 +1,70 @@
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from ratio_store import masterfile_columns
+from scripts_bde import SCRIPT_CARGA, cargar_script
+
+carga = cargar_script(SCRIPT_CARGA)
+
+
+def _masterfile(path, cnaes=(100, 300)):
+    df = pd.DataFrame(np.nan, index=range(len(cnaes)), columns=masterfile_columns())
+    df['CNAE'] = list(cnaes)
+    df['R01_Q1'] = [1.0] * len(cnaes)
+    df.to_excel(path, sheet_name="2023", index=False)
+    wb = openpyxl.load_workbook(path)
+    wb["2023"].cell(row=len(cnaes) + 3, column=1, value="=SUM(A2:A3)")
+    wb.save(path)
+
+
+def _loader(tmp_path, write_mode="rewrite"):
+    path = tmp_path / "m.xlsx"
+    _masterfile(path)
+    loader = carga.MasterfileLoader(downloads_dir=str(tmp_path), masterfile_path=str(path),
+                                    write_mode=write_mode)
+    loader.load_masterfile()
+    return loader
+
+
+def test_last_non_empty_value_wins(tmp_path):
+    loader = _loader(tmp_path)
+    counts = loader.update_masterfile_batch([
+        ("2023", "0100", {"R01": {"Q1": 2.0, "Q2": 5.0, "Q3": None}}),
+        ("2023", "0100", {"R01": {"Q1": 3.0, "Q2": None, "Q3": None}}),
+    ])
+
+    block = loader.masterfile_data["2023"]
+    assert counts == [2, 1]
+    assert block.value(100, "R01_Q1") == 3.0
+    # El segundo archivo no trae Q2: se queda el valor del primero
+    assert block.value(100, "R01_Q2") == 5.0
+
+
+def test_changed_cells_only_lists_values_that_change(tmp_path):
+    loader = _loader(tmp_path)
+    loader.update_masterfile_batch([
+        ("2023", "0100", {"R01": {"Q1": 1.0, "Q2": 4.0, "Q3": None}}),
+        ("2023", "0300", {"R01": {"Q1": 1.0, "Q2": None, "Q3": None}}),
+        ("2023", "0200", {"R02": {"Q1": 7.0, "Q2": None, "Q3": None}}),
+    ])
+
+    # R01_Q1 ya valía 1.0: no cuenta como cambio; el CNAE 0200 es una fila nueva
+    assert loader.changed_cells == {"2023": {100: {"R01_Q2"}, 200: {"R02_Q1", "CNAE"}}}
+
+
+def test_incremental_save_appends_new_rows_sorted_after_existing_ones(tmp_path):
+    loader = _loader(tmp_path, write_mode="incremental")
+    loader.update_masterfile_batch([
+        ("2023", "0500", {"R01": {"Q1": 5.0, "Q2": None, "Q3": None}}),
+        ("2023", "0200", {"R01": {"Q1": 2.0, "Q2": None, "Q3": None}}),
+        ("2023", "0300", {"R01": {"Q1": 3.0, "Q2": None, "Q3": None}}),
+    ])
+    loader.save_masterfile()
+
+    ws = openpyxl.load_workbook(loader.masterfile_path)["2023"]
+    cnae, r01_q1 = zip(*ws.iter_rows(min_row=2, max_col=2, values_only=True))
+    # Las existentes no se mueven (ni la fórmula); las nuevas van al final en orden de CNAE
+    assert cnae == (100, 300, None, "=SUM(A2:A3)", 200, 500)
+    assert r01_q1 == (1, 3, None, None, 2, 5)
+    assert loader.changed_cells == {}
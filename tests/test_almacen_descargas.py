@@ -0,0 +1,59 @@
+import os
+
+from almacen_descargas import AlmacenDescargas, calcular_sha256
+
+
+def _descarga(directorio, nombre, contenido, mtime):
+    ruta = os.path.join(directorio, nombre)
+    with open(ruta, "wb") as f:
+        f.write(contenido)
+    os.utime(ruta, (mtime, mtime))
+    return ruta
+
+
+def _contenido(ruta):
+    with open(ruta, "rb") as f:
+        return f.read()
+
+
+def test_older_loose_copy_does_not_replace_the_current_version(tmp_path):
+    directorio = str(tmp_path)
+    almacen = AlmacenDescargas(directorio, {"A011": "0110"})
+    almacen.guardar(_descarga(directorio, "2023_A011_b_20251119.xls", b"nuevo", 2_000_000))
+    antigua = _descarga(directorio, "2023_A011_b_20241119.xls", b"antiguo", 1_000_000)
+
+    assert AlmacenDescargas(directorio, {"A011": "0110"}).importar_sueltos() == 0
+
+    almacen = AlmacenDescargas(directorio, {"A011": "0110"})
+    entrada = almacen.entradas["2023_0110.xls"]
+    assert _contenido(os.path.join(directorio, "2023_0110.xls")) == b"nuevo"
+    assert entrada["mtime"] == 2_000_000
+    assert os.path.exists(almacen.ruta_blob(entrada["sha256"]))
+    assert not os.path.exists(antigua)
+    assert sorted(os.listdir(directorio)) == [".blobs", "2023_0110.xls", "indice_descargas.json"]
+
+
+def test_newer_loose_copy_replaces_the_current_version(tmp_path):
+    directorio = str(tmp_path)
+    almacen = AlmacenDescargas(directorio, {"A011": "0110"})
+    almacen.guardar(_descarga(directorio, "2023_A011_b_20241119.xls", b"antiguo", 1_000_000))
+    blob_antiguo = almacen.ruta_blob(almacen.entradas["2023_0110.xls"]["sha256"])
+    reciente = _descarga(directorio, "2023_A011_b_20251119.xls", b"nuevo", 2_000_000)
+    sha_reciente = calcular_sha256(reciente)
+
+    assert AlmacenDescargas(directorio, {"A011": "0110"}).importar_sueltos() == 1
+
+    almacen = AlmacenDescargas(directorio, {"A011": "0110"})
+    assert almacen.entradas["2023_0110.xls"]["sha256"] == sha_reciente
+    assert _contenido(os.path.join(directorio, "2023_0110.xls")) == b"nuevo"
+    assert not os.path.exists(blob_antiguo)
+
+
+def test_loose_copies_without_index_keep_the_newest(tmp_path):
+    directorio = str(tmp_path)
+    _descarga(directorio, "2023_A011_b_20251119.xls", b"nuevo", 2_000_000)
+    _descarga(directorio, "2023_A011_b_20241119.xls", b"antiguo", 1_000_000)
+
+    assert AlmacenDescargas(directorio, {"A011": "0110"}).importar_sueltos() == 1
+    assert _contenido(os.path.join(directorio, "2023_0110.xls")) == b"nuevo"
+    assert not any(nombre.startswith("2023_A011") for nombre in os.listdir(directorio))
@@ -0,0 +1,49 @@
+import barrido_descargas
+from barrido_descargas import Barrido, LimitadorPeticiones, orden_gray
+
+SECTORES = [{"value": "A01", "text": "A01 - Agricultura"}, {"value": "A02", "text": "A02 - Silvicultura"}]
+OPCIONES = {"ejercicio": [{"value": "2023"}, {"value": "2022"}],
+            "dimension": [{"value": "0"}, {"value": "1"}, {"value": "2"}],
+            "pais": [{"text": "España"}, {"text": "Portugal"}]}
+
+
+def test_gray_order_changes_one_axis_at_a_time():
+    combinaciones = list(orden_gray([2, 3, 2]))
+    assert len(set(combinaciones)) == 12
+    assert all(sum(a != b for a, b in zip(x, y)) == 1 for x, y in zip(combinaciones, combinaciones[1:]))
+    assert list(orden_gray([])) == [()]
+
+
+def test_jobs_are_grouped_by_sector_and_change_one_dropdown():
+    trabajos = Barrido(ejercicios="todos", dimensiones="todas", paises="todos").trabajos(
+        SECTORES, "2023", OPCIONES)
+    ejes = ("value", "ejercicio", "dimension", "pais")
+    claves = [tuple(t[eje] for eje in ejes) for t in trabajos]
+
+    assert len(set(claves)) == 2 * 2 * 3 * 2
+    assert [t["value"] for t in trabajos] == ["A01"] * 12 + ["A02"] * 12
+    assert all(sum(a != b for a, b in zip(x, y)) == 1 for x, y in zip(claves, claves[1:]))
+    assert trabajos[0]["descripcion"] == "A01 - Agricultura [2023, 0, España]"
+
+
+def test_default_axes_and_unknown_options():
+    assert Barrido().trabajos(SECTORES, "2023") == [
+        {**SECTORES[0], "ejercicio": "2023", "dimension": "1", "pais": "España"},
+        {**SECTORES[1], "ejercicio": "2023", "dimension": "1", "pais": "España"},
+    ]
+    trabajos = Barrido(dimensiones="2,7").trabajos(SECTORES[:1], "2023", OPCIONES)
+    assert [t["dimension"] for t in trabajos] == ["2"]
+
+
+def test_rate_limiter_reserves_evenly_spaced_slots(monkeypatch):
+    reloj = [100.0]
+    monkeypatch.setattr(barrido_descargas.time, "monotonic", lambda: reloj[0])
+    limitador = LimitadorPeticiones(30)
+
+    assert [limitador.reservar() for _ in range(3)] == [0.0, 2.0, 4.0]
+    # Pasado el último hueco reservado, el siguiente envío no espera
+    reloj[0] = 110.0
+    assert limitador.reservar() == 0.0
+    reloj[0] = 111.0
+    assert limitador.reservar() == 1.0
+    assert LimitadorPeticiones(0).reservar() == 0.0
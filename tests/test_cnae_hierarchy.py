@@ -0,0 +1,45 @@
+import numpy as np
+import pandas as pd
+
+from cnae_hierarchy import CnaeHierarchy, cnae_key
+
+
+def test_resolves_to_the_closest_ancestor_with_data():
+    hierarchy = CnaeHierarchy({2022: [110, 4600], 2023: [111, 4600]}, {1: "A", 46: "G"})
+
+    # Clase con fila propia, clase sin fila (grupo), grupo sin datos (división)
+    assert hierarchy.resolve_one("A0111", 2023) == (111, "class")
+    assert hierarchy.resolve_one("A0111", 2022) == (110, "group")
+    assert hierarchy.resolve_one("G4631", 2023) == (4600, "division")
+    assert hierarchy.resolve_one(110, 2023) is None
+    assert hierarchy.resolve_one("0110", 2021) is None
+
+    match = hierarchy.resolve(np.array([111, 4631, 9999, -3]), 2022)
+    assert match.key.tolist() == [110, 4600, -1, -1]
+    assert match.level.tolist() == [1, 2, -1, -1]
+
+
+def test_section_row_is_used_only_with_a_single_section():
+    available = {2023: [0, 4600]}
+    single = CnaeHierarchy(available, {45: "G", 46: "G"})
+    several = CnaeHierarchy(available, {1: "A", 46: "G"})
+
+    assert single.resolve_one("G4511", 2023) == (0, "section")
+    assert single.resolve_one("G4631", 2023) == (4600, "division")
+    # 0000 mezcla las secciones A y G: la búsqueda se detiene en la división
+    assert several.resolve_one("G4511", 2023) is None
+    assert several.resolve_one("A0111", 2023) is None
+
+
+def test_from_frames_only_counts_rows_with_values():
+    frames = {
+        "2023": pd.DataFrame({"CNAE": [0, 100, 110], "R01_Q1": [1.0, 2.0, np.nan]}),
+        "Notas": pd.DataFrame({"texto": ["no es un año"]}),
+    }
+    hierarchy = CnaeHierarchy.from_frames(frames, ["A", "A01", "A011"])
+
+    assert hierarchy.sections == {1: "A"}
+    assert hierarchy.resolve_one("A011", 2023) == (100, "division")
+    assert hierarchy.resolve_one("B0510", 2023) == (0, "section")
+    assert cnae_key("A011") == cnae_key("110") == cnae_key(110.0) == 110
+    assert cnae_key("A") == 0 and cnae_key("A12345") == -1
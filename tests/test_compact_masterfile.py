@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from compact_masterfile import SheetLayout, YearBlock
+
+
+def test_values_round_trip_with_full_precision():
+    df = pd.DataFrame({"CNAE": [110, 4631], "R01_Q1": [0.123456789012, 12345678.9], "R01_Q2": [np.nan, -1.5]})
+    out = YearBlock.from_frame(df, SheetLayout(), "2023").to_frame()
+    pd.testing.assert_frame_equal(out, df, check_dtype=False)
+
+
+@pytest.mark.parametrize("cnae", [40000, -5, 110.5, "A011"])
+def test_invalid_cnae_is_an_error(cnae):
+    df = pd.DataFrame({"CNAE": [110, cnae], "R01_Q1": [1.0, 2.0]})
+    with pytest.raises(ValueError, match="Hoja '2023': CNAE no válido"):
+        YearBlock.from_frame(df, SheetLayout(), "2023")
+
+
+def test_text_in_a_value_column_is_an_error():
+    df = pd.DataFrame({"CNAE": [110, 120], "R01_Q1": [1.0, "n.d."]})
+    layout = SheetLayout()
+    with pytest.raises(ValueError, match="'n.d.' en la columna R01_Q1"):
+        YearBlock.from_frame(df, layout, "2023")
+    assert layout.columns == []
+
+
+def test_new_rows_reject_codes_outside_int16():
+    block = YearBlock.from_frame(pd.DataFrame({"CNAE": [110], "R01_Q1": [1.0]}), SheetLayout())
+    with pytest.raises(ValueError):
+        block.rows_for([70000])
+    assert block.rows_for([110, 120])[1] == [120]
@@ -0,0 +1,24 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from scripts_bde import SCRIPT_CARGA, cargar_script
+
+FIXTURE = Path(__file__).parent / "fixtures" / "ratios_bde.xls"
+
+
+def test_xlrd_and_pandas_readers_return_the_same_ratios(tmp_path):
+    carga = cargar_script(SCRIPT_CARGA)
+    loader = carga.MasterfileLoader(downloads_dir=str(tmp_path), masterfile_path=str(tmp_path / "m.xlsx"))
+
+    rapido = loader._read_ratios_xlrd(FIXTURE)
+    respaldo = loader._ratios_from_frame(pd.read_excel(FIXTURE, header=None), FIXTURE.name)
+
+    assert rapido is not None
+    assert rapido.codes.tolist() == respaldo.codes.tolist()
+    np.testing.assert_array_equal(rapido.values, respaldo.values)
+    # Las filas que no son ratios se saltan sin cortar el bloque
+    assert {"R11", "T1", "R99"} <= set(rapido.codes.tolist())
+    assert rapido.to_dict()["R03"] == {"Q1": None, "Q2": 2.5, "Q3": None}
+    assert rapido.to_dict()["R04"] == {"Q1": None, "Q2": None, "Q3": 7.0}
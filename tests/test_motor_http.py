@@ -0,0 +1,37 @@
+from http.cookiejar import DefaultCookiePolicy
+
+import pytest
+
+from scripts_bde import SCRIPT_DESCARGA, cargar_script
+from servidor_simulado_bde import arrancar_en_segundo_plano
+
+
+@pytest.fixture
+def servidor():
+    servidor = arrancar_en_segundo_plano()
+    yield servidor
+    servidor.shutdown()
+    servidor.server_close()
+
+
+def test_iniciar_registers_the_session_before_downloading(servidor, tmp_path):
+    descarga = cargar_script(SCRIPT_DESCARGA)
+    motor = descarga.MotorHTTP(servidor.url).iniciar()
+
+    assert servidor.peticiones["registro"] == 1
+    assert motor.sesion.cookies.get("JSESSIONID") in servidor.registradas
+    # La consulta ya no necesita llevar los campos de registro
+    for campo in descarga.CAMPOS_REGISTRO:
+        motor.campos.pop(campo, None)
+    nombre = motor.descargar("A011", "A011 - Cultivos no perennes", str(tmp_path))
+    assert (tmp_path / nombre).exists()
+    assert servidor.peticiones["rechazadas"] == 0
+
+
+def test_iniciar_fails_without_a_session_cookie(servidor):
+    descarga = cargar_script(SCRIPT_DESCARGA)
+    motor = descarga.MotorHTTP(servidor.url)
+    motor.sesion.cookies.set_policy(DefaultCookiePolicy(blocked_domains=["127.0.0.1"]))
+
+    with pytest.raises(descarga.RespuestaInesperadaError, match="cookie"):
+        motor.iniciar()
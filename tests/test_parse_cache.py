@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+
+from scripts_bde import SCRIPT_CARGA, cargar_script
+
+carga = cargar_script(SCRIPT_CARGA)
+
+
+def _ratios(value):
+    return carga.RatiosArray.from_dict({"R01": {"Q1": value, "Q2": value + 1, "Q3": None}})
+
+
+def _archivo(tmp_path, nombre, contenido, mtime=1_000_000):
+    ruta = tmp_path / nombre
+    ruta.write_bytes(contenido)
+    os.utime(ruta, (mtime, mtime))
+    return ruta
+
+
+def test_hit_survives_save_and_reload(tmp_path):
+    ruta = _archivo(tmp_path, "2023_0110.xls", b"contenido")
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"))
+    assert cache.get(ruta) is None
+    cache.put(ruta, _ratios(1.5))
+    cache.save()
+
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"))
+    ratios = cache.get(ruta)
+    assert ratios.codes.tolist() == ["R01"]
+    np.testing.assert_array_equal(ratios.values, [[1.5, 2.5, np.nan]])
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_miss_for_unknown_file(tmp_path):
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"))
+    assert cache.get(_archivo(tmp_path, "2023_0110.xls", b"contenido")) is None
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_size_change_invalidates_the_entry(tmp_path):
+    ruta = _archivo(tmp_path, "2023_0110.xls", b"contenido")
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"))
+    cache.put(ruta, _ratios(1.0))
+    _archivo(tmp_path, "2023_0110.xls", b"contenido nuevo")
+    assert cache.get(ruta) is None
+
+
+def test_mtime_change_checks_the_hash(tmp_path):
+    ruta = _archivo(tmp_path, "2023_0110.xls", b"contenido")
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"))
+    cache.put(ruta, _ratios(1.0))
+
+    # Mismo contenido copiado de nuevo: se reutiliza y se actualiza la fecha
+    _archivo(tmp_path, "2023_0110.xls", b"contenido", mtime=2_000_000)
+    assert cache.get(ruta) is not None
+    assert cache.get(ruta) is not None
+    assert cache.hits == 2
+
+    # Mismo tamaño y fecha distinta, pero otro contenido: el hash no coincide
+    _archivo(tmp_path, "2023_0110.xls", b"CONTENIDO", mtime=3_000_000)
+    assert cache.get(ruta) is None
+
+
+def test_save_keeps_the_most_recently_used_entries(tmp_path):
+    rutas = [_archivo(tmp_path, f"2023_{i:04d}.xls", b"x" * (i + 1)) for i in range(4)]
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"), max_entries=2)
+    for i, ruta in enumerate(rutas):
+        cache.put(ruta, _ratios(float(i)))
+    # El primero se usa después de guardar los demás: pasa a ser de los recientes
+    cache.get(rutas[0])
+    cache.save()
+
+    cache = carga.ParseCache(str(tmp_path / "cache.npz"))
+    assert len(cache.entries) == 2
+    assert cache.get(rutas[0]) is not None
+    assert cache.get(rutas[3]) is not None
+    assert cache.get(rutas[1]) is None and cache.get(rutas[2]) is None
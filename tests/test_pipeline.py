@@ -0,0 +1,80 @@
+import shutil
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import openpyxl
+import pandas as pd
+
+from ratio_store import RatioStore, masterfile_columns
+from scripts_bde import SCRIPT_DESCARGA, cargar_script
+
+FIXTURE = Path(__file__).parent / "fixtures" / "ratios_bde.xls"
+
+pipeline = cargar_script("5_Pipeline_descarga_y_carga.py")
+
+
+def _sin_descargas(monkeypatch):
+    """El descargador no baja nada: el pipeline solo procesa lo que ya hay en downloads/."""
+    descargador = SimpleNamespace(ejecutar_descarga=lambda args, al_completar=None: [])
+    real = pipeline.cargar_script
+    monkeypatch.setattr(pipeline, "cargar_script",
+                        lambda nombre: descargador if nombre == SCRIPT_DESCARGA else real(nombre))
+
+
+def _preparar(tmp_path, nombres=("2023_0110.xls",)):
+    downloads = tmp_path / "downloads"
+    downloads.mkdir()
+    for nombre in nombres:
+        shutil.copy(FIXTURE, downloads / nombre)
+    masterfile = tmp_path / "m.xlsx"
+    df = pd.DataFrame(np.nan, index=[0], columns=masterfile_columns())
+    df["CNAE"] = [110]
+    df.to_excel(masterfile, sheet_name="2023", index=False)
+    wb = openpyxl.load_workbook(masterfile)
+    wb.create_sheet("Notas")["A1"] = "se conserva"
+    wb.save(masterfile)
+    return downloads, masterfile
+
+
+def test_pipeline_uses_the_parse_cache_and_write_mode(tmp_path, monkeypatch):
+    _sin_descargas(monkeypatch)
+    downloads, masterfile = _preparar(tmp_path)
+
+    ejecucion = pipeline.PipelineRatios(str(downloads), str(masterfile), validar=False,
+                                        write_mode="incremental")
+    assert ejecucion.ejecutar(SimpleNamespace(sin_almacen=True))
+
+    wb = openpyxl.load_workbook(masterfile)
+    assert wb.sheetnames == ["2023", "Notas"] and wb["Notas"]["A1"].value == "se conserva"
+    assert pd.read_excel(masterfile, sheet_name="2023")["R04_Q3"].tolist() == [7.0]
+
+    # Segunda ejecución: el archivo sale de la caché de parseo
+    ejecucion = pipeline.PipelineRatios(str(downloads), str(masterfile), validar=False,
+                                        write_mode="incremental")
+    monkeypatch.setattr(ejecucion.loader, "timed_extract", None)
+    ejecucion.ejecutar(SimpleNamespace(sin_almacen=True))
+    assert ejecucion.loader.cache.hits == 1
+
+
+def test_pipeline_loads_into_the_store(tmp_path, monkeypatch):
+    _sin_descargas(monkeypatch)
+    downloads, masterfile = _preparar(tmp_path)
+    antes = masterfile.read_bytes()
+
+    with RatioStore(str(tmp_path / "r.sqlite")) as store:
+        ejecucion = pipeline.PipelineRatios(str(downloads), str(masterfile), validar=False, store=store)
+        assert ejecucion.ejecutar(SimpleNamespace(sin_almacen=True))
+        assert store.get_sector(2023, 110)["R04"] == {"Q1": None, "Q2": None, "Q3": 7.0}
+    assert masterfile.read_bytes() == antes
+
+
+def test_pipeline_rejects_suffixed_files_with_the_store_before_downloading(tmp_path, monkeypatch):
+    downloads, masterfile = _preparar(tmp_path, ("2023_0110.xls", "2023_0110_d2_Portugal.xls"))
+
+    with RatioStore(str(tmp_path / "r.sqlite")) as store:
+        ejecucion = pipeline.PipelineRatios(str(downloads), str(masterfile), validar=False, store=store)
+        # No llega a cargar el descargador
+        monkeypatch.setattr(pipeline, "cargar_script", None)
+        assert not ejecucion.ejecutar(SimpleNamespace(sin_almacen=True))
+        assert store.years() == []
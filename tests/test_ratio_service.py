@@ -0,0 +1,25 @@
+import pandas as pd
+
+from ratio_service import RatioIndex, RatioService
+
+
+def _service():
+    frames = {"2023": pd.DataFrame({"CNAE": [110, 1100],
+                                    "R01_Q1": [1.0, 10.0], "R01_Q2": [2.0, 20.0], "R01_Q3": [3.0, 30.0]})}
+    return RatioService(lambda: RatioIndex.from_frames(frames), lambda: None)
+
+
+def test_digit_only_cnae_is_the_masterfile_key():
+    service = _service()
+    expected = {"R01": {"Q1": 1.0, "Q2": 2.0, "Q3": 3.0}}
+    assert service.sector(2023, "110") == expected
+    assert service.sector(2023, "0110") == expected
+    assert service.sector(2023, 110) == expected
+    assert service.sector(2023, "A011") == expected
+    assert service.series("110") == {2023: expected}
+
+
+def test_batch_uses_the_same_key_for_text_cnae():
+    results = _service().batch([{"year": 2023, "cnae": "110"}, {"cnae": "1100"}])
+    assert results[0]["ratios"]["R01"]["Q1"] == 1.0
+    assert results[1]["series"][2023]["R01"]["Q1"] == 10.0
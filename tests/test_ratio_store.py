@@ -0,0 +1,60 @@
+import numpy as np
+import pandas as pd
+
+from ratio_store import RatioStore, masterfile_columns
+from scripts_bde import SCRIPT_CARGA, cargar_script
+
+
+def test_upsert_parsed_accepts_dicts_and_arrays(tmp_path):
+    carga = cargar_script(SCRIPT_CARGA)
+    array = carga.RatiosArray(codes=np.array(["R02", "R01"]), values=np.array([[1.0, np.nan, 3.0],
+                                                                               [4.0, 5.0, 6.0]]))
+    with RatioStore(str(tmp_path / "r.sqlite")) as store:
+        cells = store.upsert_parsed([
+            ("2023", "0110", {"R01": {"Q1": 0.5, "Q2": None, "Q3": 2.0}}),
+            ("2023", "0200", array),
+        ])
+
+        assert cells == 7
+        assert store.get_sector(2023, 110) == {"R01": {"Q1": 0.5, "Q2": None, "Q3": 2.0}}
+        # Ordenado como en el masterfile, no como en el archivo
+        assert store.get_sector(2023, 200) == {"R01": {"Q1": 4.0, "Q2": 5.0, "Q3": 6.0},
+                                               "R02": {"Q1": 1.0, "Q2": None, "Q3": 3.0}}
+        assert store.get_sector(2023, 999) == {}
+
+
+def test_upsert_parsed_overwrites_and_keeps_other_values(tmp_path):
+    with RatioStore(str(tmp_path / "r.sqlite")) as store:
+        store.upsert_parsed([("2023", "0110", {"R01": {"Q1": 1.0, "Q2": 2.0, "Q3": 3.0}})])
+        store.upsert_parsed([("2023", "0110", {"R01": {"Q1": 9.0, "Q2": None, "Q3": None}})])
+
+        assert store.get_sector(2023, 110) == {"R01": {"Q1": 9.0, "Q2": 2.0, "Q3": 3.0}}
+        assert store.conn.execute("SELECT files, cells FROM loads ORDER BY id").fetchall() == [(1, 3), (1, 1)]
+
+
+def test_import_masterfile_and_export_xlsx_round_trip(tmp_path):
+    masterfile = tmp_path / "m.xlsx"
+    sheets = {}
+    for year, cnaes in (("2022", [110, 200]), ("2023", [110, 200, 300])):
+        df = pd.DataFrame(np.nan, index=range(len(cnaes)), columns=masterfile_columns())
+        df["CNAE"] = cnaes
+        df["R01_Q1"] = [0.1 * c for c in cnaes]
+        df["T1_Q3"] = [1e-9 + c for c in cnaes]
+        # El CNAE 0300 no tiene valores: debe seguir en la hoja exportada
+        df.loc[df["CNAE"] == 300, ["R01_Q1", "T1_Q3"]] = np.nan
+        sheets[year] = df
+    with pd.ExcelWriter(masterfile) as writer:
+        for year, df in sheets.items():
+            df.to_excel(writer, sheet_name=year, index=False)
+        pd.DataFrame({"nota": ["otra hoja"]}).to_excel(writer, sheet_name="Notas", index=False)
+
+    with RatioStore(str(tmp_path / "r.sqlite")) as store:
+        assert store.import_masterfile(str(masterfile)) == 8
+        assert store.years() == [2022, 2023]
+        exported = tmp_path / "export.xlsx"
+        store.export_xlsx(str(exported))
+
+    with pd.ExcelFile(exported) as xl_file:
+        assert xl_file.sheet_names == ["2022", "2023"]
+        for year, df in sheets.items():
+            pd.testing.assert_frame_equal(xl_file.parse(year), df, check_dtype=False)
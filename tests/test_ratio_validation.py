@@ -0,0 +1,49 @@
+from collections import namedtuple
+
+import numpy as np
+
+from ratio_validation import RATIO_CODES, RatioValidator, YearReference
+
+Ratios = namedtuple("Ratios", "codes values")
+
+
+def _years(n=40, seed=0):
+    rng = np.random.default_rng(seed)
+    level = rng.uniform(1, 50, size=(1, len(RATIO_CODES), 1))
+    previous = np.sort(level * rng.lognormal(0, 0.5, size=(n, len(RATIO_CODES), 3)), axis=2)
+    current = np.sort(previous * rng.normal(1, 0.03, size=previous.shape), axis=2)
+    return np.arange(100, 100 + n), previous, current
+
+
+def _validate(cnaes, previous, current):
+    ratios = [Ratios(RATIO_CODES, values) for values in current]
+    return RatioValidator().validate([str(c) for c in cnaes], [2023] * len(cnaes), cnaes, ratios,
+                                     {2022: YearReference(cnaes, previous)})
+
+
+def test_clean_batch_is_not_quarantined():
+    cnaes, previous, current = _years()
+    assert _validate(cnaes, previous, current).quarantined == []
+
+
+def test_layout_shift_in_every_file_is_quarantined():
+    cnaes, previous, current = _years()
+    report = _validate(cnaes, previous, np.roll(current, 1, axis=1))
+    assert len(report.quarantined) == len(cnaes)
+    assert all(f['reasons'] == ['yoy'] for f in report.files)
+
+
+def test_out_of_range_cnae_is_rejected_without_matching_other_sectors():
+    cnaes, previous, current = _years()
+    cnaes = cnaes.copy()
+    cnaes[0] = -5
+    cnaes[1] = 12000
+    # Con np.clip caerían sobre 0000 y 9999; ahora no se comparan con nadie
+    reference = YearReference(np.concatenate([cnaes, [0, 9999]]),
+                              np.concatenate([previous, previous[:2] * 10]))
+    ratios = [Ratios(RATIO_CODES, values) for values in current]
+    report = RatioValidator().validate([str(c) for c in cnaes], [2023] * len(cnaes), cnaes, ratios,
+                                       {2022: reference})
+    assert report.quarantined == ["-5", "12000"]
+    assert [f['reasons'] for f in report.files[:2]] == [['cnae'], ['cnae']]
+    assert [f['yoy_compared'] for f in report.files[:2]] == [0, 0]
@@ -0,0 +1,36 @@
+import numpy as np
+import pandas as pd
+
+from sector_scoring import SectorQuartiles
+
+
+def _quartiles():
+    values = np.full((1, 2, 2, 3), np.nan)
+    values[0, 0, 0] = [1.0, 2.0, 4.0]
+    values[0, 1, 0] = [1.0, np.nan, 4.0]   # cuartiles incompletos
+    return SectorQuartiles([2023], [110, 200], ["R01", "R02"], values)
+
+
+def test_band_edges_belong_to_the_upper_band():
+    values = [0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0]
+    scores = _quartiles().score([110] * len(values), [2023] * len(values), ["R01"] * len(values), values)
+    assert scores.band.tolist() == [0, 1, 1, 2, 2, 3, 3]
+
+
+def test_position_interpolates_between_quartiles():
+    values = [-10.0, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 5.0, 100.0]
+    scores = _quartiles().score([110] * len(values), [2023] * len(values), ["R01"] * len(values), values)
+    # Fuera de Q1-Q3 se extrapola con el rango intercuartílico contiguo y se recorta a [0, 1]
+    np.testing.assert_allclose(scores.position, [0.0, 0.125, 0.25, 0.375, 0.5, 0.625, 0.75, 0.875, 1.0])
+
+
+def test_incomplete_rows_get_no_band():
+    frame = pd.DataFrame({
+        'cnae': [None, "abc", 1.5, 999, 110, 110, 110, 200, 110],
+        'year': [2023, 2023, 2023, 2023, None, 2022, 2023, 2023, 2023],
+        'ratio': ["R01", "R01", "R01", "R01", "R01", "R01", "R02", "R01", "R01"],
+        'value': [1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0, np.nan],
+    })
+    scored = _quartiles().score_frame(frame)
+    assert scored['band'].tolist() == [-1] * len(frame)
+    assert scored['position'].isna().all()
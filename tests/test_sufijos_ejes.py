@@ -0,0 +1,20 @@
+from sufijos_ejes import etiquetar_archivo, hoja_anterior, separar_sufijo, sufijo_ejes
+
+
+def test_default_axes_keep_the_original_names():
+    assert sufijo_ejes() == ""
+    assert etiquetar_archivo("2023_A011_b_20251119.xls", "1", "España") == "2023_A011_b_20251119.xls"
+
+
+def test_suffix_round_trip():
+    nombre = etiquetar_archivo("2023_A011_b_20251119.xls", 2, "Unión Europea")
+    assert nombre == "2023_A011_b_20251119_d2_UnionEuropea.xls"
+    assert separar_sufijo(nombre) == ("2023_A011_b_20251119.xls", "_d2_UnionEuropea")
+    assert separar_sufijo("2023_0110.xls") == ("2023_0110.xls", "")
+    assert separar_sufijo("2023_0110_d0_Portugal") == ("2023_0110", "_d0_Portugal")
+
+
+def test_previous_sheet_keeps_the_suffix():
+    assert hoja_anterior("2023_d2_Portugal") == "2022_d2_Portugal"
+    assert hoja_anterior("2023") == "2022"
+    assert hoja_anterior("Notas") is None